@@ -0,0 +1,91 @@
+# Compares ways of turning depth-diff frames into order book updates, over recorded messages:
+#   json + update      stdlib json.loads, then OrderBook.update parses the level strings
+#   <backend> + update the fastest installed JSON parser, then the same string parsing
+#   decoder + update   DepthDecoder (fastest parser, levels converted once), then OrderBook.update
+# and the decode step on its own. Float and tick mode are both measured.
+# Pass recordings to use real data; by default a seeded synthetic stream is recorded first. Deep
+# books (e.g. @depth@0ms or many levels per message) can be simulated with --levels.
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from utils.order_book_cache import OrderBook
+from data_stream.decoder import DepthDecoder, JSON_BACKEND, loads
+from data_stream.recorder import DepthRecorder, iter_records
+from data_stream.synthetic_stream import SyntheticDepthStream
+
+TICK_SIZE = 0.01
+LOT_SIZE = 0.00001
+REPEATS = 3
+
+
+def record_synthetic(directory, count, levels):
+    stream = SyntheticDepthStream(seed=42, levels_per_message=levels, book_depth=max(500, levels * 5))
+    with DepthRecorder(directory) as recorder:
+        for message in stream.messages(count):
+            recorder.record(message)
+    return sorted(glob.glob(os.path.join(directory, "*.lobrec")))
+
+
+def best_time(run, frames):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run(frames)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark depth-message decoding.")
+    parser.add_argument("recordings", nargs="*", help="Recording files to read messages from.")
+    parser.add_argument("--messages", type=int, default=20_000, help="Synthetic messages to record.")
+    parser.add_argument("--levels", type=int, default=20, help="Levels per synthetic message.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.recordings or record_synthetic(directory, args.messages, args.levels)
+        # Re-encode exactly as the exchange sends frames: compact JSON text.
+        frames = [json.dumps(message, separators=(",", ":")) for path in paths for _, message in iter_records(path)]
+    levels = sum(frame.count("],[") + 2 for frame in frames) / len(frames)
+    print(f"{len(frames)} messages, ~{levels:.0f} levels each, best of {REPEATS} runs, "
+          f"fastest JSON backend: {JSON_BACKEND}")
+
+    for mode, tick_size, lot_size in [("float", None, None), ("tick", TICK_SIZE, LOT_SIZE)]:
+        decoder = DepthDecoder(tick_size, lot_size)
+
+        def apply_all(parse):
+            def run(frames):
+                order_book = OrderBook(depth=20, tick_size=tick_size, lot_size=lot_size)
+                for frame in frames:
+                    order_book.update(parse(frame))
+            return run
+
+        def parse_only(parse):
+            def run(frames):
+                for frame in frames:
+                    parse(frame)
+            return run
+
+        paths = {
+            "json + update": apply_all(json.loads),
+            f"{JSON_BACKEND} + update": apply_all(loads),
+            "decoder + update": apply_all(decoder.decode),
+            "json.loads only": parse_only(json.loads),
+            "decoder only": parse_only(decoder.decode),
+        }
+        print(f"\n{mode} mode")
+        for name, run in paths.items():
+            elapsed = best_time(run, frames)
+            print(f"{name:>20}: {elapsed / len(frames) * 1e6:7.2f} us/msg  {len(frames) / elapsed:>10,.0f} msgs/s")
+
+
+if __name__ == "__main__":
+    main()
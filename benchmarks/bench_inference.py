@@ -0,0 +1,85 @@
+# Measures the latency of a single live prediction: the original path (a new array per row, then
+# predict and predict_proba through the sklearn wrapper) against model/inference.py's Predictor,
+# with XGBoost's in-place predict and with the compiled NumPy trees.
+# The models are trained here on features from a seeded synthetic stream, so the numbers are
+# comparable across runs and machines. Each path scores the same rows one at a time.
+
+import os
+import sys
+import time
+
+import numpy as np
+from xgboost import XGBClassifier
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from data_stream.synthetic_stream import SyntheticDepthStream
+from microstructure.batch_features import capture_snapshots, compute_batch_features
+from model.inference import Predictor
+
+MESSAGE_COUNT = 20_000
+PREDICTIONS = 5_000
+WARMUP = 200
+# The default model train_model.py produces, and a small one that suits the compiled trees.
+MODELS = {
+    "default (100 rounds x 3 classes)": {},
+    "small (20 rounds, depth 3)": {"n_estimators": 20, "max_depth": 3},
+}
+
+
+def build_rows():
+    snapshots = capture_snapshots(SyntheticDepthStream(seed=42).messages(MESSAGE_COUNT), depth=1)
+    columns = compute_batch_features(**snapshots, window=30)
+    feature_order = [c for c in columns if not c.startswith("label")]
+    rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    return rows, feature_order, np.column_stack([columns[c] for c in feature_order]), columns["label"]
+
+
+def time_calls(predict, rows):
+    for row in rows[:WARMUP]:
+        predict(row)
+    latencies = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        predict(row)
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1e6
+
+
+def main():
+    rows, feature_order, features, labels = build_rows()
+    sample = rows[:PREDICTIONS]
+    print(f"{len(sample)} single-row predictions per path, {len(feature_order)} features, latency in us")
+
+    for model_name, params in MODELS.items():
+        model = XGBClassifier(objective="multi:softprob", random_state=42, **params)
+        model.fit(features, labels)
+        booster = model.get_booster()
+
+        # The path predict_live.py and the dashboard used before the Predictor.
+        def original(row):
+            x = np.array([[row[feature] for feature in feature_order]])
+            prediction = model.predict(x)[0]
+            proba = model.predict_proba(x)[0]
+            return prediction, proba[prediction]
+
+        paths = {
+            "original": original,
+            "inplace": Predictor(booster, feature_order).predict,
+            "compiled": Predictor(booster, feature_order, compiled=True).predict,
+        }
+        print(f"\n{model_name}")
+        for path_name, predict in paths.items():
+            latencies = time_calls(predict, sample)
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{path_name:>10}: p50 {p50:8.1f}  p99 {p99:8.1f}  mean {latencies.mean():8.1f}")
+
+        # All three paths must agree on the predicted class.
+        original_classes = np.array([original(row)[0] for row in sample])
+        for path_name in ("inplace", "compiled"):
+            classes = np.array([paths[path_name](row)[0] for row in sample])
+            print(f"{path_name:>10}: {np.count_nonzero(classes != original_classes)} class mismatches vs original")
+
+
+if __name__ == "__main__":
+    main()
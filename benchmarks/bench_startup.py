@@ -0,0 +1,88 @@
+# Measures cold-start time and memory of the live scripts' model loading: the original path
+# (joblib-load a pickled classifier, then read the whole training CSV with pandas to find the
+# feature order) against loading the self-describing model artifact.
+# Each load runs in a fresh interpreter so import costs are included. The training CSV is sized
+# like a long collection run, since the original path's startup grows with it.
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+from xgboost import XGBClassifier
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from model.artifact import ModelArtifact, save_artifact, LABEL_NAMES
+
+CSV_ROWS = 1_000_000
+REPEATS = 5
+FEATURES = ["mid_price", "weighted_mid_price", "spread", "ofi", "voi"]
+
+# Each snippet loads everything a live script needs to start predicting, then reports its
+# wall time and the interpreter's peak memory (VmHWM, which unlike ru_maxrss is not inherited
+# from this process across fork and exec; Linux only).
+ORIGINAL = """
+import time
+start = time.perf_counter()
+import joblib, pandas as pd
+model = joblib.load({model!r})
+df = pd.read_csv({csv!r})
+feature_order = [c for c in df.columns if not c.startswith('label')]
+elapsed = time.perf_counter() - start
+peak_kb = next(line.split()[1] for line in open('/proc/self/status') if line.startswith('VmHWM'))
+print(elapsed, peak_kb)
+"""
+ARTIFACT = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from model.artifact import load_artifact
+artifact = load_artifact({model!r})
+feature_order = artifact.feature_order
+elapsed = time.perf_counter() - start
+peak_kb = next(line.split()[1] for line in open('/proc/self/status') if line.startswith('VmHWM'))
+print(elapsed, peak_kb)
+"""
+
+
+def run(snippet):
+    timings, peaks = [], []
+    for _ in range(REPEATS):
+        output = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, check=True)
+        elapsed, peak_kb = output.stdout.split()
+        timings.append(float(elapsed))
+        peaks.append(int(peak_kb))
+    return min(timings), max(peaks) / 1024
+
+
+def main():
+    rng = np.random.default_rng(42)
+    features = rng.normal(size=(CSV_ROWS, len(FEATURES)))
+    labels = rng.integers(0, 3, size=CSV_ROWS)
+    model = XGBClassifier(objective="multi:softprob", n_estimators=100, random_state=42)
+    model.fit(features[:50_000], labels[:50_000])
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "lob_features.csv")
+        pickle_path = os.path.join(directory, "xgboost_model.pkl")
+        artifact_path = os.path.join(directory, "xgboost_model.lobm")
+        df = pd.DataFrame(features, columns=FEATURES)
+        df["label"] = labels
+        df.to_csv(csv_path, index=False)
+        joblib.dump(model, pickle_path)
+        save_artifact(artifact_path, ModelArtifact(model.get_booster(), FEATURES, LABEL_NAMES, 20, 30))
+
+        original = run(ORIGINAL.format(model=pickle_path, csv=csv_path))
+        artifact = run(ARTIFACT.format(root=project_root, model=artifact_path))
+
+    print(f"Cold start, best of {REPEATS} fresh interpreters ({CSV_ROWS:,}-row training CSV)")
+    for name, (elapsed, peak_mb) in [("pickle + CSV", original), ("artifact", artifact)]:
+        print(f"{name:>13}: {elapsed:.3f}s  peak RSS {peak_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+# Runs the whole benchmark suite on one seeded synthetic depth stream and saves the results as
+# JSON, so a change to OrderBook, feature_engineering or the model path can be compared against
+# the numbers from another commit:
+#   micro        per-call cost of OrderBook.update, get_top_levels, every calculate_* function,
+#                FeatureExtractor.update and a single prediction (in-place and compiled trees)
+#   end to end   messages per second from combined-stream frame to scored feature row through
+#                the live path (ingest, decode, book update, features and the inference worker)
+# The stream's book depth, levels per message, update rate and volatility are set on the
+# command line; with the same settings and seed every run sees exactly the same messages.
+#
+#   python benchmarks/bench_suite.py --output before.json
+#   python benchmarks/bench_suite.py --compare before.json
+#
+# Functions that take well under a microsecond are timed over a whole loop of calls and reported
+# as the mean; the rest are timed call by call, which adds the ~0.1 us of a clock read to each
+# but gives their p50 and p99. Every measurement is the best of REPEATS passes, since other work
+# on the machine slows whole stretches of a run. --compare uses the p50 where there is one, as a
+# few slow calls (a GC pass, another process) move the mean far more than the code does. It is a
+# report to read, not a pass/fail check: on a shared or virtual machine two runs of the same code
+# can differ by 40%, so a flagged result is worth re-running before it is believed.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from xgboost import XGBClassifier
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from utils.order_book_cache import OrderBook
+from microstructure import feature_engineering
+from microstructure.data_labeller import FeatureExtractor
+from microstructure.batch_features import capture_snapshots, compute_batch_features
+from microstructure.feature_sinks import NullSink
+from data_stream.decoder import DepthDecoder
+from data_stream.multi_symbol import MultiSymbolRunner, SymbolConfig
+from data_stream.replay import ReplayFinished
+from data_stream.synthetic_stream import SyntheticDepthStream, SyntheticCombinedStream
+from model.inference import Predictor
+from model.inference_worker import InferenceWorker
+
+REPEATS = 5
+# The whole-book OFI and VOI copy both sides of the book per sample, so they get fewer samples.
+BOOK_COPY_SAMPLES = 1000
+PREDICTIONS = 2000
+# A result this much slower than the baseline is flagged in the --compare report. Smaller changes
+# are within the noise of most machines; raise --threshold on noisier ones, or lower it on a
+# quiet, dedicated one.
+REGRESSION_THRESHOLD = 0.25
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def synthetic_stream(args):
+    return SyntheticDepthStream(seed=args.seed, book_depth=args.depth,
+                                levels_per_message=args.levels, volatility=args.volatility,
+                                interval_ms=max(1, round(1000 / args.rate)))
+
+
+def distribution(samples_ns):
+    samples = np.asarray(samples_ns) / 1e3
+    p50, p99 = np.percentile(samples, [50, 99])
+    return {"unit": "us", "mean": float(samples.mean()), "p50": float(p50), "p99": float(p99),
+            "calls": len(samples)}
+
+
+def best_pass(passes):
+    # The distribution of the pass with the lowest p50, from REPEATS lists of call timings.
+    return min((distribution(timings) for timings in passes), key=lambda result: result["p50"])
+
+
+def loop_mean(function, arguments):
+    # Best of REPEATS passes over the prepared arguments, as the mean cost of one call.
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter_ns()
+        for args in arguments:
+            function(*args)
+        timings.append(time.perf_counter_ns() - start)
+    return {"unit": "us", "mean": min(timings) / len(arguments) / 1e3, "calls": len(arguments)}
+
+
+def bench_book_and_features(messages):
+    # Runs the stream through a book and an extractor, timing every call to each, and keeps the
+    # states the calculate_* benchmarks need.
+    decoder = DepthDecoder()
+    decoded = [decoder.decode_message(dict(message)) for message in messages]
+    results = {}
+
+    # Strings are what OrderBook.update parses when no decoder is in front of it.
+    for name, stream in (("OrderBook.update", decoded), ("OrderBook.update (strings)", messages)):
+        passes = []
+        for _ in range(REPEATS):
+            order_book = OrderBook(depth=20, max_levels=1000)
+            timings = []
+            for data in stream:
+                start = time.perf_counter_ns()
+                order_book.update(data)
+                timings.append(time.perf_counter_ns() - start)
+            passes.append(timings)
+        results[name] = best_pass(passes)
+
+    order_book = OrderBook(depth=20, max_levels=1000)
+    extractor = FeatureExtractor(depth=20, window=30, sink=NullSink())
+    timings, top_levels, changes_seen, book_copies = [], [], [], []
+    copy_every = max(1, len(decoded) // BOOK_COPY_SAMPLES)
+    for i, data in enumerate(decoded):
+        changes = order_book.update(data)
+        start = time.perf_counter_ns()
+        extractor.update(order_book.bids, order_book.asks, changes)
+        timings.append(time.perf_counter_ns() - start)
+        top_levels.append(order_book.get_top_levels())
+        changes_seen.append(changes)
+        if i % copy_every == 0:
+            book_copies.append((dict(order_book.bids.items()), dict(order_book.asks.items())))
+    # The remaining passes replay the stream through a fresh book and extractor, timing the extractor.
+    passes = [timings]
+    for _ in range(REPEATS - 1):
+        order_book = OrderBook(depth=20, max_levels=1000)
+        extractor = FeatureExtractor(depth=20, window=30, sink=NullSink())
+        timings = []
+        for data in decoded:
+            changes = order_book.update(data)
+            start = time.perf_counter_ns()
+            extractor.update(order_book.bids, order_book.asks, changes)
+            timings.append(time.perf_counter_ns() - start)
+        passes.append(timings)
+    results["FeatureExtractor.update"] = best_pass(passes)
+
+    results["OrderBook.get_top_levels"] = loop_mean(order_book.get_top_levels, [()] * len(decoded))
+    results["OrderBook.get_top_levels(1)"] = loop_mean(order_book.get_top_levels, [(1,)] * len(decoded))
+    for name in ("calculate_mid_price", "calculate_spread", "calculate_weighted_mid_price"):
+        results[name] = loop_mean(getattr(feature_engineering, name), top_levels)
+    best = [(bids[0], asks[0]) for bids, asks in top_levels if bids and asks]
+    results["calculate_ofi_from_best"] = loop_mean(
+        feature_engineering.calculate_ofi_from_best,
+        [(*current, *previous) for previous, current in zip(best, best[1:])])
+    results["calculate_volume_changes"] = loop_mean(
+        feature_engineering.calculate_volume_changes, [(changes,) for changes in changes_seen])
+    pairs = [(*current, *previous) for previous, current in zip(book_copies, book_copies[1:])]
+    results["calculate_ofi"] = loop_mean(feature_engineering.calculate_ofi, pairs)
+    results["calculate_voi"] = loop_mean(feature_engineering.calculate_voi, pairs)
+    return results
+
+
+def bench_inference(messages):
+    # The model is trained here on features of the same stream, as train_model.py would, so the
+    # numbers do not depend on whatever model file happens to be on disk.
+    snapshots = capture_snapshots(messages, depth=1)
+    columns = compute_batch_features(**snapshots, window=30)
+    feature_order = [c for c in columns if not c.startswith("label")]
+    model = XGBClassifier(objective="multi:softprob", random_state=42)
+    model.fit(np.column_stack([columns[c] for c in feature_order]), columns["label"])
+    booster = model.get_booster()
+    rows = [dict(zip(columns, values)) for values in zip(*columns.values())][:PREDICTIONS]
+
+    results = {}
+    for name, compiled in (("Predictor.predict", False), ("Predictor.predict (compiled)", True)):
+        predict = Predictor(booster, feature_order, compiled=compiled).predict
+        for row in rows[:100]:
+            predict(row)
+        passes = []
+        for _ in range(REPEATS):
+            timings = []
+            for row in rows:
+                start = time.perf_counter_ns()
+                predict(row)
+                timings.append(time.perf_counter_ns() - start)
+            passes.append(timings)
+        results[name] = best_pass(passes)
+    return results, booster, feature_order
+
+
+# Serves prepared frames through the async recv() interface a connection has.
+class FrameSource:
+    def __init__(self, frames):
+        self._frames = iter(frames)
+
+    async def recv(self):
+        try:
+            return next(self._frames)
+        except StopIteration:
+            raise ReplayFinished from None
+
+
+def run_end_to_end(frames, symbols, predictor):
+    # Every message is processed on its own, as a live consumer that keeps up would, so the rate
+    # is per message rather than per conflated batch.
+    worker = InferenceWorker(predictor) if predictor else None
+    on_row = (lambda symbol, row: worker.submit(symbol, row)) if worker else None
+    runner = MultiSymbolRunner([SymbolConfig(symbol) for symbol in symbols], on_row=on_row, max_batch=1)
+    start = time.perf_counter()
+    try:
+        asyncio.run(runner.run(FrameSource(frames)))
+    except ReplayFinished:
+        pass
+    if worker:
+        worker.close()
+    elapsed = time.perf_counter() - start
+    return elapsed, worker.stats()["predicted"] if worker else 0
+
+
+def bench_end_to_end(args, booster, feature_order):
+    symbols = [f"SYM{i}USDT" for i in range(args.symbols)]
+    frames = SyntheticCombinedStream(symbols, args.messages // args.symbols, seed=args.seed,
+                                     book_depth=args.depth, levels_per_message=args.levels,
+                                     volatility=args.volatility, interval_ms=max(1, round(1000 / args.rate))).frames
+    results = {}
+    for name, predictor in (("end to end (no model)", None),
+                            ("end to end", Predictor(booster, feature_order))):
+        timings = [run_end_to_end(frames, symbols, predictor) for _ in range(REPEATS)]
+        elapsed, predicted = min(timings)
+        results[name] = {"unit": "msgs/s", "mean": len(frames) / elapsed, "messages": len(frames),
+                         "predictions": predicted}
+    return results
+
+
+def print_results(results):
+    print(f"\n{'benchmark':<32} {'mean':>12} {'p50':>10} {'p99':>10}")
+    for name, result in results.items():
+        unit = result["unit"]
+        if unit == "msgs/s":
+            print(f"{name:<32} {result['mean']:>9,.0f} {unit}")
+        else:
+            p50 = f"{result['p50']:>10.2f}" if "p50" in result else f"{'':>10}"
+            p99 = f"{result['p99']:>10.2f}" if "p99" in result else f"{'':>10}"
+            print(f"{name:<32} {result['mean']:>9.3f} {unit} {p50} {p99}")
+
+
+def compare(results, settings, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {baseline_path} (commit {baseline.get('commit')}); "
+          f"flagged results are more than {threshold:.0%} slower")
+    changed = [key for key in ("messages", "seed", "depth", "levels", "rate", "volatility", "symbols")
+               if baseline.get("settings", {}).get(key) != settings[key]]
+    if changed:
+        print(f"WARNING: the baseline was run with different settings ({', '.join(changed)}).")
+    flagged = 0
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None or before["unit"] != result["unit"]:
+            continue
+        # How many times slower this run is; rates are inverted so higher is always worse.
+        if result["unit"] == "msgs/s":
+            slowdown = before["mean"] / result["mean"]
+        else:
+            key = "p50" if "p50" in result and "p50" in before else "mean"
+            slowdown = result[key] / before[key]
+        flag = ""
+        if slowdown > 1 + threshold:
+            flag = "  SLOWER"
+            flagged += 1
+        print(f"{name:<32} {slowdown:>6.2f}x time{flag}")
+    print(f"{flagged} result(s) flagged.")
+    if flagged:
+        print("Timings are noisy; re-run the comparison to confirm a slowdown before acting on it.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and save the results as JSON.")
+    parser.add_argument("--messages", type=int, default=20_000, help="Messages in the synthetic stream.")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic stream.")
+    parser.add_argument("--depth", type=int, default=500, help="Ticks either side of the mid the book can reach.")
+    parser.add_argument("--levels", type=int, default=20, help="Level updates per side in each message.")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="Messages per second of the stream's event times (10 is @depth@100ms).")
+    parser.add_argument("--volatility", type=float, default=2.0, help="Mid-price moves per message, in ticks (std).")
+    parser.add_argument("--symbols", type=int, default=1, help="Symbols in the end-to-end stream.")
+    parser.add_argument("--output", metavar="PATH", help="Save the results to this JSON file.")
+    parser.add_argument("--compare", metavar="PATH", help="Compare with the results saved by an earlier run.")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Slowdown flagged in the --compare report, as a fraction "
+                             f"(default {REGRESSION_THRESHOLD:.2f}).")
+    args = parser.parse_args()
+
+    messages = synthetic_stream(args).messages(args.messages)
+    print(f"{args.messages} messages: book depth {args.depth} ticks, {args.levels} levels per side, "
+          f"{args.rate:g} msgs/s, volatility {args.volatility:g} ticks, seed {args.seed}")
+    results = bench_book_and_features(messages)
+    inference_results, booster, feature_order = bench_inference(messages)
+    results.update(inference_results)
+    results.update(bench_end_to_end(args, booster, feature_order))
+    print_results(results)
+
+    report = {
+        "commit": current_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+    if args.compare:
+        compare(results, report["settings"], args.compare, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Measures what each additional symbol costs the multi-symbol runner (data_stream/multi_symbol.py):
+#   memory   bytes allocated by the runner (books, extractors, decoder and routing state) after
+#            every symbol has processed the same number of messages, measured with tracemalloc
+#   CPU      process time per message for the whole path from combined-stream frame to feature
+#            row (ingest, decode, routing, book update, features), which should stay flat as
+#            symbols are added
+# Frames are built from seeded synthetic streams, one per symbol, interleaved the way a combined
+# stream delivers them.
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from data_stream.multi_symbol import MultiSymbolRunner, SymbolConfig
+from data_stream.replay import ReplayFinished
+from data_stream.synthetic_stream import SyntheticCombinedStream
+
+REPEATS = 3
+
+
+# Serves prepared frames through the async recv() interface a connection has.
+class FrameSource:
+    def __init__(self, frames):
+        self._frames = iter(frames)
+
+    async def recv(self):
+        try:
+            return next(self._frames)
+        except StopIteration:
+            raise ReplayFinished from None
+
+
+def combined_frames(symbol_count, messages_per_symbol):
+    symbols = [f"SYM{i}USDT" for i in range(symbol_count)]
+    return SyntheticCombinedStream(symbols, messages_per_symbol).frames
+
+
+def run_runner(symbol_count, frames):
+    configs = [SymbolConfig(f"SYM{i}USDT") for i in range(symbol_count)]
+    # Every message is processed on its own, so the numbers are per message, not per merged batch.
+    runner = MultiSymbolRunner(configs, max_batch=1)
+    try:
+        asyncio.run(runner.run(FrameSource(frames)))
+    except ReplayFinished:
+        pass
+    return runner
+
+
+def measure(symbol_count, messages_per_symbol):
+    frames = combined_frames(symbol_count, messages_per_symbol)
+    timings = []
+    for _ in range(REPEATS):
+        start = time.process_time()
+        runner = run_runner(symbol_count, frames)
+        timings.append(time.process_time() - start)
+    rows = sum(stats["rows"] for stats in runner.stats().values())
+
+    # Only what is allocated while the runner is built and run is traced; the frames already exist.
+    tracemalloc.start()
+    runner = run_runner(symbol_count, frames)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del runner
+    return min(timings) / len(frames), allocated, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-symbol memory and CPU of the multi-symbol runner.")
+    parser.add_argument("--symbols", type=int, nargs="+", default=[1, 10, 50, 100], help="Symbol counts to run.")
+    parser.add_argument("--messages", type=int, default=1000, help="Messages per symbol.")
+    args = parser.parse_args()
+
+    print(f"{args.messages} messages per symbol, best of {REPEATS} runs for CPU")
+    print(f"{'symbols':>8} {'us/msg':>8} {'msgs/s':>10} {'memory':>10} {'per symbol':>11}")
+    results = []
+    for symbol_count in args.symbols:
+        per_message, allocated, rows = measure(symbol_count, args.messages)
+        results.append((symbol_count, allocated))
+        print(f"{symbol_count:>8} {per_message * 1e6:>8.1f} {1 / per_message:>10,.0f} "
+              f"{allocated / 2**20:>8.2f}MB {allocated / symbol_count / 2**10:>9.0f}KB")
+
+    # The marginal cost: the slope between the smallest and largest run.
+    (first_count, first_bytes), (last_count, last_bytes) = results[0], results[-1]
+    if last_count > first_count:
+        marginal = (last_bytes - first_bytes) / (last_count - first_count)
+        print(f"Memory per additional symbol: {marginal / 2**10:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# Load and soak tests a live script against the stand-in exchange (data_stream/stand_in_server.py),
+# with no network. For each rate in --rates a fresh server and a fresh target are started, run for
+# --duration seconds and sampled every --sample-every seconds for:
+#   memory       the target's resident set size (read from /proc, so Linux only)
+#   throughput   frames received and book updates made, from the target's /metrics endpoint
+#   latency      p99 of the receive queue wait and of inference, and the event lag
+# A target keeps up with a rate while it makes a book update for (nearly) every frame it receives;
+# once it falls behind, the ingest merges queued frames and the queue wait grows. The highest rate
+# it keeps up with is its throughput ceiling. For memory growth, run one rate for hours:
+#
+#   python benchmarks/soak.py --target predict_live --rates 10 100 500 1000 2000 --duration 30
+#   python benchmarks/soak.py --target dashboard --rates 10 --duration 14400 --sample-every 60
+#   python benchmarks/soak.py --target multi_symbol --symbols 50 --rates 10 50 100
+#
+# Faults are passed on to the server (--gap-every, --disconnect-every, --replay), so reconnects and
+# resyncs can be soaked too. Results are saved as JSON with --output.
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A merged share of frames above this means the target is not keeping up.
+MAX_MERGED_SHARE = 0.05
+STARTUP_TIMEOUT = 60.0
+
+
+def target_command(target, uri, snapshot_url, metrics_port, symbols):
+    # Returns (argv, extra environment, metrics URL) for the target script.
+    python = sys.executable
+    if target == "predict_live":
+        return ([python, "model/predict_live.py", "--uri", uri, "--snapshot-url", snapshot_url,
+                 "--metrics-port", str(metrics_port)], {}, f"http://127.0.0.1:{metrics_port}/metrics")
+    if target == "dashboard":
+        environment = {"LOB_STREAM_URI": uri, "LOB_SNAPSHOT_URL": snapshot_url, "DASHBOARD_PORT": str(metrics_port)}
+        return [python, "visualiser/order_book_dash.py"], environment, f"http://127.0.0.1:{metrics_port}/metrics"
+    if target == "multi_symbol":
+        return ([python, "data_stream/multi_symbol.py", "--symbols", *symbols, "--uri", uri,
+                 "--snapshot-url", snapshot_url, "--metrics-port", str(metrics_port), "--report-every", "3600"],
+                {}, f"http://127.0.0.1:{metrics_port}/metrics")
+    raise ValueError(f"Unknown target {target!r}")
+
+
+def read_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def scrape(url):
+    # Parses the Prometheus text format into {"name{labels}": value}.
+    with urllib.request.urlopen(url, timeout=5) as response:
+        text = response.read().decode()
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            values[name] = float(value)
+    return values
+
+
+def sample(process, metrics_url, started):
+    metrics = scrape(metrics_url)
+    return {
+        "time": round(time.monotonic() - started, 1),
+        "rss_mb": read_rss_mb(process.pid),
+        "frames": int(metrics.get('lob_stage_latency_seconds_count{stage="receive"}', 0)),
+        "book_updates": int(metrics.get('lob_stage_latency_seconds_count{stage="book_update"}', 0)),
+        "receive_p99_ms": metrics.get('lob_stage_latency_quantile_seconds{stage="receive",quantile="0.99"}', 0) * 1e3,
+        "inference_p99_ms": metrics.get('lob_stage_latency_quantile_seconds{stage="inference",quantile="0.99"}', 0)
+                            * 1e3,
+        "event_lag_p99_ms": metrics.get('lob_event_lag_quantile_seconds{quantile="0.99"}', 0) * 1e3,
+    }
+
+
+def stop(process):
+    # Ctrl+C first, so the script shuts down as it would for a user.
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run_step(args, rate, symbols):
+    uri = f"ws://127.0.0.1:{args.port}"
+    snapshot_url = f"http://127.0.0.1:{args.port}/api/v3/depth"
+    server_command = [sys.executable, "data_stream/stand_in_server.py", "--port", str(args.port), "--rate", str(rate),
+                      "--symbols", *symbols]
+    if args.replay:
+        server_command += ["--replay", *args.replay]
+    if args.gap_every:
+        server_command += ["--gap-every", str(args.gap_every)]
+    if args.disconnect_every:
+        server_command += ["--disconnect-every", str(args.disconnect_every)]
+    command, environment, metrics_url = target_command(args.target, uri, snapshot_url, args.metrics_port, symbols)
+
+    server = subprocess.Popen(server_command, cwd=project_root, stdout=subprocess.DEVNULL)
+    target = None
+    try:
+        time.sleep(1.0)
+        target = subprocess.Popen(command, cwd=project_root, env={**os.environ, **environment},
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # Wait for the target to serve its metrics before the clock starts.
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            if target.poll() is not None:
+                raise RuntimeError(f"{args.target} exited with code {target.returncode} during startup")
+            try:
+                scrape(metrics_url)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+        started = time.monotonic()
+        samples = []
+        while time.monotonic() - started < args.duration:
+            time.sleep(min(args.sample_every, max(0.0, args.duration - (time.monotonic() - started))))
+            if target.poll() is not None:
+                raise RuntimeError(f"{args.target} exited with code {target.returncode}")
+            samples.append(sample(target, metrics_url, started))
+            latest = samples[-1]
+            sys.stdout.write(f"\r  {latest['time']:>7.0f}s  rss {latest['rss_mb'] or 0:7.1f} MB  "
+                             f"frames {latest['frames']:>10}  receive p99 {latest['receive_p99_ms']:8.2f} ms")
+            sys.stdout.flush()
+        print()
+    finally:
+        if target is not None:
+            stop(target)
+        server.terminate()
+        server.wait()
+    return summarise(rate * len(symbols), samples)
+
+
+def summarise(offered, samples):
+    first, last = samples[0], samples[-1]
+    elapsed = last["time"] - first["time"] or 1.0
+    frames = last["frames"] - first["frames"]
+    updates = last["book_updates"] - first["book_updates"]
+    merged_share = 1 - updates / frames if frames else 0.0
+    rss = [s["rss_mb"] for s in samples if s["rss_mb"] is not None]
+    return {
+        "offered_msgs_per_s": offered,
+        "received_msgs_per_s": frames / elapsed,
+        "book_updates_per_s": updates / elapsed,
+        "merged_share": merged_share,
+        "keeps_up": merged_share <= MAX_MERGED_SHARE,
+        "receive_p99_ms": last["receive_p99_ms"],
+        "inference_p99_ms": last["inference_p99_ms"],
+        "event_lag_p99_ms": last["event_lag_p99_ms"],
+        "rss_start_mb": rss[0] if rss else None,
+        "rss_end_mb": rss[-1] if rss else None,
+        "rss_growth_mb_per_hour": (rss[-1] - rss[0]) / elapsed * 3600 if len(rss) > 1 else None,
+        "samples": samples,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and soak test a live script against the stand-in exchange.")
+    parser.add_argument("--target", choices=("predict_live", "dashboard", "multi_symbol"), default="predict_live")
+    parser.add_argument("--rates", type=float, nargs="+", default=[10, 100, 500, 1000],
+                        help="Diffs per second per symbol to run, one step each.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per rate.")
+    parser.add_argument("--sample-every", type=float, default=2.0, help="Seconds between samples.")
+    parser.add_argument("--symbols", type=int, default=1,
+                        help="Symbols served (multi_symbol subscribes to all; the others read btcusdt).")
+    parser.add_argument("--replay", nargs="+", metavar="RECORDING", help="Serve recorded diffs instead of synthetic.")
+    parser.add_argument("--gap-every", type=int, default=None, metavar="N", help="Passed on to the server.")
+    parser.add_argument("--disconnect-every", type=float, default=None, metavar="SECONDS",
+                        help="Passed on to the server.")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the stand-in server.")
+    parser.add_argument("--metrics-port", type=int, default=9100, help="Port the target serves /metrics on.")
+    parser.add_argument("--output", metavar="PATH", help="Save the results to this JSON file.")
+    args = parser.parse_args()
+    symbols = ["btcusdt"] + [f"sym{i}usdt" for i in range(1, args.symbols)]
+
+    steps = []
+    for rate in args.rates:
+        print(f"{args.target}: {rate:g} msgs/s per symbol x {len(symbols)} symbol(s) for {args.duration:g}s")
+        steps.append({"rate": rate, **run_step(args, rate, symbols)})
+
+    print(f"\n{'rate':>8} {'offered':>9} {'received':>9} {'updates':>9} {'merged':>7} {'recv p99':>9} "
+          f"{'rss MB':>8} {'MB/h':>7}  keeps up")
+    for step in steps:
+        growth = step["rss_growth_mb_per_hour"]
+        print(f"{step['rate']:>8g} {step['offered_msgs_per_s']:>9,.0f} {step['received_msgs_per_s']:>9,.0f} "
+              f"{step['book_updates_per_s']:>9,.0f} {step['merged_share']:>7.1%} {step['receive_p99_ms']:>7.1f}ms "
+              f"{step['rss_end_mb'] or 0:>8.1f} {growth if growth is not None else 0:>7.1f}  "
+              f"{'yes' if step['keeps_up'] else 'no'}")
+    ceiling = [step["rate"] for step in steps if step["keeps_up"]]
+    if ceiling:
+        print(f"Highest rate kept up with: {max(ceiling):g} msgs/s per symbol")
+    if args.output:
+        settings = {key: value for key, value in vars(args).items() if key != "output"}
+        with open(args.output, "w") as f:
+            json.dump({"target": args.target, "settings": settings, "steps": steps}, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# This file keeps local order books in sync with the exchange.
+# Applying @depth diffs to an empty book leaves it wrong until every level has been touched, and
+# a single missed diff makes it diverge silently. Each symbol is therefore synchronised the way
+# Binance documents for local books:
+#   1. diffs are buffered while a full depth snapshot is fetched;
+#   2. buffered diffs with u <= the snapshot's lastUpdateId are already in the snapshot and are
+#      dropped; the first one applied must span it (U <= lastUpdateId + 1 <= u);
+#   3. from then on every diff must continue the sequence (U == previous u + 1). A gap marks the
+#      book as out of sync and only that symbol goes back to step 1, while other symbols carry on.
+# Snapshots come from a pluggable provider: the REST API, a local file or a stub.
+
+import asyncio
+import json
+import urllib.request
+from collections import deque
+
+from data_stream.decoder import loads
+
+
+# Fetches snapshots from Binance's REST depth endpoint (or anything serving the same format,
+# e.g. a local stand-in server). The blocking request runs in a thread off the event loop.
+class RestSnapshotProvider:
+    def __init__(self, url="https://api.binance.com/api/v3/depth", limit=1000, timeout=10.0):
+        self.url = url
+        self.limit = limit
+        self.timeout = timeout
+
+    def _get(self, symbol):
+        with urllib.request.urlopen(f"{self.url}?symbol={symbol.upper()}&limit={self.limit}",
+                                    timeout=self.timeout) as response:
+            return loads(response.read())
+
+    async def fetch(self, symbol):
+        return await asyncio.to_thread(self._get, symbol)
+
+
+# Reads snapshots saved in the REST format, e.g. path="snapshots/{symbol}.json".
+class FileSnapshotProvider:
+    def __init__(self, path):
+        self.path = path
+
+    async def fetch(self, symbol):
+        with open(self.path.format(symbol=symbol.upper())) as f:
+            return json.load(f)
+
+
+# Serves snapshots from memory: a {symbol: snapshot} dict or a function of the symbol.
+class StubSnapshotProvider:
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.requests = 0
+
+    async def fetch(self, symbol):
+        self.requests += 1
+        if callable(self.snapshots):
+            return self.snapshots(symbol)
+        return self.snapshots[symbol.upper()]
+
+
+class SymbolSync:
+    def __init__(self, symbol, order_book, provider, on_resync=None, retry_delay=1.0, max_buffer=100_000):
+        self.symbol = symbol.upper()
+        self.order_book = order_book
+        self.provider = provider
+        # Called as on_resync(symbol) once a fresh snapshot has been applied, so consumers can
+        # reset state derived from the old book (see FeatureExtractor.reset).
+        self.on_resync = on_resync
+        self.retry_delay = retry_delay
+        self.synced = False
+        self.last_update_id = None
+        # Diffs received while a snapshot is being fetched.
+        self.buffer = deque(maxlen=max_buffer)
+        # Counters, for monitoring.
+        self.snapshots = 0
+        self.resyncs = 0
+        self.gaps = 0
+        self.stale = 0
+        self.failed_fetches = 0
+        self._task = None
+
+    def stats(self):
+        return {
+            "synced": self.synced,
+            "last_update_id": self.last_update_id,
+            "buffered": len(self.buffer),
+            "snapshots": self.snapshots,
+            "resyncs": self.resyncs,
+            "gaps": self.gaps,
+            "stale": self.stale,
+            "failed_fetches": self.failed_fetches,
+        }
+
+    def restore(self, last_update_id):
+        # Resumes from a book restored from a checkpoint (data_stream/checkpoint.py) that was in
+        # sync up to last_update_id. Diffs it already holds are dropped as stale, one that
+        # continues the sequence is applied, and a gap resyncs from a snapshot as usual.
+        self.buffer.clear()
+        self.last_update_id = last_update_id
+        self.synced = True
+
+    def _apply(self, data):
+        # Applies a diff if it continues the sequence. Returns its level changes, None for a diff
+        # the book already contains, or False on a gap.
+        if data["u"] <= self.last_update_id:
+            self.stale += 1
+            return None
+        if data["U"] > self.last_update_id + 1:
+            return False
+        changes = self.order_book.update(data)
+        self.last_update_id = data["u"]
+        return changes
+
+    def handle(self, data):
+        # Returns the level changes of a diff that was applied, or None if it was buffered or
+        # dropped. Never waits: snapshots are fetched by a background task.
+        if self.synced:
+            changes = self._apply(data)
+            if changes is not False:
+                return changes
+            self.gaps += 1
+            self.synced = False
+            self.buffer.clear()
+        self.buffer.append(data)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._resync())
+        return None
+
+    async def _resync(self):
+        try:
+            while not self.synced:
+                try:
+                    snapshot = await self.provider.fetch(self.symbol)
+                except Exception as e:
+                    self.failed_fetches += 1
+                    print(f"Snapshot fetch for {self.symbol} failed: {e}")
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+                self.snapshots += 1
+                last_update_id = snapshot["lastUpdateId"]
+                # Everything up to the snapshot is already in it.
+                while self.buffer and self.buffer[0]["u"] <= last_update_id:
+                    self.buffer.popleft()
+                    self.stale += 1
+                # The snapshot is older than the buffered stream; a newer one is needed.
+                if self.buffer and self.buffer[0]["U"] > last_update_id + 1:
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+
+                # Nothing awaits from here on, so no diff can arrive until the book is in sync.
+                self.order_book.load_snapshot(snapshot["bids"], snapshot["asks"])
+                self.last_update_id = last_update_id
+                while self.buffer:
+                    if self._apply(self.buffer.popleft()) is False:
+                        self.gaps += 1
+                        self.buffer.clear()
+                        break
+                else:
+                    self.synced = True
+                    self.resyncs += 1
+                    if self.on_resync is not None:
+                        self.on_resync(self.symbol)
+        finally:
+            self._task = None
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+# Routes diffs to the SymbolSync of their symbol.
+class BookSyncManager:
+    def __init__(self, provider, on_resync=None, retry_delay=1.0):
+        self.provider = provider
+        self.on_resync = on_resync
+        self.retry_delay = retry_delay
+        self.symbols = {}
+
+    def add(self, symbol, order_book):
+        sync = SymbolSync(symbol, order_book, self.provider, self.on_resync, self.retry_delay)
+        self.symbols[sync.symbol] = sync
+        return sync
+
+    def handle(self, data):
+        return self.symbols[data["s"].upper()].handle(data)
+
+    def stats(self):
+        return {symbol: sync.stats() for symbol, sync in self.symbols.items()}
+
+    def close(self):
+        for sync in self.symbols.values():
+            sync.close()
+
+
+# The provider the live scripts use: a snapshot file when given, otherwise the REST endpoint.
+def snapshot_provider(snapshot_path=None, snapshot_url=None):
+    if snapshot_path:
+        return FileSnapshotProvider(snapshot_path)
+    return RestSnapshotProvider(snapshot_url) if snapshot_url else RestSnapshotProvider()
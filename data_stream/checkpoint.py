@@ -0,0 +1,204 @@
+# This file checkpoints the state of a live process, so a restart carries on where it stopped
+# instead of waiting for the book and the extractor's window of mid-prices to refill.
+# A checkpoint holds:
+#   - the whole order book, in the book's own units;
+#   - the feature extractor's order flow reference and mid-price history;
+#   - the update ID ("u") of the last diff applied to the book.
+# On startup the book and history are restored and the symbol's SymbolSync resumes from that ID.
+# Diffs the book already holds (e.g. the start of a replay) are dropped as stale, a diff that
+# continues the sequence is applied, and a gap (the diffs missed while the process was down)
+# resyncs the book from a snapshot as usual. That first resync only covers the downtime, so the
+# mid-price history is kept through it when the checkpoint is recent, and rows come out after a
+# couple of diffs instead of after a full window.
+#
+# Checkpoints are taken every few seconds by a task on the event loop that owns the book. The
+# state is copied between two messages, so it always matches its update ID; it is compressed and
+# written from a worker thread, so the loop only pays for the copy. Files are written to a
+# temporary path and renamed, so a crash never leaves a half-written checkpoint behind.
+#
+# File layout (.lobc):
+#   header: MAGIC, uint32 metadata length, JSON metadata (symbol, time, update ID, book units,
+#           level counts, extractor state)
+#   body:   zlib-compressed bid then ask levels as (price, qty) pairs in the book's units:
+#           float64, or int64 for fixed-point books
+
+import asyncio
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+
+MAGIC = b"LOBCKPT\x01"
+FORMAT_VERSION = 1
+FILE_SUFFIX = ".lobc"
+# Seconds between checkpoints.
+DEFAULT_INTERVAL = 5.0
+# Older checkpoints are ignored: the mid-prices they hold no longer lead up to the market.
+MAX_AGE = 60.0
+
+
+def capture(symbol, order_book, extractor, last_update_id):
+    # Copies everything a checkpoint holds. Must run on the thread that updates the book.
+    return {
+        "symbol": symbol.upper(),
+        "time_ns": time.time_ns(),
+        "last_update_id": last_update_id,
+        "tick_size": order_book.tick_size,
+        "lot_size": order_book.lot_size,
+        "extractor": extractor.state(),
+        "bids": order_book.bids.items(),
+        "asks": order_book.asks.items(),
+    }
+
+
+def write_checkpoint(path, state):
+    bids, asks = state["bids"], state["asks"]
+    # Fixed-point books hold integer ticks and lots.
+    typecode = "d" if state["tick_size"] is None else "q"
+    levels = array(typecode, [value for side in (bids, asks) for level in side for value in level])
+    metadata = {key: value for key, value in state.items() if key not in ("bids", "asks")}
+    metadata.update(version=FORMAT_VERSION, typecode=typecode, bid_count=len(bids), ask_count=len(asks))
+    metadata = json.dumps(metadata).encode()
+    body = zlib.compress(levels.tobytes(), 1)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(metadata)) + metadata + body)
+        # On disk before the rename, so the rename never exposes an empty file after a crash.
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+def read_checkpoint(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a checkpoint (bad magic bytes).")
+        (metadata_len,) = struct.unpack("<I", f.read(4))
+        state = json.loads(f.read(metadata_len))
+        body = f.read()
+    if state["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {state['version']} in {path}.")
+    levels = array(state["typecode"])
+    levels.frombytes(zlib.decompress(body))
+    split = 2 * state["bid_count"]
+    state["bids"] = list(zip(levels[0:split:2], levels[1:split:2]))
+    state["asks"] = list(zip(levels[split::2], levels[split + 1::2]))
+    return state
+
+
+# Restores one symbol's book and extractor on startup and checkpoints them periodically.
+class Checkpointer:
+    def __init__(self, path, symbol, order_book, extractor, interval=DEFAULT_INTERVAL, max_age=MAX_AGE):
+        self.path = path
+        self.symbol = symbol.upper()
+        self.order_book = order_book
+        self.extractor = extractor
+        self.interval = interval
+        self.max_age = max_age
+        # When the restored checkpoint was taken (ns), until the first resync after it.
+        self.restored_ns = None
+        self.restored_age = None
+        self.last_saved_id = None
+        # The periodic writes and a final one at shutdown may overlap.
+        self._write_lock = threading.Lock()
+        # Counters, for monitoring.
+        self.saves = 0
+        self.failed_saves = 0
+        self.capture_us = 0.0
+
+    def stats(self):
+        return {
+            "saves": self.saves,
+            "failed_saves": self.failed_saves,
+            "capture_us": self.capture_us,
+            "restored_age_s": self.restored_age if self.restored_age is not None else -1,
+        }
+
+    def restore(self, sync):
+        # Loads the checkpoint into the book and extractor and resumes sync (the symbol's
+        # SymbolSync) from its update ID. Returns the checkpoint's age in seconds, or None when
+        # there is no usable checkpoint and the process starts cold.
+        try:
+            state = read_checkpoint(self.path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zlib.error) as e:
+            print(f"Ignoring checkpoint {self.path}: {e}")
+            return None
+        age = (time.time_ns() - state["time_ns"]) / 1e9
+        if state["symbol"] != self.symbol:
+            print(f"Ignoring checkpoint {self.path}: it is for {state['symbol']}, not {self.symbol}.")
+            return None
+        if age > self.max_age:
+            print(f"Ignoring checkpoint {self.path}: it is {age:.0f}s old.")
+            return None
+        if (state["tick_size"], state["lot_size"]) != (self.order_book.tick_size, self.order_book.lot_size):
+            print(f"Ignoring checkpoint {self.path}: its book has different tick or lot sizes.")
+            return None
+        try:
+            self.extractor.load_state(state["extractor"])
+        except ValueError as e:
+            print(f"Ignoring checkpoint {self.path}: {e}")
+            return None
+        self.order_book.load_levels(state["bids"], state["asks"])
+        if self.order_book.max_levels is not None or self.order_book.price_band is not None:
+            self.order_book.prune()
+        sync.restore(state["last_update_id"])
+        self.restored_ns = state["time_ns"]
+        self.restored_age = age
+        self.last_saved_id = state["last_update_id"]
+        print(f"Restored {self.symbol} from checkpoint {self.path} ({age:.1f}s old, "
+              f"update ID {state['last_update_id']}).")
+        return age
+
+    def on_resync(self, symbol):
+        # Use as the on_resync of the BookSyncManager. The first resync after a restore only
+        # covers the restart, so a recent checkpoint's mid-prices are kept; any other resync
+        # starts the extractor over.
+        restored_ns, self.restored_ns = self.restored_ns, None
+        recent = restored_ns is not None and time.time_ns() - restored_ns <= self.max_age * 1e9
+        self.extractor.reset(keep_history=recent)
+
+    def _capture(self, sync):
+        # Only an in-sync book that moved on since the last checkpoint is worth saving.
+        if not sync.synced or sync.last_update_id == self.last_saved_id:
+            return None
+        start = time.perf_counter_ns()
+        state = capture(self.symbol, self.order_book, self.extractor, sync.last_update_id)
+        self.capture_us = (time.perf_counter_ns() - start) / 1e3
+        return state
+
+    def _write(self, state):
+        try:
+            with self._write_lock:
+                write_checkpoint(self.path, state)
+        except OSError as e:
+            self.failed_saves += 1
+            print(f"Checkpoint to {self.path} failed: {e}")
+            return
+        self.last_saved_id = state["last_update_id"]
+        self.saves += 1
+
+    async def save(self, sync):
+        state = self._capture(sync)
+        if state is not None:
+            await asyncio.to_thread(self._write, state)
+
+    def save_now(self, sync):
+        # A blocking save, e.g. on shutdown once the event loop has stopped feeding the book.
+        state = self._capture(sync)
+        if state is not None:
+            self._write(state)
+
+    async def run(self, sync):
+        # Run as a task on the loop that updates the book.
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save(sync)
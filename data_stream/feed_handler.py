@@ -0,0 +1,73 @@
+# This script is the single feed handler for every local consumer on the machine.
+# It runs the multi-symbol runner (multi_symbol.py) over one connection, or a replay, and after
+# every book update publishes the symbol's top levels, and each new feature row, into shared
+# memory (shared_book.py). The dashboard, predict_live.py and generate_dataset.py then read the
+# books and rows from there with --shared, so adding a consumer adds no exchange connection, no
+# JSON parsing and no book maintenance.
+
+import argparse
+import asyncio
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from data_stream.book_sync import snapshot_provider
+from data_stream.multi_symbol import BINANCE_URI, load_symbol_configs, run_symbols
+from data_stream.shared_book import SharedBookWriter, DEFAULT_NAME
+from utils.metrics import PipelineMetrics, serve_metrics
+
+
+async def run_feed(configs, name=DEFAULT_NAME, depth=20, ring_size=1024, uri=BINANCE_URI, replay_paths=None,
+                   speed=None, snapshots=None, report_every=5.0, metrics=None):
+    writer = SharedBookWriter(configs, name=name, depth=depth, ring_size=ring_size)
+    print(f"Publishing {len(configs)} symbol(s) to shared memory {name!r}.")
+    index = writer.index
+
+    def publish(pipeline, data, row):
+        slot = index[pipeline.symbol]
+        writer.publish_book(slot, pipeline.order_book, data.get("u", 0), data.get("E", 0))
+        if row:
+            writer.publish_row(slot, row)
+
+    try:
+        await run_symbols(configs, uri, replay_paths, speed, snapshots, report_every, on_update=publish,
+                          metrics=metrics)
+    finally:
+        # Consumers attached to the segment keep their mapping; new ones can no longer attach.
+        writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish books and feature rows to shared memory for local consumers.")
+    parser.add_argument("--symbols", nargs="+", metavar="SYMBOL", help="Symbols to subscribe, e.g. btcusdt ethusdt.")
+    parser.add_argument("--config", metavar="PATH", help="JSON file of per-symbol depth, window and tick size.")
+    parser.add_argument("--name", default=DEFAULT_NAME, help="Name of the shared memory segment.")
+    parser.add_argument("--depth", type=int, default=50, help="Levels per side to publish.")
+    parser.add_argument("--ring", type=int, default=1024, help="Feature rows kept per symbol for consumers to catch up.")
+    parser.add_argument("--uri", default=BINANCE_URI,
+                        help="Base URI of the combined stream, e.g. ws://127.0.0.1:8765 for the stand-in server.")
+    parser.add_argument("--replay", nargs="+", metavar="RECORDING",
+                        help="Read depth diffs from recording files instead of the live WebSocket.")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Replay at this multiple of the recorded pace (default: as fast as possible).")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Take depth snapshots from JSON files, e.g. snapshots/{symbol}.json.")
+    parser.add_argument("--snapshot-url", default=None,
+                        help="REST depth endpoint to take snapshots from (default: Binance).")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines.")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve stage latencies in the Prometheus text format at http://127.0.0.1:PORT/metrics.")
+    args = parser.parse_args()
+    if not args.symbols and not args.config:
+        parser.error("give --symbols, --config or both")
+    configs = load_symbol_configs(args.config, args.symbols)
+    snapshots = snapshot_provider(args.snapshot, args.snapshot_url) if args.snapshot or not args.replay else None
+    metrics = PipelineMetrics(event_lag=not args.replay)
+    if args.metrics_port is not None:
+        serve_metrics(metrics, args.metrics_port)
+    try:
+        asyncio.run(run_feed(configs, args.name, args.depth, args.ring, args.uri, args.replay, args.speed, snapshots,
+                             args.report_every, metrics))
+    except KeyboardInterrupt:
+        print("\nFeed stopped by user.")
@@ -1,30 +1,96 @@
 # This script connects to the Binance WebSocket to collect live market data.
 # It uses the FeatureExtractor to process this data and saves a labelled dataset (CSV)
 # which is then used to train the machine learning model.
-
+# With --replay it reads recorded depth diffs (see recorder.py) instead, running offline
+# as fast as the CPU allows, or at a multiple of the recorded pace with --speed.
+# With --bulk it labels whole recordings at once using the vectorized batch feature path.
+# With --columnar rows are streamed to disk in chunks of typed columns (.lobf) as they are
+# produced, instead of being held in memory and written to CSV at the end.
+# With --shared it collects the rows a running feed handler (feed_handler.py) publishes, without
+# a connection or book of its own.
+
+import argparse
 import asyncio
 import websockets
-import json
 import sys
 import os
+import time
 import pandas as pd
 from utils.order_book_cache import OrderBook
 from microstructure.data_labeller import FeatureExtractor
+from microstructure.batch_features import capture_snapshots, compute_batch_features
+from microstructure.feature_sinks import ListSink, ColumnarFileSink, read_feature_file, write_feature_file, FILE_SUFFIX
+from data_stream.replay import connect_replay, iter_recording, ReplayFinished
+from data_stream.decoder import DepthDecoder
+from data_stream.book_sync import BookSyncManager, snapshot_provider
+from data_stream.multi_symbol import BINANCE_URI, raw_stream_uri
+from data_stream.shared_book import attach_reader, DEFAULT_NAME as SHARED_FEED_NAME
+
+# Every batch feature is calculated from the best level of each side, so bulk mode only
+# needs to capture the top level of the book per message.
+BULK_SNAPSHOT_DEPTH = 1
+# How often new rows are looked for when reading from a shared-memory feed.
+SHARED_POLL_INTERVAL = 0.01
+
+
+# Builds a robust file path to save the dataset in the correct directory.
+def default_output_path(columnar=False):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    filename = "lob_features" + (FILE_SUFFIX if columnar else ".csv")
+    return os.path.join(script_dir, filename)
+
+
+# Final check to ensure the dataset is balanced enough for training.
+def report_class_distribution(output_filename):
+    if output_filename.endswith(FILE_SUFFIX):
+        df = pd.DataFrame(read_feature_file(output_filename))
+    else:
+        df = pd.read_csv(output_filename)
+    # One label column per horizon; a single-horizon dataset just has "label".
+    for column in [c for c in df.columns if c.startswith("label")]:
+        label_counts = df[column].value_counts()
+        print(f"\nNew dataset class distribution ({column}):")
+        print(label_counts)
+        if len(label_counts) < 2:
+            print("\nWARNING: The new dataset still contains only one class.")
+            print("The market might be very stable. Try running again later.")
+        else:
+            print("\nDataset contains multiple classes. Ready for training.")
 
 
-async def collect_data():
+async def collect_data(replay_paths=None, speed=None, target_size=200, horizons=None, columnar=False,
+                       uri=BINANCE_URI, snapshot_url=None):
     # Initialise the objects that will manage the data.
+    output_filename = default_output_path(columnar)
     order_book = OrderBook(depth=20)
-    extractor = FeatureExtractor(window=30)
+    # In columnar mode rows go straight to disk in chunks rather than accumulating in memory.
+    sink = ColumnarFileSink(output_filename) if columnar else None
+    extractor = FeatureExtractor(window=30, horizons=horizons, sink=sink)
 
     # Define how many data points to collect.
-    DATASET_TARGET_SIZE = 200
+    DATASET_TARGET_SIZE = target_size
     BUFFER_SIZE = extractor.window + 1
 
-    uri = "wss://stream.binance.com:9443/ws/btcusdt@depth@100ms"
+    uri = raw_stream_uri("btcusdt", uri)
 
-    print(f"Connecting to WebSocket at {uri}...")
-    async with websockets.connect(uri) as ws:
+    if replay_paths:
+        print(f"Replaying {len(replay_paths)} recording(s)...")
+        # Replayed messages arrive already decoded, so no JSON round trip is needed.
+        source = connect_replay(replay_paths, speed=speed, raw=False)
+    else:
+        print(f"Connecting to WebSocket at {uri}...")
+        source = websockets.connect(uri)
+
+    # Parses frames with the fastest JSON backend and reads the levels straight into numbers.
+    decoder = DepthDecoder()
+    # A live book starts from a REST snapshot and is resynced after any sequence gap, so labels are
+    # never computed from a partial or diverged book. Recordings are replayed from an empty book.
+    sync = None
+    if not replay_paths:
+        sync = BookSyncManager(snapshot_provider(snapshot_url=snapshot_url), on_resync=lambda symbol: extractor.reset())
+        sync.add("btcusdt", order_book)
+
+    async with source as ws:
         print("Successfully connected.")
         print(f"Waiting for {BUFFER_SIZE} data points to fill the initial buffer...")
 
@@ -36,13 +102,17 @@ async def collect_data():
             try:
                 # Wait for a new message from the WebSocket.
                 msg = await ws.recv()
-                data = json.loads(msg)
+                data = decoder.decode(msg)
                 messages_received += 1
 
                 # Update the local order book and extract features.
-                order_book.update(data)
+                changes = sync.handle(data) if sync else order_book.update(data)
+                if changes is None:
+                    sys.stdout.write(f"\rWaiting for the depth snapshot... [Received: {messages_received}]")
+                    sys.stdout.flush()
+                    continue
                 current_bids, current_asks = order_book.bids, order_book.asks
-                row = extractor.update(current_bids, current_asks)
+                row = extractor.update(current_bids, current_asks, changes)
 
                 # The extractor returns a row only after its buffer is full.
                 if row:
@@ -54,38 +124,115 @@ async def collect_data():
                     # Show buffering progress.
                     sys.stdout.write(f"\rBuffering... [Received: {messages_received}, Need: {BUFFER_SIZE}]")
                     sys.stdout.flush()
+            except ReplayFinished:
+                print("\nEnd of recording reached.")
+                break
             except Exception as e:
                 print(f"\nError during collection: {e}")
                 break
 
-    print(f"\n\nFinished collecting {len(extractor.feature_rows)} data points.")
+    print(f"\n\nFinished collecting {rows_collected} data points.")
 
     # Save the data if any was collected.
-    if extractor.feature_rows:
-        # Build a robust file path to save the CSV in the correct directory.
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        filename = "lob_features.csv"
-        output_filename = os.path.join(script_dir, filename)
-
-        extractor.save_to_csv(output_filename)
+    if sink is not None:
+        sink.close()
+    if rows_collected:
+        if sink is None:
+            extractor.save_to_csv(output_filename)
         print(f"Saved data to {output_filename}")
+        report_class_distribution(output_filename)
+    else:
+        print("No data was collected, file not saved.")
 
-        # Final check to ensure the dataset is balanced enough for training.
-        df = pd.read_csv(output_filename)
-        label_counts = df['label'].value_counts()
-        print("\nNew dataset class distribution:")
-        print(label_counts)
-        if len(label_counts) < 2:
-            print("\nWARNING: The new dataset still contains only one class.")
-            print("The market might be very stable. Try running again later.")
-        else:
-            print("\nDataset contains multiple classes. Ready for training.")
+
+# Collects the rows a feed handler (feed_handler.py) publishes to shared memory, so no second
+# connection or book is needed. Rows are taken from the moment this starts.
+def collect_shared(name, target_size=200, columnar=False, symbol="btcusdt"):
+    output_filename = default_output_path(columnar)
+    sink = ColumnarFileSink(output_filename) if columnar else ListSink()
+    reader = attach_reader(name)
+    print(f"Reading {symbol} rows from shared memory {name!r}...")
+    cursor = reader.rows_written_for(symbol)
+    rows_collected = 0
+    rows_lost = 0
+    try:
+        while rows_collected < target_size:
+            rows, cursor, lost = reader.rows_since(symbol, cursor)
+            rows_lost += lost
+            for row in rows[:target_size - rows_collected]:
+                sink.append(row)
+                rows_collected += 1
+            sys.stdout.write(f"\rCollected row {rows_collected}/{target_size}...")
+            sys.stdout.flush()
+            time.sleep(SHARED_POLL_INTERVAL)
+    finally:
+        reader.close()
+        sink.close()
+
+    print(f"\n\nFinished collecting {rows_collected} data points.")
+    if rows_lost:
+        print(f"WARNING: {rows_lost} rows were overwritten in the feed before they could be read.")
+    if rows_collected:
+        if not columnar:
+            pd.DataFrame(sink.rows).to_csv(output_filename, index=False)
+        print(f"Saved data to {output_filename}")
+        report_class_distribution(output_filename)
     else:
         print("No data was collected, file not saved.")
 
 
+# Labels every message in the given recordings in one pass with the vectorized batch path.
+# The rows are identical to what the streaming FeatureExtractor would produce on the same data.
+def build_dataset_bulk(replay_paths, window=30, horizons=None, columnar=False):
+    messages = (message for path in replay_paths for _, message in iter_recording(path))
+    snapshots = capture_snapshots(messages, depth=BULK_SNAPSHOT_DEPTH)
+    print(f"Captured {len(snapshots['bids'])} order book snapshots.")
+    features = compute_batch_features(**snapshots, window=window, horizons=horizons)
+
+    if len(features["spread"]) == 0:
+        print("No data was collected, file not saved.")
+        return
+    output_filename = default_output_path(columnar)
+    if columnar:
+        write_feature_file(output_filename, features)
+    else:
+        pd.DataFrame(features).to_csv(output_filename, index=False)
+    print(f"Saved {len(features['spread'])} data points to {output_filename}")
+    report_class_distribution(output_filename)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect and label order book features for training.")
+    parser.add_argument("--replay", nargs="+", metavar="RECORDING",
+                        help="Read depth diffs from recording files instead of the live WebSocket.")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Replay at this multiple of the recorded pace (default: as fast as possible).")
+    parser.add_argument("--uri", default=BINANCE_URI,
+                        help="Base URI of the depth stream, e.g. ws://127.0.0.1:8765 for the stand-in server.")
+    parser.add_argument("--snapshot-url", default=None,
+                        help="REST depth endpoint to take snapshots from (default: Binance).")
+    parser.add_argument("--rows", type=int, default=200, help="Number of labelled rows to collect.")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Label the whole of the --replay recordings at once with the vectorized batch path.")
+    parser.add_argument("--horizons", type=int, nargs="+", metavar="N",
+                        help="Label several horizons (in messages) at once, e.g. --horizons 10 30 100 300.")
+    parser.add_argument("--columnar", action="store_true",
+                        help=f"Stream rows to a chunked columnar {FILE_SUFFIX} file instead of CSV.")
+    parser.add_argument("--shared", nargs="?", const=SHARED_FEED_NAME, metavar="NAME",
+                        help="Collect rows from a running feed handler's shared memory instead of a connection "
+                             f"(default name: {SHARED_FEED_NAME}).")
+    args = parser.parse_args()
+    if args.bulk and not args.replay:
+        parser.error("--bulk requires --replay")
+    if args.shared and (args.replay or args.horizons):
+        parser.error("--shared collects the feed's own rows; it cannot be combined with --replay or --horizons")
     try:
-        asyncio.run(collect_data())
+        if args.shared:
+            collect_shared(args.shared, args.rows, args.columnar)
+        elif args.bulk:
+            build_dataset_bulk(args.replay, horizons=args.horizons, columnar=args.columnar)
+        else:
+            asyncio.run(collect_data(args.replay, args.speed, args.rows, args.horizons, args.columnar, args.uri,
+                                     args.snapshot_url))
     except KeyboardInterrupt:
         print("\n\nData collection interrupted by user.")
@@ -0,0 +1,183 @@
+# This file contains the two-stage ingest pipeline used by the live consumers.
+# Reading the socket and processing messages used to happen in one coroutine, so any stall in
+# the book update, the features or the model also stopped the socket from being drained.
+# Here a receiver task does nothing but read frames into a bounded queue, and the processor
+# drains the queue in batches. All the depth diffs in one batch are merged into a single diff per
+# symbol before the book is updated, so a backlog is worked off with one book update and one
+# feature row instead of one per message.
+#
+# Merging is exact for the book: a depth diff carries the new absolute quantity of each level, so
+# applying the merged diff (the last quantity seen for every level) leaves the book in the same
+# state as applying the diffs one by one. The net volume change VOI accumulates is the same too.
+# What conflation gives up is the intermediate rows, which live consumers only need the latest of.
+#
+# If the processor falls so far behind that the queue fills, the receiver waits for room (and
+# counts how often it had to); it never drops a diff, since that would corrupt the book.
+#
+# With a PipelineMetrics (utils/metrics.py) the time each frame waits in the queue, its decode
+# time and its exchange-to-receive lag are recorded as well.
+
+import asyncio
+import time
+from collections import deque
+
+from data_stream.decoder import DepthDecoder
+
+# Marks the end of the stream in the queue.
+_END = object()
+
+
+# Merges consecutive depth diffs for one symbol into one. The merged diff spans the first
+# message's U to the last message's u, and keeps the last quantity seen for each price level.
+def merge_depth_diffs(messages):
+    if len(messages) == 1:
+        return messages[0]
+    bids, asks = {}, {}
+    for message in messages:
+        for price, qty in message.get("b", ()):
+            bids[price] = qty
+        for price, qty in message.get("a", ()):
+            asks[price] = qty
+    merged = dict(messages[-1])
+    if "U" in messages[0]:
+        merged["U"] = messages[0]["U"]
+    merged["b"] = [[price, qty] for price, qty in bids.items()]
+    merged["a"] = [[price, qty] for price, qty in asks.items()]
+    return merged
+
+
+# Splits one symbol's diffs into runs with consecutive update IDs (each U follows the previous
+# u). Only diffs within a run are merged, so a sequence gap is never hidden inside a merged diff
+# and the book synchroniser (book_sync.py) still sees it.
+def contiguous_runs(messages):
+    runs = [[messages[0]]]
+    for previous, message in zip(messages, messages[1:]):
+        if "U" in message and "u" in previous and message["U"] != previous["u"] + 1:
+            runs.append([])
+        runs[-1].append(message)
+    return runs
+
+
+class DepthIngest:
+    def __init__(self, source, max_queue=10_000, max_batch=1_000, decoder=None, metrics=None):
+        # source is anything with an async recv(): a websockets connection or a ReplayStream.
+        self.source = source
+        self.max_batch = max_batch
+        # Frames are decoded by the processor, never the receiver. The decoder must use the same
+        # tick and lot size as the book the messages are applied to.
+        self.decoder = decoder or DepthDecoder()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.metrics = metrics
+        # The local time each queued frame arrived, in queue order; only kept with metrics.
+        self.received_times = deque() if metrics is not None else None
+        # Counters, for monitoring how far the processor is behind and how much it merges.
+        self.received = 0
+        self.processed = 0
+        self.batches = 0
+        self.updates = 0
+        self.conflated = 0
+        self.max_queue_depth = 0
+        self.backpressure_waits = 0
+        self._receiver = None
+
+    @property
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "received": self.received,
+            "processed": self.processed,
+            "batches": self.batches,
+            "book_updates": self.updates,
+            "conflated": self.conflated,
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+    async def _receive(self):
+        # Reads frames as they arrive and queues them undecoded. Whatever ends the stream (e.g.
+        # ReplayFinished or a closed connection) is queued too and re-raised by the processor
+        # once everything before it has been processed.
+        queue = self.queue
+        received_times = self.received_times
+        try:
+            while True:
+                frame = await self.source.recv()
+                if received_times is not None:
+                    received_times.append(time.time_ns())
+                self.received += 1
+                if queue.full():
+                    self.backpressure_waits += 1
+                await queue.put(frame)
+                depth = queue.qsize()
+                if depth > self.max_queue_depth:
+                    self.max_queue_depth = depth
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            await queue.put((_END, e))
+
+    def start(self):
+        if self._receiver is None:
+            self._receiver = asyncio.get_running_loop().create_task(self._receive())
+
+    async def batches_of_frames(self):
+        # Yields lists of raw frames: everything queued when the processor comes back for more,
+        # up to max_batch at a time.
+        self.start()
+        queue = self.queue
+        while True:
+            frames = [await queue.get()]
+            while len(frames) < self.max_batch and not queue.empty():
+                frames.append(queue.get_nowait())
+            end = None
+            if isinstance(frames[-1], tuple) and frames[-1][0] is _END:
+                end = frames.pop()[1]
+            if frames:
+                yield frames
+            if end is not None:
+                raise end
+            # Give the receiver a turn before draining again.
+            await asyncio.sleep(0)
+
+    async def updates_iter(self):
+        # Yields one merged depth diff per symbol per batch (more if the batch has a sequence gap),
+        # in order of first arrival.
+        metrics = self.metrics
+        async for frames in self.batches_of_frames():
+            by_symbol = {}
+            if metrics is None:
+                for frame in frames:
+                    data = self.decoder.decode(frame)
+                    by_symbol.setdefault(data.get("s"), []).append(data)
+            else:
+                taken = time.time_ns()
+                for frame in frames:
+                    received_ns = self.received_times.popleft()
+                    metrics.receive.record(taken - received_ns)
+                    start = time.perf_counter_ns()
+                    data = self.decoder.decode(frame)
+                    metrics.decode.record(time.perf_counter_ns() - start)
+                    metrics.record_event_lag(data.get("E"), received_ns)
+                    by_symbol.setdefault(data.get("s"), []).append(data)
+            self.batches += 1
+            self.processed += len(frames)
+            for messages in by_symbol.values():
+                for run in contiguous_runs(messages):
+                    self.updates += 1
+                    self.conflated += len(run) - 1
+                    yield merge_depth_diffs(run)
+
+    def __aiter__(self):
+        return self.updates_iter()
+
+    async def close(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+            try:
+                await self._receiver
+            except asyncio.CancelledError:
+                pass
+            self._receiver = None
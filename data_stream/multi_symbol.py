@@ -0,0 +1,276 @@
+# This script maintains order books and features for many symbols in one process.
+# Instead of one WebSocket connection, one OrderBook and one FeatureExtractor per script, every
+# symbol is subscribed over a single combined-stream connection and each message is routed by its
+# symbol to that symbol's own book and extractor. Symbols can differ in depth, window and tick
+# size, set per symbol in a JSON config file:
+#
+#   {"defaults": {"depth": 20, "window": 30},
+#    "symbols": {"btcusdt": {"tick_size": 0.01, "lot_size": 0.00001},
+#                "ethusdt": {"depth": 10}}}
+#
+# Everything runs on one event loop: the shared ingest (ingest.py) reads the connection, one
+# SymbolDecoder converts each symbol's levels to the units of its book, and the book synchroniser
+# (book_sync.py) keeps each book in sequence independently. An extra symbol costs one book, one
+# extractor and one entry in each routing dict. See benchmarks/bench_symbols.py for measurements.
+# For testing without network access, point --uri and --snapshot-url at stand_in_server.py.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import websockets
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from utils.order_book_cache import OrderBook
+from microstructure.data_labeller import FeatureExtractor
+from microstructure.feature_sinks import NullSink
+from data_stream.book_sync import BookSyncManager, snapshot_provider
+from data_stream.decoder import SymbolDecoder
+from data_stream.ingest import DepthIngest
+from data_stream.replay import connect_replay, ReplayFinished
+from utils.metrics import PipelineMetrics, serve_metrics
+
+BINANCE_URI = "wss://stream.binance.com:9443"
+UPDATE_SPEED = "100ms"
+# Binance accepts at most this many streams on one combined connection.
+MAX_STREAMS = 1024
+
+
+# The combined-stream URI for the depth streams of the given symbols, e.g.
+# wss://stream.binance.com:9443/stream?streams=btcusdt@depth@100ms/ethusdt@depth@100ms
+def combined_stream_uri(symbols, base_uri=BINANCE_URI, update_speed=UPDATE_SPEED):
+    if len(symbols) > MAX_STREAMS:
+        raise ValueError(f"A combined stream carries at most {MAX_STREAMS} streams, got {len(symbols)}")
+    streams = "/".join(f"{symbol.lower()}@depth@{update_speed}" for symbol in symbols)
+    return f"{base_uri.rstrip('/')}/stream?streams={streams}"
+
+
+# The raw-stream URI of one symbol's depth stream, e.g. wss://stream.binance.com:9443/ws/btcusdt@depth@100ms
+def raw_stream_uri(symbol, base_uri=BINANCE_URI, update_speed=UPDATE_SPEED):
+    return f"{base_uri.rstrip('/')}/ws/{symbol.lower()}@depth@{update_speed}"
+
+
+# The settings of one symbol's book and extractor.
+class SymbolConfig:
+    def __init__(self, symbol, depth=20, window=30, tick_size=None, lot_size=None, max_levels=1000):
+        if (tick_size is None) != (lot_size is None):
+            raise ValueError(f"{symbol}: tick_size and lot_size must be given together")
+        self.symbol = symbol.upper()
+        self.depth = depth
+        self.window = window
+        self.tick_size = tick_size
+        self.lot_size = lot_size
+        # Books are bounded, since a long-running process never sees far levels removed.
+        self.max_levels = max(max_levels, depth)
+
+    def __repr__(self):
+        return (f"SymbolConfig({self.symbol!r}, depth={self.depth}, window={self.window}, "
+                f"tick_size={self.tick_size}, lot_size={self.lot_size})")
+
+
+# Builds the symbol configs from a JSON config file, a list of symbols, or both. Symbols listed
+# but missing from the file get the file's defaults.
+def load_symbol_configs(path=None, symbols=None):
+    config = {}
+    if path:
+        with open(path) as f:
+            config = json.load(f)
+    defaults = config.get("defaults", {})
+    settings = {symbol.upper(): values for symbol, values in config.get("symbols", {}).items()}
+    for symbol in symbols or ():
+        settings.setdefault(symbol.upper(), {})
+    if not settings:
+        raise ValueError("No symbols configured")
+    return [SymbolConfig(symbol, **{**defaults, **values}) for symbol, values in settings.items()]
+
+
+# One symbol's book and extractor, plus counters of the work done for it.
+class SymbolPipeline:
+    def __init__(self, config, sink=None):
+        self.config = config
+        self.symbol = config.symbol
+        self.order_book = OrderBook(depth=config.depth, max_levels=config.max_levels,
+                                    tick_size=config.tick_size, lot_size=config.lot_size)
+        # By default rows are handed to on_row and not kept.
+        self.extractor = FeatureExtractor(depth=config.depth, window=config.window, tick_size=config.tick_size,
+                                          lot_size=config.lot_size, sink=sink if sink is not None else NullSink())
+        self.updates = 0
+        self.rows = 0
+        # Time spent on this symbol's book update and features, for per-symbol CPU accounting.
+        self.busy_ns = 0
+
+    def stats(self):
+        return {
+            "updates": self.updates,
+            "rows": self.rows,
+            "bid_levels": len(self.order_book.bids),
+            "ask_levels": len(self.order_book.asks),
+            "busy_us_per_update": self.busy_ns / self.updates / 1e3 if self.updates else 0.0,
+        }
+
+
+class MultiSymbolRunner:
+    def __init__(self, configs, snapshots=None, on_row=None, on_update=None, max_batch=1000, metrics=None):
+        self.pipelines = {config.symbol: SymbolPipeline(config) for config in configs}
+        # Called as on_row(symbol, row) with every feature row.
+        self.on_row = on_row
+        # Called as on_update(pipeline, data, row) after every diff applied to a book, with the
+        # row it produced or None.
+        self.on_update = on_update
+        self.max_batch = max_batch
+        # A PipelineMetrics (utils/metrics.py) to record stage latencies in, shared by all symbols.
+        self.metrics = metrics
+        # Each symbol's levels are decoded straight into the units of its own book.
+        self.decoder = SymbolDecoder({config.symbol: (config.tick_size, config.lot_size) for config in configs})
+        # With a snapshot provider every book is synchronised on its own; a gap in one symbol
+        # resyncs only that symbol and resets only its extractor.
+        self.sync = None
+        if snapshots is not None:
+            self.sync = BookSyncManager(snapshots, on_resync=self.reset_symbol)
+            for symbol, pipeline in self.pipelines.items():
+                self.sync.add(symbol, pipeline.order_book)
+        self.ingest = None
+        # Messages for symbols that are not configured.
+        self.unrouted = 0
+
+    @property
+    def symbols(self):
+        return list(self.pipelines)
+
+    def reset_symbol(self, symbol):
+        self.pipelines[symbol].extractor.reset()
+
+    def handle(self, data):
+        # Applies one decoded diff to its symbol's book and extractor; returns the row, if any.
+        pipeline = self.pipelines.get(data.get("s"))
+        if pipeline is None:
+            self.unrouted += 1
+            return None
+        start = time.perf_counter_ns()
+        changes = self.sync.handle(data) if self.sync else pipeline.order_book.update(data)
+        row = None
+        # Nothing to do while the book waits for a snapshot.
+        if changes is not None:
+            pipeline.updates += 1
+            book_done = time.perf_counter_ns()
+            row = pipeline.extractor.update(pipeline.order_book.bids, pipeline.order_book.asks, changes)
+            end = time.perf_counter_ns()
+            if self.metrics is not None:
+                self.metrics.book_update.record(book_done - start)
+                self.metrics.features.record(end - book_done)
+        else:
+            end = time.perf_counter_ns()
+        pipeline.busy_ns += end - start
+        if row:
+            pipeline.rows += 1
+            if self.on_row is not None:
+                self.on_row(pipeline.symbol, row)
+        if changes is not None and self.on_update is not None:
+            self.on_update(pipeline, data, row)
+        return row
+
+    async def run(self, source):
+        # Processes messages from source (a combined-stream connection or a replay) until it ends.
+        self.ingest = DepthIngest(source, max_batch=self.max_batch, decoder=self.decoder, metrics=self.metrics)
+        if self.metrics is not None:
+            self.metrics.add_source("ingest", self.ingest.stats)
+        try:
+            async for data in self.ingest:
+                self.handle(data)
+        finally:
+            await self.ingest.close()
+            if self.sync:
+                self.sync.close()
+
+    def stats(self):
+        stats = {symbol: pipeline.stats() for symbol, pipeline in self.pipelines.items()}
+        if self.sync:
+            for symbol, sync_stats in self.sync.stats().items():
+                stats[symbol]["resyncs"] = sync_stats["resyncs"]
+                stats[symbol]["gaps"] = sync_stats["gaps"]
+        return stats
+
+
+def print_stats(runner):
+    print(f"\n{'symbol':>12} {'updates':>9} {'rows':>9} {'levels':>7} {'us/update':>10} {'resyncs':>8}")
+    for symbol, stats in runner.stats().items():
+        print(f"{symbol:>12} {stats['updates']:>9} {stats['rows']:>9} {stats['bid_levels'] + stats['ask_levels']:>7} "
+              f"{stats['busy_us_per_update']:>10.1f} {stats.get('resyncs', '-'):>8}")
+    if runner.ingest:
+        ingest = runner.ingest.stats()
+        print(f"Ingest: {ingest['received']} messages, {ingest['book_updates']} book updates "
+              f"({ingest['conflated']} merged), {runner.unrouted} for unknown symbols.")
+    if runner.metrics is not None:
+        print(runner.metrics.format_summary())
+
+
+async def report_progress(runner, interval):
+    while True:
+        await asyncio.sleep(interval)
+        stats = runner.stats().values()
+        updates = sum(s["updates"] for s in stats)
+        rows = sum(s["rows"] for s in stats)
+        sys.stdout.write(f"\r{len(runner.pipelines)} symbols: {updates} book updates, {rows} rows...")
+        sys.stdout.flush()
+
+
+async def run_symbols(configs, uri=BINANCE_URI, replay_paths=None, speed=None, snapshots=None, report_every=5.0,
+                      on_update=None, metrics=None):
+    # Stage latencies are always recorded; they cost well under a microsecond per message.
+    if metrics is None:
+        metrics = PipelineMetrics(event_lag=not replay_paths)
+    runner = MultiSymbolRunner(configs, snapshots, on_update=on_update, metrics=metrics)
+    if replay_paths:
+        # Unpaced replays have no socket to keep drained, so every message is processed on its own.
+        runner.max_batch = 1000 if speed else 1
+        source = connect_replay(replay_paths, speed=speed, raw=False)
+    else:
+        stream_uri = combined_stream_uri(runner.symbols, uri)
+        print(f"Connecting to {len(runner.symbols)} depth streams at {uri}...")
+        source = websockets.connect(stream_uri, max_size=None)
+    reporter = asyncio.get_running_loop().create_task(report_progress(runner, report_every))
+    try:
+        async with source as ws:
+            await runner.run(ws)
+    except ReplayFinished:
+        print("\nEnd of recording reached.")
+    finally:
+        reporter.cancel()
+        print_stats(runner)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain books and features for many symbols over one connection.")
+    parser.add_argument("--symbols", nargs="+", metavar="SYMBOL", help="Symbols to subscribe, e.g. btcusdt ethusdt.")
+    parser.add_argument("--config", metavar="PATH", help="JSON file of per-symbol depth, window and tick size.")
+    parser.add_argument("--uri", default=BINANCE_URI,
+                        help="Base URI of the combined stream, e.g. ws://127.0.0.1:8765 for the stand-in server.")
+    parser.add_argument("--replay", nargs="+", metavar="RECORDING",
+                        help="Read depth diffs from recording files instead of the live WebSocket.")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Replay at this multiple of the recorded pace (default: as fast as possible).")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Take depth snapshots from JSON files, e.g. snapshots/{symbol}.json.")
+    parser.add_argument("--snapshot-url", default=None,
+                        help="REST depth endpoint to take snapshots from (default: Binance).")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress lines.")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve stage latencies in the Prometheus text format at http://127.0.0.1:PORT/metrics.")
+    args = parser.parse_args()
+    if not args.symbols and not args.config:
+        parser.error("give --symbols, --config or both")
+    configs = load_symbol_configs(args.config, args.symbols)
+    # Live books always start from a snapshot; a replay only if one is supplied.
+    snapshots = snapshot_provider(args.snapshot, args.snapshot_url) if args.snapshot or not args.replay else None
+    metrics = PipelineMetrics(event_lag=not args.replay)
+    if args.metrics_port is not None:
+        serve_metrics(metrics, args.metrics_port)
+    try:
+        asyncio.run(run_symbols(configs, args.uri, args.replay, args.speed, snapshots, args.report_every,
+                                metrics=metrics))
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
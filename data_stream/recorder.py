@@ -0,0 +1,330 @@
+# This script records the raw Binance depth-diff stream to disk so features and labels can be
+# re-derived later without recollecting data.
+# Messages are packed into a compact binary format and written in compressed chunks by a
+# background thread, so recording never blocks the WebSocket receive loop.
+#
+# File layout (.lobrec):
+#   header: MAGIC, uint32 metadata length, JSON metadata (symbol, format version, ...)
+#   chunks: CHUNK_HEADER followed by a zlib-compressed payload of packed records
+# Each record is RECORD_HEADER (receive time, event time, U, u, bid count, ask count)
+# followed by the bid and ask levels as int64 (price delta, qty) pairs in units of 1e-8.
+# A sidecar index file (.lobrec.idx) holds one INDEX_ENTRY per chunk so readers can seek
+# straight to a time or sequence range.
+
+import asyncio
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+import websockets
+
+# Add the project root to the system path so the script can also be run directly.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_stream.decoder import loads
+
+MAGIC = b"LOBREC\x00\x01"
+FORMAT_VERSION = 1
+FILE_SUFFIX = ".lobrec"
+INDEX_SUFFIX = ".idx"
+
+# Chunk header: marker, record count, payload size before and after compression,
+# first/last receive time (ns) and first U / last u of the chunk.
+CHUNK_HEADER = struct.Struct("<4sIIIqqqq")
+CHUNK_MARKER = b"CHNK"
+# Record header: receive time (ns), event time 'E' (ms), 'U', 'u', bid level count, ask level count.
+RECORD_HEADER = struct.Struct("<qqqqHH")
+# Index entry: file offset of the chunk header, then the chunk's summary fields.
+INDEX_ENTRY = struct.Struct("<QIqqqq")
+# Prices and quantities are stored as integer multiples of 1e-8.
+VALUE_SCALE = 10 ** 8
+# The level counts in RECORD_HEADER are uint16; larger messages are rejected.
+MAX_LEVELS = 0xFFFF
+
+
+def _pack_levels(levels, out):
+    # Prices and quantities are stored as integers in units of 1e-8, the precision Binance
+    # sends, so the conversion is lossless. Prices are delta-encoded against the previous level
+    # on the same side, which keeps the numbers small and compresses well.
+    prev_price = 0
+    for price, qty in levels:
+        price_units = round(float(price) * VALUE_SCALE)
+        out.append(price_units - prev_price)
+        out.append(round(float(qty) * VALUE_SCALE))
+        prev_price = price_units
+
+
+def _unpack_levels(values):
+    levels = []
+    price_units = 0
+    for i in range(0, len(values), 2):
+        price_units += values[i]
+        levels.append([price_units / VALUE_SCALE, values[i + 1] / VALUE_SCALE])
+    return levels
+
+
+def pack_record(recv_ns, data):
+    # Packs one depth-diff message into the binary record layout.
+    bids, asks = data.get("b", []), data.get("a", [])
+    if len(bids) > MAX_LEVELS or len(asks) > MAX_LEVELS:
+        raise ValueError(f"A record holds at most {MAX_LEVELS} levels per side, got {len(bids)} and {len(asks)}.")
+    header = RECORD_HEADER.pack(recv_ns, data.get("E", 0), data.get("U", 0), data.get("u", 0),
+                                len(bids), len(asks))
+    values = array("q")
+    _pack_levels(bids, values)
+    _pack_levels(asks, values)
+    return header + values.tobytes()
+
+
+def unpack_records(payload, symbol=None):
+    # Decodes a decompressed chunk payload back into (receive time, message) pairs.
+    # The messages have the same shape as the WebSocket ones, with float levels instead of strings.
+    offset = 0
+    end = len(payload)
+    view = memoryview(payload)
+    while offset < end:
+        recv_ns, event_time, first_id, last_id, n_bids, n_asks = RECORD_HEADER.unpack_from(payload, offset)
+        offset += RECORD_HEADER.size
+        n_bid_values, n_values = n_bids * 2, (n_bids + n_asks) * 2
+        values = view[offset:offset + n_values * 8].cast("q").tolist()
+        offset += n_values * 8
+        message = {"e": "depthUpdate", "E": event_time, "s": symbol, "U": first_id, "u": last_id,
+                   "b": _unpack_levels(values[:n_bid_values]), "a": _unpack_levels(values[n_bid_values:])}
+        yield recv_ns, message
+
+
+def read_header(f):
+    # Reads and validates the file header, returning the metadata and the offset of the first chunk.
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("Not a depth recording (bad magic bytes).")
+    (meta_len,) = struct.unpack("<I", f.read(4))
+    metadata = json.loads(f.read(meta_len))
+    return metadata, len(MAGIC) + 4 + meta_len
+
+
+def iter_chunks(f, start_offset):
+    # Yields (offset, chunk header fields, compressed payload) for every complete chunk in the file.
+    # A chunk cut short by a crash at the end of the file is ignored.
+    f.seek(start_offset)
+    while True:
+        offset = f.tell()
+        header = f.read(CHUNK_HEADER.size)
+        if len(header) < CHUNK_HEADER.size:
+            return
+        marker, n_records, raw_len, comp_len, first_ns, last_ns, first_id, last_id = CHUNK_HEADER.unpack(header)
+        if marker != CHUNK_MARKER:
+            raise ValueError(f"Corrupt recording: bad chunk marker at offset {offset}.")
+        payload = f.read(comp_len)
+        if len(payload) < comp_len:
+            return
+        yield offset, (n_records, raw_len, first_ns, last_ns, first_id, last_id), payload
+
+
+def iter_records(path):
+    # Yields every (receive time in ns, message) pair stored in a recording file.
+    with open(path, "rb") as f:
+        metadata, start_offset = read_header(f)
+        for _, _, payload in iter_chunks(f, start_offset):
+            yield from unpack_records(zlib.decompress(payload), metadata.get("symbol"))
+
+
+def read_index(path):
+    # Returns the chunk index of a recording as a list of
+    # (offset, record count, first receive ns, last receive ns, first U, last u) tuples.
+    with open(path + INDEX_SUFFIX, "rb") as f:
+        data = f.read()
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return [INDEX_ENTRY.unpack_from(data, offset) for offset in range(0, usable, INDEX_ENTRY.size)]
+
+
+# This class appends depth diffs to chunked, compressed recording files.
+# record() only puts the message on a queue; packing, compression, disk writes and file
+# rotation all happen on a background writer thread.
+class DepthRecorder:
+    def __init__(self, directory, symbol="BTCUSDT", chunk_records=1000, flush_interval=5.0,
+                 max_file_bytes=256 * 1024 * 1024, rotate_interval=24 * 3600, max_queue=100_000,
+                 compression_level=6):
+        self.directory = directory
+        self.symbol = symbol
+        # A chunk is written once it holds chunk_records messages or is flush_interval seconds old.
+        self.chunk_records = chunk_records
+        self.flush_interval = flush_interval
+        # A new file is started once the current one reaches max_file_bytes or rotate_interval seconds.
+        self.max_file_bytes = max_file_bytes
+        self.rotate_interval = rotate_interval
+        self.compression_level = compression_level
+
+        # The queue is bounded so a stalled disk cannot grow memory without limit.
+        # Messages that do not fit are counted in `dropped` rather than blocking the caller.
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        # Messages that could not be packed (e.g. malformed levels), skipped and counted.
+        self.bad_records = 0
+        # The exception that stopped the writer thread (e.g. a full disk). Once set, nothing more
+        # is written and record() counts every message as dropped; the receive loop should stop.
+        self.error = None
+        self.records_written = 0
+        self.bytes_written = 0
+        self.files = []
+
+        self._file = None
+        self._index = None
+        self._file_opened_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="depth-recorder", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        # Number of messages queued but not yet packed into a chunk.
+        return self._queue.qsize()
+
+    def record(self, data, recv_ns=None):
+        # Called from the receive loop: stamps the message and hands it to the writer thread.
+        if self.error is not None:
+            self.dropped += 1
+            return
+        if recv_ns is None:
+            recv_ns = time.time_ns()
+        try:
+            self._queue.put_nowait((recv_ns, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=60.0):
+        # Flushes everything still queued, writes the last chunk and closes the files. A writer
+        # thread that has died is not waited on, and a stalled one only for timeout seconds.
+        if self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Writer thread ---
+    def _run(self):
+        try:
+            self._write_loop()
+        except Exception as e:
+            self.error = e
+            print(f"\nRecorder stopped: {e!r}")
+        finally:
+            try:
+                self._close_file()
+            except OSError:
+                pass
+
+    def _write_loop(self):
+        records, first, last = [], None, None
+        chunk_started = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - chunk_started))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                recv_ns, data = item
+                try:
+                    records.append(pack_record(recv_ns, data))
+                except (ValueError, TypeError, KeyError, IndexError, OverflowError, struct.error):
+                    # One malformed message is skipped rather than stopping the recording.
+                    self.bad_records += 1
+                    continue
+                if first is None:
+                    first = (recv_ns, data.get("U", 0))
+                last = (recv_ns, data.get("u", 0))
+            if records and (len(records) >= self.chunk_records
+                            or time.monotonic() - chunk_started >= self.flush_interval):
+                self._write_chunk(records, first, last)
+                records, first, last = [], None, None
+            if not records:
+                chunk_started = time.monotonic()
+        if records:
+            self._write_chunk(records, first, last)
+
+    def _write_chunk(self, records, first, last):
+        if self._file is None or self._should_rotate():
+            self._open_file()
+        raw = b"".join(records)
+        payload = zlib.compress(raw, self.compression_level)
+        offset = self._file.tell()
+        header = CHUNK_HEADER.pack(CHUNK_MARKER, len(records), len(raw), len(payload),
+                                   first[0], last[0], first[1], last[1])
+        self._file.write(header)
+        self._file.write(payload)
+        self._file.flush()
+        # The index entry is only written once its chunk is fully on disk.
+        self._index.write(INDEX_ENTRY.pack(offset, len(records), first[0], last[0], first[1], last[1]))
+        self._index.flush()
+        self.records_written += len(records)
+        self.bytes_written += len(header) + len(payload)
+
+    def _should_rotate(self):
+        return (self._file.tell() >= self.max_file_bytes
+                or time.monotonic() - self._file_opened_at >= self.rotate_interval)
+
+    def _open_file(self):
+        self._close_file()
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        path = os.path.join(self.directory, f"{self.symbol.lower()}_{stamp}{FILE_SUFFIX}")
+        # Two rotations within the same second get a numeric suffix instead of overwriting.
+        counter = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{self.symbol.lower()}_{stamp}_{counter}{FILE_SUFFIX}")
+            counter += 1
+        metadata = json.dumps({"version": FORMAT_VERSION, "symbol": self.symbol,
+                               "created_ns": time.time_ns()}).encode()
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + struct.pack("<I", len(metadata)) + metadata)
+        self._index = open(path + INDEX_SUFFIX, "wb")
+        self._file_opened_at = time.monotonic()
+        self.files.append(path)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = self._index = None
+
+
+async def record_stream(directory):
+    uri = "wss://stream.binance.com:9443/ws/btcusdt@depth@100ms"
+    with DepthRecorder(directory, symbol="BTCUSDT") as recorder:
+        async with websockets.connect(uri) as ws:
+            print(f"Recording {uri} to {directory}...")
+            while True:
+                if recorder.error is not None:
+                    raise RuntimeError(f"Recording failed: {recorder.error}") from recorder.error
+                msg = await ws.recv()
+                # Stamp the receive time before parsing so it reflects when the frame arrived.
+                recv_ns = time.time_ns()
+                # The recorder keeps the exact decimal strings, so only the JSON parse is sped up.
+                recorder.record(loads(msg), recv_ns)
+                sys.stdout.write(f"\rQueued: {recorder.records_written + recorder.pending} "
+                                 f"| Written: {recorder.bytes_written / 1024:.1f} KiB | Dropped: {recorder.dropped} "
+                                 f"| Bad: {recorder.bad_records}")
+                sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, "recordings")
+    try:
+        asyncio.run(record_stream(output_dir))
+    except KeyboardInterrupt:
+        print("\n\nRecording stopped by user.")
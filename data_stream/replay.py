@@ -0,0 +1,162 @@
+# This file replays recorded depth diffs (see recorder.py) through the same async interface as
+# the Binance WebSocket, so the OrderBook -> FeatureExtractor pipeline can run offline.
+# Recordings are memory-mapped and decoded one chunk at a time. By default messages are
+# delivered as fast as the consumer can take them; a speed multiple paces them against the
+# original receive timestamps instead (speed=1 is real time, speed=10 is ten times faster).
+
+import asyncio
+import json
+import mmap
+import time
+import zlib
+
+from data_stream.recorder import CHUNK_HEADER, CHUNK_MARKER, read_header, read_index, unpack_records
+
+
+# Raised by recv() once every recorded message has been delivered.
+class ReplayFinished(EOFError):
+    pass
+
+
+def iter_recording(path, start_update_id=None):
+    # Yields (receive time in ns, message) pairs from a memory-mapped recording file.
+    # With start_update_id, whole chunks that end before that update ID are skipped using the
+    # index, and so are the individual messages before it.
+    with open(path, "rb") as f:
+        metadata, offset = read_header(f)
+        symbol = metadata.get("symbol")
+        if start_update_id is not None:
+            try:
+                for chunk_offset, _, _, _, _, last_id in read_index(path):
+                    if last_id >= start_update_id:
+                        offset = chunk_offset
+                        break
+                else:
+                    return
+            except FileNotFoundError:
+                # Without an index every chunk is scanned; messages are still filtered below.
+                pass
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            while offset + CHUNK_HEADER.size <= size:
+                marker, _, _, comp_len, _, _, _, last_id = CHUNK_HEADER.unpack_from(mm, offset)
+                if marker != CHUNK_MARKER:
+                    raise ValueError(f"Corrupt recording: bad chunk marker at offset {offset}.")
+                start = offset + CHUNK_HEADER.size
+                # A chunk cut short by a crash at the end of the file is ignored.
+                if start + comp_len > size:
+                    return
+                offset = start + comp_len
+                if start_update_id is not None and last_id < start_update_id:
+                    continue
+                payload = zlib.decompress(mm[start:offset])
+                for recv_ns, message in unpack_records(payload, symbol):
+                    if start_update_id is not None and message["u"] < start_update_id:
+                        continue
+                    yield recv_ns, message
+
+
+# A stand-in for a websockets connection that serves recorded messages.
+class ReplayStream:
+    def __init__(self, paths, speed=None, raw=True, start_update_id=None):
+        # One or more recording files, replayed in the order given (e.g. rotated files of one day).
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        # None or 0 replays at maximum speed; otherwise a multiple of the recorded pace.
+        self.speed = speed
+        # With raw=True recv() returns JSON text exactly like the WebSocket does. With raw=False it
+        # returns the decoded message dict and skips the JSON round trip entirely.
+        self.raw = raw
+        self.start_update_id = start_update_id
+        self.messages_sent = 0
+        self._records = self._iter_records()
+        self._first_recv_ns = None
+        self._started_at = None
+
+    def _iter_records(self):
+        for path in self.paths:
+            yield from iter_recording(path, self.start_update_id)
+
+    async def recv(self):
+        try:
+            recv_ns, message = next(self._records)
+        except StopIteration:
+            raise ReplayFinished(f"Replay finished after {self.messages_sent} messages.") from None
+
+        if self.speed:
+            # Sleep until this message is due relative to the first one, scaled by the speed.
+            if self._first_recv_ns is None:
+                self._first_recv_ns, self._started_at = recv_ns, time.perf_counter()
+            due = self._started_at + (recv_ns - self._first_recv_ns) / 1e9 / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        self.messages_sent += 1
+        return json.dumps(message) if self.raw else message
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.recv()
+        except ReplayFinished:
+            raise StopAsyncIteration from None
+
+    async def close(self):
+        self._records.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+# Mirrors websockets.connect so callers can swap a live URI for a recording.
+def connect_replay(paths, speed=None, raw=True, start_update_id=None):
+    return ReplayStream(paths, speed=speed, raw=raw, start_update_id=start_update_id)
+
+
+# Reads recordings into memory with their levels as strings, the way the exchange sends them.
+def load_depth_messages(paths):
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    messages = [message for path in paths for _, message in iter_recording(path)]
+    if not messages:
+        raise ValueError(f"No messages in {paths}")
+    for message in messages:
+        message["b"] = [[f"{price:.8f}", f"{qty:.8f}"] for price, qty in message["b"]]
+        message["a"] = [[f"{price:.8f}", f"{qty:.8f}"] for price, qty in message["a"]]
+    return messages
+
+
+# Serves recorded diffs (from load_depth_messages) as an endless live stream for the stand-in
+# exchange (stand_in_server.py), with the same next_message() as SyntheticDepthStream. One
+# recording can stand in for any number of symbols: each message is relabelled with the symbol it
+# is served as. When the recording runs out it starts again from the top, and the update IDs jump
+# ahead so consumers see a gap and resync from a fresh snapshot rather than apply the start of the
+# recording on top of its end.
+class RecordedDepthStream:
+    # How far the update IDs jump when the recording starts over.
+    RESTART_GAP = 1_000
+
+    def __init__(self, messages, symbol):
+        self.messages = messages
+        self.symbol = symbol.upper()
+        self.position = 0
+        self.loops = 0
+        self.id_offset = 0
+        self.last_update_id = 0
+
+    def next_message(self):
+        if self.position == len(self.messages):
+            self.position = 0
+            self.loops += 1
+            self.id_offset = self.last_update_id + self.RESTART_GAP - self.messages[0]["U"]
+        message = dict(self.messages[self.position])
+        self.position += 1
+        message["s"] = self.symbol
+        message["U"] += self.id_offset
+        message["u"] += self.id_offset
+        self.last_update_id = message["u"]
+        return message
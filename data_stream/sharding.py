@@ -0,0 +1,290 @@
+# This script spreads symbols over several worker processes, so book maintenance and feature
+# extraction (pure Python, and bound by the GIL in one process) can use every core.
+#   - The supervisor hashes each symbol to a shard with crc32, so a symbol always lands on the
+#     same worker for a given worker count, whatever order the symbols are listed in.
+#   - Each worker is a process running its own MultiSymbolRunner (multi_symbol.py): its own
+#     combined-stream connection for its symbols, its own books, extractors and book sync, and
+#     optionally its own copy of the model. Nothing is shared, so workers never contend.
+#   - Results come back over one one-way pipe per worker. A worker buffers results and sends them
+#     as a single pickled list every few milliseconds, so the channel costs one write per batch
+#     rather than one per row.
+#   - The supervisor waits on the pipes and the process sentinels together. A worker that dies is
+#     restarted on its own, after a short delay, while the other workers carry on; its books
+#     start again from fresh snapshots.
+# See benchmarks/bench_sharding.py for how throughput scales with the number of workers.
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import zlib
+from collections import deque
+from functools import partial
+from multiprocessing.connection import wait
+
+import websockets
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from data_stream.book_sync import snapshot_provider
+from data_stream.multi_symbol import MultiSymbolRunner, BINANCE_URI, combined_stream_uri, load_symbol_configs
+from data_stream.replay import ReplayFinished
+from utils.metrics import PipelineMetrics
+
+# How often a worker sends its buffered results, and how many it buffers before sending early.
+FLUSH_INTERVAL = 0.02
+MAX_RESULTS_PER_SEND = 1000
+
+
+# The shard a symbol belongs to. The 32-bit hash is scaled to the worker count rather than taken
+# modulo it: crc32's low bits barely change between similar names such as SYM1USDT and SYM3USDT,
+# while its high bits spread them evenly.
+def shard_for(symbol, workers):
+    return zlib.crc32(symbol.upper().encode()) * workers >> 32
+
+
+def assign_shards(configs, workers):
+    shards = [[] for _ in range(workers)]
+    for config in configs:
+        shards[shard_for(config.symbol, workers)].append(config)
+    return shards
+
+
+# The default source of a worker: one combined-stream connection for its symbols.
+def live_source(symbols, uri=BINANCE_URI):
+    return websockets.connect(combined_stream_uri(symbols, uri), max_size=None)
+
+
+# Runs inside a worker process. Results are sent as ("results", [(symbol, row, label, confidence), ...]),
+# with label and confidence None when no model is loaded, and the worker's stats as ("done", stats)
+# when its source ends.
+class ShardWorker:
+    def __init__(self, index, configs, conn, source_factory, snapshots=None, model_path=None, max_batch=1000):
+        self.index = index
+        self.conn = conn
+        self.source_factory = source_factory
+        # Each worker records its own stage latencies and reports them with its stats.
+        self.metrics = PipelineMetrics()
+        self.runner = MultiSymbolRunner(configs, snapshots, on_row=self.on_row, max_batch=max_batch,
+                                        metrics=self.metrics)
+        # Filled by the event loop (rows) or the inference thread (predictions), drained by flush().
+        self.results = deque()
+        self.sent = 0
+        self.inference = None
+        if model_path:
+            # Only workers that predict pay for importing XGBoost.
+            from model.artifact import load_artifact
+            from model.inference import Predictor
+            from model.inference_worker import InferenceWorker
+            artifact = load_artifact(model_path)
+            # One thread per booster: the cores are already shared out between the workers.
+            artifact.booster.set_param({"nthread": 1})
+            self.inference = InferenceWorker(Predictor(artifact.booster, artifact.feature_order),
+                                             on_result=self.on_prediction, metrics=self.metrics)
+
+    def on_row(self, symbol, row):
+        if self.inference is not None:
+            self.inference.submit(symbol, row)
+        else:
+            self.results.append((symbol, row, None, None))
+
+    def on_prediction(self, symbol, row, label, confidence, proba):
+        self.results.append((symbol, row, label, confidence))
+
+    def flush(self):
+        results = self.results
+        while results:
+            batch = [results.popleft() for _ in range(min(len(results), MAX_RESULTS_PER_SEND))]
+            self.conn.send(("results", batch))
+            self.sent += len(batch)
+
+    async def flush_forever(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    async def run(self):
+        flusher = asyncio.get_running_loop().create_task(self.flush_forever())
+        try:
+            async with self.source_factory(self.runner.symbols) as source:
+                await self.runner.run(source)
+        except ReplayFinished:
+            pass
+        finally:
+            flusher.cancel()
+        if self.inference is not None:
+            self.inference.close()
+        self.flush()
+        stats = {
+            "worker": self.index,
+            "symbols": self.runner.stats(),
+            "messages": self.runner.ingest.received if self.runner.ingest else 0,
+            "results": self.sent,
+            "latency": self.metrics.summary(),
+        }
+        self.conn.send(("done", stats))
+
+
+def worker_main(index, configs, conn, source_factory, snapshots, model_path, max_batch):
+    # Ctrl+C is handled by the supervisor, which stops the workers itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = ShardWorker(index, configs, conn, source_factory, snapshots, model_path, max_batch)
+    asyncio.run(worker.run())
+    conn.close()
+
+
+class ShardSupervisor:
+    def __init__(self, configs, workers, source_factory=live_source, snapshots=None, model_path=None,
+                 on_results=None, max_batch=1000, restart_delay=1.0):
+        # Shards without symbols get no process.
+        self.shards = [shard for shard in assign_shards(configs, workers) if shard]
+        self.source_factory = source_factory
+        self.snapshots = snapshots
+        self.model_path = model_path
+        # Called as on_results(worker, results) with each list of results a worker sends.
+        self.on_results = on_results
+        self.max_batch = max_batch
+        self.restart_delay = restart_delay
+        self.processes = [None] * len(self.shards)
+        self.conns = [None] * len(self.shards)
+        # Worker stats from the ("done", stats) message each sends when its source ends.
+        self.finished = {}
+        self.restarts = [0] * len(self.shards)
+        self.results = [0] * len(self.shards)
+        # Restarts waiting for their delay: worker index -> due time.
+        self._due = {}
+        self._stopping = False
+
+    def start_worker(self, index):
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=worker_main, name=f"shard-{index}", daemon=True,
+            args=(index, self.shards[index], writer, self.source_factory, self.snapshots, self.model_path,
+                  self.max_batch))
+        process.start()
+        # The parent keeps only the read end, so the pipe reports EOF once the worker is gone.
+        writer.close()
+        self.processes[index] = process
+        self.conns[index] = reader
+
+    def start(self):
+        for index in range(len(self.shards)):
+            self.start_worker(index)
+
+    def _receive(self, index):
+        try:
+            kind, payload = self.conns[index].recv()
+        except EOFError:
+            self.conns[index] = None
+            return
+        if kind == "results":
+            self.results[index] += len(payload)
+            if self.on_results is not None:
+                self.on_results(index, payload)
+        elif kind == "done":
+            self.finished[index] = payload
+
+    def _reap(self, index):
+        process = self.processes[index]
+        process.join()
+        self.processes[index] = None
+        # Read whatever the worker sent before it exited.
+        while self.conns[index] is not None and self.conns[index].poll():
+            self._receive(index)
+        if self.conns[index] is not None:
+            self.conns[index].close()
+            self.conns[index] = None
+        if index in self.finished or self._stopping:
+            return
+        print(f"\nWorker {index} exited with code {process.exitcode}; restarting it.")
+        self.restarts[index] += 1
+        self._due[index] = time.monotonic() + self.restart_delay
+
+    def run(self, timeout=None):
+        # Supervises the workers until every one has finished (replay or synthetic sources), the
+        # timeout expires, or stop() is called.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not any(self.processes):
+            self.start()
+        while not self._stopping and len(self.finished) < len(self.shards):
+            now = time.monotonic()
+            for index, due in list(self._due.items()):
+                if due <= now:
+                    del self._due[index]
+                    self.start_worker(index)
+            if deadline is not None and now >= deadline:
+                break
+            waits = [due - now for due in self._due.values()] + ([deadline - now] if deadline else [])
+            handles = {}
+            for index, (process, conn) in enumerate(zip(self.processes, self.conns)):
+                if conn is not None:
+                    handles[conn] = ("conn", index)
+                if process is not None:
+                    handles[process.sentinel] = ("exit", index)
+            for handle in wait(list(handles), timeout=max(0.0, min(waits)) if waits else None):
+                kind, index = handles[handle]
+                if kind == "conn" and self.conns[index] is not None:
+                    self._receive(index)
+                elif kind == "exit" and self.processes[index] is not None:
+                    self._reap(index)
+
+    def stop(self):
+        self._stopping = True
+        for process in self.processes:
+            if process is not None:
+                process.terminate()
+        for index, process in enumerate(self.processes):
+            if process is not None:
+                process.join()
+                self.processes[index] = None
+
+    def stats(self):
+        return {
+            "workers": len(self.shards),
+            "symbols": [[config.symbol for config in shard] for shard in self.shards],
+            "alive": [process is not None and process.is_alive() for process in self.processes],
+            "restarts": list(self.restarts),
+            "results": list(self.results),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shard symbols across worker processes.")
+    parser.add_argument("--symbols", nargs="+", metavar="SYMBOL", help="Symbols to subscribe, e.g. btcusdt ethusdt.")
+    parser.add_argument("--config", metavar="PATH", help="JSON file of per-symbol depth, window and tick size.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: one per core).")
+    parser.add_argument("--uri", default=BINANCE_URI,
+                        help="Base URI of the combined stream, e.g. ws://127.0.0.1:8765 for the stand-in server.")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Take depth snapshots from JSON files, e.g. snapshots/{symbol}.json.")
+    parser.add_argument("--snapshot-url", default=None,
+                        help="REST depth endpoint to take snapshots from (default: Binance).")
+    parser.add_argument("--model", metavar="PATH", help="Model artifact each worker loads to predict on its rows.")
+    args = parser.parse_args()
+    if not args.symbols and not args.config:
+        parser.error("give --symbols, --config or both")
+
+    received = [0]
+
+    def count_results(worker, results):
+        received[0] += len(results)
+        sys.stdout.write(f"\rResults received: {received[0]}")
+        sys.stdout.flush()
+
+    supervisor = ShardSupervisor(load_symbol_configs(args.config, args.symbols), args.workers,
+                                 source_factory=partial(live_source, uri=args.uri),
+                                 snapshots=snapshot_provider(args.snapshot, args.snapshot_url),
+                                 model_path=args.model, on_results=count_results)
+    for index, symbols in enumerate(supervisor.stats()["symbols"]):
+        print(f"Worker {index}: {', '.join(symbols)}")
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        print("\nStopping workers...")
+    finally:
+        supervisor.stop()
+        stats = supervisor.stats()
+        print(f"Results per worker: {stats['results']}, restarts: {stats['restarts']}")
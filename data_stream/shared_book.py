@@ -0,0 +1,230 @@
+# This file publishes order books and feature rows into shared memory, so one feed handler
+# (feed_handler.py) can serve any number of local consumers: the dashboard, predict_live.py and
+# generate_dataset.py read from it instead of each opening a WebSocket and rebuilding the book.
+#
+# Segment layout (one multiprocessing.shared_memory block, little-endian):
+#   header: MAGIC, HEADER fields, JSON schema (symbols with their depth and window, row columns),
+#           padded to a multiple of 64 bytes
+#   slots:  one fixed-size record per symbol, in schema order:
+#       seq          seqlock counter of the book fields below: odd while the writer is mid-update
+#       update_id    last update ID applied to the book ('u')
+#       event_time   exchange event time of that update ('E', ms)
+#       published_ns local time of the last publication (time.time_ns), to spot a stalled feed
+#       bid_count, ask_count, bids, asks   the top `depth` levels as (price, qty) floats
+#       rows_written total feature rows pushed into the ring
+#       ring         the last `ring_size` feature rows, one float per column
+#
+# There is a single writer per segment. A book is read by copying its slot between two reads of
+# seq and retrying if seq was odd or changed, so a reader never sees a half-written book and the
+# writer never waits for readers. Rows are written into the ring before rows_written is bumped,
+# so every row below rows_written is complete; a reader that falls more than a ring behind loses
+# the oldest rows and is told how many. Reading costs a copy of a few hundred bytes: there is no
+# socket, JSON or book maintenance on the consumer side.
+
+import json
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAGIC = b"LOBSHM\x01\x00"
+FORMAT_VERSION = 1
+# magic, version, schema length, depth, ring size, symbol count
+HEADER = struct.Struct("<8sIIIII")
+# The columns of the rows FeatureExtractor emits for a single horizon.
+ROW_COLUMNS = ("mid_price", "weighted_mid_price", "spread", "ofi", "voi", "label")
+DEFAULT_NAME = "lob_feed"
+# How often a reader retries a book the writer keeps changing before giving up on this read.
+MAX_READ_RETRIES = 1000
+
+
+def slot_dtype(depth, ring_size, columns):
+    return np.dtype([
+        ("seq", "<u8"),
+        ("update_id", "<u8"),
+        ("event_time", "<i8"),
+        ("published_ns", "<i8"),
+        ("bid_count", "<u4"),
+        ("ask_count", "<u4"),
+        ("bids", "<f8", (depth, 2)),
+        ("asks", "<f8", (depth, 2)),
+        ("rows_written", "<u8"),
+        ("ring", "<f8", (ring_size, len(columns))),
+    ])
+
+
+def _padded(size, alignment=64):
+    return (size + alignment - 1) // alignment * alignment
+
+
+# The field views over a segment's slots, shared by the writer and the readers.
+class _SharedLayout:
+    def __init__(self, shm, schema, depth, ring_size, offset):
+        self.shm = shm
+        self.schema = schema
+        self.depth = depth
+        self.ring_size = ring_size
+        self.columns = schema["columns"]
+        self.symbols = [entry["symbol"] for entry in schema["symbols"]]
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.slots = np.ndarray(len(self.symbols), dtype=slot_dtype(depth, ring_size, self.columns),
+                                buffer=shm.buf, offset=offset)
+        # Per-field views, so single fields are read and written without building records.
+        self.seq = self.slots["seq"]
+        self.rows_written = self.slots["rows_written"]
+        self.ring = self.slots["ring"]
+
+    def symbol_index(self, symbol):
+        try:
+            return self.index[symbol.upper()]
+        except KeyError:
+            raise ValueError(f"{symbol.upper()} is not published in this feed (symbols: {self.symbols})") from None
+
+    def symbol_config(self, symbol):
+        return self.schema["symbols"][self.symbol_index(symbol)]
+
+    def release(self):
+        # NumPy views must go before the buffer can be closed.
+        self.slots = self.seq = self.rows_written = self.ring = None
+
+
+class SharedBookWriter(_SharedLayout):
+    def __init__(self, configs, name=DEFAULT_NAME, depth=20, ring_size=1024, columns=ROW_COLUMNS):
+        # configs are SymbolConfig objects (multi_symbol.py); depth is how many levels are published.
+        schema = {
+            "symbols": [{"symbol": config.symbol, "depth": config.depth, "window": config.window}
+                        for config in configs],
+            "columns": list(columns),
+        }
+        encoded = json.dumps(schema).encode()
+        offset = _padded(HEADER.size + len(encoded))
+        size = offset + slot_dtype(depth, ring_size, columns).itemsize * len(configs)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:offset] = bytes(offset)
+        shm.buf[HEADER.size:HEADER.size + len(encoded)] = encoded
+        super().__init__(shm, schema, depth, ring_size, offset)
+        self.name = name
+        self.bids = self.slots["bids"]
+        self.asks = self.slots["asks"]
+        # The header goes in last, so a reader never attaches to a half-initialised segment.
+        shm.buf[:HEADER.size] = HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded), depth, ring_size, len(configs))
+
+    def publish_book(self, index, order_book, update_id=0, event_time=0):
+        top_bids, top_asks = order_book.get_top_levels(self.depth)
+        slot = self.slots[index]
+        seq = self.seq
+        seq[index] += 1
+        if top_bids:
+            self.bids[index, :len(top_bids)] = top_bids
+        if top_asks:
+            self.asks[index, :len(top_asks)] = top_asks
+        slot["bid_count"] = len(top_bids)
+        slot["ask_count"] = len(top_asks)
+        slot["update_id"] = update_id
+        slot["event_time"] = event_time
+        slot["published_ns"] = time.time_ns()
+        seq[index] += 1
+
+    def publish_row(self, index, row):
+        written = int(self.rows_written[index])
+        self.ring[index, written % self.ring_size] = [row[column] for column in self.columns]
+        self.rows_written[index] = written + 1
+
+    def close(self, unlink=True):
+        self.release()
+        self.bids = self.asks = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class SharedBookReader(_SharedLayout):
+    def __init__(self, name=DEFAULT_NAME):
+        shm = shared_memory.SharedMemory(name=name)
+        # Before Python 3.13 attaching registers the segment with this process's resource tracker,
+        # which would unlink it from under the feed handler when this reader exits.
+        resource_tracker.unregister(shm._name, "shared_memory")
+        magic, version, schema_length, depth, ring_size, _ = HEADER.unpack_from(shm.buf)
+        if magic != MAGIC:
+            shm.close()
+            raise ValueError(f"Shared memory {name!r} is not an order book feed.")
+        if version != FORMAT_VERSION:
+            shm.close()
+            raise ValueError(f"Unsupported feed version {version} (expected {FORMAT_VERSION}).")
+        schema = json.loads(bytes(shm.buf[HEADER.size:HEADER.size + schema_length]))
+        super().__init__(shm, schema, depth, ring_size, _padded(HEADER.size + schema_length))
+        self.name = name
+        # Reads that found the writer mid-update and had to go round again.
+        self.retries = 0
+
+    def book(self, symbol):
+        # A consistent copy of the symbol's published book as a dict: bids and asks are lists of
+        # (price, qty) from the touch outwards. Returns None if the writer never let go of it.
+        index = self.symbol_index(symbol)
+        seq, slots = self.seq, self.slots
+        for _ in range(MAX_READ_RETRIES):
+            before = seq[index]
+            if not before & 1:
+                slot = slots[index].copy()
+                if seq[index] == before:
+                    return {
+                        "bids": [tuple(level) for level in slot["bids"][:slot["bid_count"]].tolist()],
+                        "asks": [tuple(level) for level in slot["asks"][:slot["ask_count"]].tolist()],
+                        "update_id": int(slot["update_id"]),
+                        "event_time": int(slot["event_time"]),
+                        "published_ns": int(slot["published_ns"]),
+                    }
+            self.retries += 1
+            # Let the writer finish, which matters when both share a core.
+            time.sleep(0)
+        return None
+
+    def rows_written_for(self, symbol):
+        return int(self.rows_written[self.symbol_index(symbol)])
+
+    def rows_since(self, symbol, cursor):
+        # Returns (rows, new cursor, lost): the rows written since cursor (a rows_written value
+        # from an earlier call, or 0), and how many were overwritten before they could be read.
+        index = self.symbol_index(symbol)
+        ring_size = self.ring_size
+        written = int(self.rows_written[index])
+        start = max(cursor, written - ring_size)
+        values = [self.ring[index, position % ring_size].tolist() for position in range(start, written)]
+        # The writer may have lapped the oldest rows while they were copied.
+        safe_from = int(self.rows_written[index]) - ring_size + 1
+        skip = max(0, safe_from - start)
+        lost = (start - cursor) + min(skip, len(values))
+        rows = [self._row(value) for value in values[skip:]]
+        return rows, written, lost
+
+    def latest_row(self, symbol):
+        written = self.rows_written_for(symbol)
+        if written == 0:
+            return None
+        rows, _, _ = self.rows_since(symbol, written - 1)
+        return rows[-1] if rows else None
+
+    def _row(self, values):
+        row = dict(zip(self.columns, values))
+        for column in self.columns:
+            if column.startswith("label"):
+                row[column] = int(row[column])
+        return row
+
+    def close(self):
+        self.release()
+        self.shm.close()
+
+
+# Waits for a feed handler to create the segment, e.g. when a consumer starts first. A segment
+# that exists but has no header yet (its feed handler is still setting it up) is waited for too.
+def attach_reader(name=DEFAULT_NAME, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return SharedBookReader(name)
+        except (FileNotFoundError, ValueError, struct.error):
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.1)
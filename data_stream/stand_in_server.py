@@ -0,0 +1,296 @@
+# This script runs a local stand-in for the Binance depth stream and REST depth endpoint, so
+# multi-symbol consumers can be exercised without network access. Every symbol gets its own seeded
+# synthetic stream (synthetic_stream.py), published every --interval-ms on:
+#   ws://HOST:PORT/ws/<symbol>@depth@100ms                 raw stream, one symbol
+#   ws://HOST:PORT/stream?streams=<symbol>@depth@100ms/... combined stream, {"stream", "data"} frames
+#   http://HOST:PORT/api/v3/depth?symbol=<SYMBOL>&limit=N  depth snapshot with lastUpdateId
+# Snapshots come from a book the server keeps for each symbol by applying its own diffs, so they
+# line up with the update IDs on the streams exactly like the real exchange's do.
+# Symbols are created the first time they are requested, and each is seeded from its name.
+#
+# For load and soak testing of the live scripts (see benchmarks/soak.py):
+#   --rate         diffs per second per symbol, from a few to thousands; several diffs are sent per
+#                  wake-up when the rate is faster than the event loop can sleep
+#   --replay       serve recorded diffs (recorder.py) instead of synthetic ones, looped, for every
+#                  symbol; event times are always stamped with the server's clock
+#   --gap-every    leave one diff in every N per symbol unsent (it still reaches the snapshot book),
+#                  so consumers see a sequence gap and must resync
+#   --disconnect-every  close every client connection every N seconds, as the exchange does to
+#                  long-lived connections, so consumers must reconnect
+# broadcast() queues frames for a client that does not read them without limit, so a client whose
+# unsent data passes MAX_CLIENT_BUFFER has diffs skipped until it catches up. It sees them as
+# sequence gaps and must resync, and the server's memory stays bounded (counted as slow_gaps).
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+from websockets.asyncio.server import broadcast, serve
+from websockets.exceptions import ConnectionClosed
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from utils.order_book_cache import OrderBook
+from data_stream.synthetic_stream import SyntheticDepthStream
+from data_stream.replay import RecordedDepthStream, load_depth_messages
+
+# Messages generated for each symbol before it is served, so its first snapshot has depth.
+WARM_UP_MESSAGES = 500
+# At most this many diffs per symbol are sent in one wake-up; a server further behind than that
+# skips ahead and counts the rounds it missed rather than bursting.
+MAX_ROUNDS_PER_WAKE = 1000
+# Bytes of unsent frames a connection may hold before diffs are skipped for it.
+MAX_CLIENT_BUFFER = 1 << 20
+
+
+# One symbol's synthetic stream, the server's copy of its book and its subscribers.
+class StandInSymbol:
+    def __init__(self, symbol, seed=0, levels_per_message=20, recorded=None, gap_every=None):
+        self.symbol = symbol.upper()
+        # recorded: messages from load_depth_messages, served instead of a synthetic stream.
+        if recorded:
+            self.stream = RecordedDepthStream(recorded, self.symbol)
+        else:
+            self.stream = SyntheticDepthStream(symbol=self.symbol, seed=seed + zlib.crc32(self.symbol.encode()),
+                                               levels_per_message=levels_per_message)
+        self.order_book = OrderBook(depth=20)
+        self.last_update_id = 0
+        # Leave one diff in every gap_every unsent.
+        self.gap_every = gap_every
+        self.published = 0
+        self.gaps = 0
+        # Diffs skipped for connections too far behind, one per connection and diff.
+        self.slow_gaps = 0
+        self._loops = 0
+        # Connections receiving the raw stream, and combined-stream connections by stream name.
+        self.raw_subscribers = set()
+        self.combined_subscribers = {}
+        for _ in range(WARM_UP_MESSAGES):
+            self.next_message()
+
+    def next_message(self):
+        message = self.stream.next_message()
+        # A looped recording starts again from its own first book, so the snapshot book does too.
+        if getattr(self.stream, "loops", 0) != self._loops:
+            self._loops = self.stream.loops
+            self.order_book.clear()
+        self.order_book.update(message)
+        self.last_update_id = message["u"]
+        # Event times follow the server's clock, so consumers' event lag means something.
+        message["E"] = time.time_ns() // 1_000_000
+        return message
+
+    def snapshot(self, limit=1000):
+        # The REST format: price and quantity strings with Binance's 8 decimal places.
+        return {
+            "lastUpdateId": self.last_update_id,
+            "bids": [[f"{price:.8f}", f"{qty:.8f}"] for price, qty in self.order_book.bids.top(limit)],
+            "asks": [[f"{price:.8f}", f"{qty:.8f}"] for price, qty in self.order_book.asks.top(limit)],
+        }
+
+    def publish(self):
+        # Generates the next diff and sends it to every subscriber. The JSON is encoded once per
+        # frame format, and broadcast() never waits on a slow connection.
+        message = self.next_message()
+        self.published += 1
+        if self.gap_every and self.published % self.gap_every == 0:
+            self.gaps += 1
+            return
+        data = json.dumps(message, separators=(",", ":"))
+        if self.raw_subscribers:
+            broadcast(self.keeping_up(self.raw_subscribers), data)
+        for stream_name, connections in self.combined_subscribers.items():
+            if connections:
+                broadcast(self.keeping_up(connections), f'{{"stream":"{stream_name}","data":{data}}}')
+
+    def keeping_up(self, connections):
+        # The connections whose send buffers have room for another frame; the rest miss this diff.
+        ready = []
+        for connection in connections:
+            transport = connection.transport
+            if transport is not None and transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                self.slow_gaps += 1
+            else:
+                ready.append(connection)
+        return ready
+
+    def unsubscribe(self, connection):
+        self.raw_subscribers.discard(connection)
+        for connections in self.combined_subscribers.values():
+            connections.discard(connection)
+
+
+class StandInExchange:
+    def __init__(self, symbols=(), interval_ms=100, seed=0, levels_per_message=20, replay_paths=None,
+                 gap_every=None, disconnect_every=None):
+        # Diffs per second per symbol.
+        self.rate = 1000 / interval_ms
+        self.seed = seed
+        self.levels_per_message = levels_per_message
+        # Recordings are read once and served for every symbol.
+        self.recorded = load_depth_messages(replay_paths) if replay_paths else None
+        self.gap_every = gap_every
+        self.disconnect_every = disconnect_every
+        self.symbols = {}
+        self.connections = set()
+        self.messages_sent = 0
+        # Publishing rounds skipped because the server itself could not keep up with the rate.
+        self.rounds_skipped = 0
+        self.disconnects = 0
+        for symbol in symbols:
+            self.get_symbol(symbol)
+
+    def get_symbol(self, symbol):
+        symbol = symbol.upper()
+        if symbol not in self.symbols:
+            self.symbols[symbol] = StandInSymbol(symbol, self.seed, self.levels_per_message, self.recorded,
+                                                 self.gap_every)
+        return self.symbols[symbol]
+
+    def stats(self):
+        return {
+            "symbols": len(self.symbols),
+            "connections": len(self.connections),
+            "messages_sent": self.messages_sent,
+            "gaps": sum(state.gaps for state in self.symbols.values()),
+            "slow_gaps": sum(state.slow_gaps for state in self.symbols.values()),
+            "disconnects": self.disconnects,
+            "rounds_skipped": self.rounds_skipped,
+        }
+
+    def process_request(self, connection, request):
+        # Plain HTTP requests for depth snapshots are answered here; anything else carries on
+        # with the WebSocket handshake.
+        url = urlparse(request.path)
+        if url.path != "/api/v3/depth":
+            return None
+        query = parse_qs(url.query)
+        if "symbol" not in query:
+            return connection.respond(400, '{"code":-1102,"msg":"Mandatory parameter \'symbol\' was not sent."}\n')
+        limit = int(query.get("limit", ["100"])[0])
+        snapshot = self.get_symbol(query["symbol"][0]).snapshot(limit)
+        response = connection.respond(200, json.dumps(snapshot))
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    def subscriptions(self, path):
+        # Returns (symbol, stream name, combined) for each stream a connection path asks for.
+        url = urlparse(path)
+        if url.path.startswith("/ws/"):
+            return [(url.path[len("/ws/"):].split("@")[0], url.path[len("/ws/"):], False)]
+        if url.path == "/stream":
+            streams = parse_qs(url.query).get("streams", [""])[0]
+            return [(name.split("@")[0], name, True) for name in streams.split("/") if name]
+        return []
+
+    async def handler(self, connection):
+        subscribed = []
+        for symbol, stream_name, combined in self.subscriptions(connection.request.path):
+            state = self.get_symbol(symbol)
+            if combined:
+                state.combined_subscribers.setdefault(stream_name, set()).add(connection)
+            else:
+                state.raw_subscribers.add(connection)
+            subscribed.append(state)
+        if not subscribed:
+            await connection.close(1008, "no depth streams requested")
+            return
+        self.connections.add(connection)
+        try:
+            # Clients never send anything that needs an answer; wait for them to disconnect.
+            async for _ in connection:
+                pass
+        except ConnectionClosed:
+            pass
+        finally:
+            self.connections.discard(connection)
+            for state in subscribed:
+                state.unsubscribe(connection)
+
+    async def publish_forever(self):
+        # Rounds (one diff per symbol) are due at a fixed rate from the start time, so slow
+        # rounds do not make the rate drift, and every round that is due is sent on each wake-up.
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        rounds = 0
+        while True:
+            due = int((loop.time() - start) * self.rate) - rounds
+            if due > MAX_ROUNDS_PER_WAKE and self.symbols:
+                self.rounds_skipped += due - MAX_ROUNDS_PER_WAKE
+            for _ in range(min(due, MAX_ROUNDS_PER_WAKE)):
+                for state in list(self.symbols.values()):
+                    state.publish()
+                    self.messages_sent += 1
+            rounds += max(due, 0)
+            await asyncio.sleep(max(0.0, start + (rounds + 1) / self.rate - loop.time()))
+
+    async def disconnect_forever(self):
+        while True:
+            await asyncio.sleep(self.disconnect_every)
+            connections = list(self.connections)
+            self.disconnects += len(connections)
+            # 1001 "going away", as the exchange sends before dropping a connection.
+            await asyncio.gather(*(connection.close(1001, "stand-in disconnect") for connection in connections),
+                                 return_exceptions=True)
+
+    async def report_forever(self, interval):
+        sent = self.messages_sent
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats()
+            rate = (stats["messages_sent"] - sent) / interval
+            sent = stats["messages_sent"]
+            print(f"{stats['symbols']} symbols, {stats['connections']} connections: {rate:,.0f} msgs/s, "
+                  f"{stats['gaps']} gaps, {stats['slow_gaps']} skipped for slow clients, "
+                  f"{stats['disconnects']} disconnects, "
+                  f"{stats['rounds_skipped']} rounds skipped", flush=True)
+
+    async def serve(self, host="127.0.0.1", port=8765, report_every=None):
+        async with serve(self.handler, host, port, process_request=self.process_request, max_size=None) as server:
+            loop = asyncio.get_running_loop()
+            tasks = [loop.create_task(self.publish_forever())]
+            if self.disconnect_every:
+                tasks.append(loop.create_task(self.disconnect_forever()))
+            if report_every:
+                tasks.append(loop.create_task(self.report_forever(report_every)))
+            try:
+                await server.serve_forever()
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic depth streams and snapshots locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--symbols", nargs="*", default=[], metavar="SYMBOL",
+                        help="Symbols to start before any client connects (others start on request).")
+    parser.add_argument("--interval-ms", type=float, default=100, help="Time between diffs of each symbol.")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Diffs per second per symbol, instead of --interval-ms (e.g. 10 to 5000).")
+    parser.add_argument("--levels", type=int, default=20, help="Level updates per side of each diff.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", nargs="+", metavar="RECORDING",
+                        help="Serve these recorded diffs, looped, for every symbol instead of synthetic ones.")
+    parser.add_argument("--gap-every", type=int, default=None, metavar="N",
+                        help="Leave one diff in every N per symbol unsent, to make consumers resync.")
+    parser.add_argument("--disconnect-every", type=float, default=None, metavar="SECONDS",
+                        help="Close every client connection this often, to make consumers reconnect.")
+    parser.add_argument("--report-every", type=float, default=None, metavar="SECONDS",
+                        help="Print the send rate, connections and injected faults this often.")
+    args = parser.parse_args()
+    interval_ms = 1000 / args.rate if args.rate else args.interval_ms
+    exchange = StandInExchange(args.symbols, interval_ms, args.seed, args.levels, args.replay, args.gap_every,
+                               args.disconnect_every)
+    print(f"Serving depth streams on ws://{args.host}:{args.port} and snapshots on "
+          f"http://{args.host}:{args.port}/api/v3/depth", flush=True)
+    try:
+        asyncio.run(exchange.serve(args.host, args.port, args.report_every))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
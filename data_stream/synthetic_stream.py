@@ -0,0 +1,118 @@
+# This file generates synthetic depth-diff messages in the same format as the Binance
+# `@depth` WebSocket stream. It is seeded, so the same settings always produce the same
+# messages, which makes it suitable for benchmarks and offline runs without network access.
+
+import json
+import random
+
+from data_stream.replay import ReplayFinished
+
+
+class SyntheticDepthStream:
+    def __init__(self, symbol="BTCUSDT", seed=0, start_price=100000.0, tick_size=0.01, lot_size=0.00001,
+                 book_depth=500, levels_per_message=20, volatility=2.0, interval_ms=100,
+                 start_time_ms=1_700_000_000_000):
+        self.symbol = symbol
+        self.rng = random.Random(seed)
+        self.tick_size = tick_size
+        self.lot_size = lot_size
+        # How many ticks either side of the mid the generated levels can reach.
+        self.book_depth = book_depth
+        # How many level updates each side of a message contains.
+        self.levels_per_message = levels_per_message
+        # Standard deviation of the mid-price random walk per message, in ticks.
+        self.volatility = volatility
+        # Time between messages, used for the event time ('E') field.
+        self.interval_ms = interval_ms
+        self.event_time = start_time_ms
+        # The mid-price is tracked in ticks so generated prices always sit on the tick grid.
+        self.mid_ticks = round(start_price / tick_size)
+        # The last update ID, used for the 'U' and 'u' sequence fields.
+        self.last_update_id = 0
+        # Prices (in ticks) currently resting on each side, so levels that the mid-price moves
+        # through can be removed and the book never crosses.
+        self.bid_ticks = set()
+        self.ask_ticks = set()
+
+    def _format(self, value, step):
+        # Binance sends prices and quantities as strings with 8 decimal places.
+        return f"{value * step:.8f}"
+
+    def _levels(self, side_sign):
+        resting = self.bid_ticks if side_sign < 0 else self.ask_ticks
+        # First remove any level the mid-price has moved through.
+        if side_sign < 0:
+            crossed = [price for price in resting if price >= self.mid_ticks]
+        else:
+            crossed = [price for price in resting if price <= self.mid_ticks]
+        levels = []
+        for price in crossed:
+            resting.discard(price)
+            levels.append([self._format(price, self.tick_size), self._format(0, self.lot_size)])
+        for _ in range(self.levels_per_message):
+            # Updates cluster near the touch, like real order flow does.
+            distance = 1 + int(self.rng.expovariate(1 / 10)) % self.book_depth
+            price = self.mid_ticks + side_sign * distance
+            # Roughly one update in four removes the level entirely.
+            if self.rng.random() < 0.25:
+                lots = 0
+            else:
+                lots = 1 + int(self.rng.expovariate(1 / 20000))
+            if lots:
+                resting.add(price)
+            else:
+                resting.discard(price)
+            levels.append([self._format(price, self.tick_size), self._format(lots, self.lot_size)])
+        return levels
+
+    def next_message(self):
+        # Move the mid-price, then build one depth update around it.
+        self.mid_ticks += round(self.rng.gauss(0, self.volatility))
+        self.event_time += self.interval_ms
+        first_update_id = self.last_update_id + 1
+        bids, asks = self._levels(-1), self._levels(1)
+        self.last_update_id = first_update_id + len(bids) + len(asks) - 1
+        return {
+            "e": "depthUpdate",
+            "E": self.event_time,
+            "s": self.symbol,
+            "U": first_update_id,
+            "u": self.last_update_id,
+            "b": bids,
+            "a": asks
+        }
+
+    def messages(self, count):
+        return [self.next_message() for _ in range(count)]
+
+    def __iter__(self):
+        while True:
+            yield self.next_message()
+
+
+# Serves pre-generated combined-stream frames ({"stream", "data"} JSON text, symbols interleaved
+# the way a combined stream delivers them) through the async interface of a websockets connection.
+# Benchmarks use it to drive the live code paths without a network or a server.
+class SyntheticCombinedStream:
+    def __init__(self, symbols, messages_per_symbol, seed=0, **stream_args):
+        streams = [SyntheticDepthStream(symbol=symbol.upper(), seed=seed + i, **stream_args)
+                   for i, symbol in enumerate(symbols)]
+        self.frames = []
+        for _ in range(messages_per_symbol):
+            for stream in streams:
+                data = json.dumps(stream.next_message(), separators=(",", ":"))
+                self.frames.append(f'{{"stream":"{stream.symbol.lower()}@depth@100ms","data":{data}}}')
+        self._frames = iter(self.frames)
+
+    async def recv(self):
+        try:
+            return next(self._frames)
+        except StopIteration:
+            # The same end-of-stream signal as a finished replay.
+            raise ReplayFinished from None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
@@ -0,0 +1,149 @@
+# This file computes the same features and labels as FeatureExtractor, but over a whole batch of
+# order book snapshots at once with NumPy instead of one message at a time.
+# It is meant for offline dataset builds over millions of messages, where the per-message
+# interpreter overhead of the streaming path dominates.
+#
+# The input is columnar: top-N snapshots of each side as arrays of shape (T, N, 2) holding
+# (price, qty) per level, best level first, with NaN where a side has fewer than N levels.
+# VOI also needs the per-message change in resting volume on each side, which the snapshots
+# alone cannot provide, so it is passed in as two arrays of shape (T,).
+# Every arithmetic step mirrors the streaming path in the same order, so the results match it
+# bit-for-bit on the same input. In tick mode the streaming path works on Python ints, which never
+# round; float64 matches them exactly up to 2**53, and the few weighted mid-prices whose products
+# go beyond that are recomputed with ints (ticks and lots themselves must stay below 2**53).
+
+import numpy as np
+
+from utils.order_book_cache import OrderBook
+from microstructure.feature_engineering import calculate_volume_changes
+from microstructure.rolling_labeller import label_columns, reference_columns
+
+
+# Replays depth-diff messages through an OrderBook and captures the columnar input for
+# compute_batch_features: top-N snapshots per side and the per-message volume changes.
+def capture_snapshots(messages, depth=20, order_book=None):
+    if order_book is None:
+        order_book = OrderBook(depth=depth)
+    bid_rows, ask_rows, bid_changes, ask_changes = [], [], [], []
+    for data in messages:
+        changes = order_book.update(data)
+        bid_change, ask_change = calculate_volume_changes(changes)
+        bid_changes.append(bid_change)
+        ask_changes.append(ask_change)
+        bid_rows.append(order_book.bids.top(depth))
+        ask_rows.append(order_book.asks.top(depth))
+
+    def to_array(rows):
+        snapshots = np.full((len(rows), depth, 2), np.nan)
+        for t, levels in enumerate(rows):
+            if levels:
+                snapshots[t, :len(levels)] = levels
+        return snapshots
+
+    return {
+        "bids": to_array(bid_rows),
+        "asks": to_array(ask_rows),
+        "bid_volume_change": np.array(bid_changes, dtype=np.float64),
+        "ask_volume_change": np.array(ask_changes, dtype=np.float64),
+    }
+
+
+def compute_batch_features(bids, asks, bid_volume_change, ask_volume_change, window=30,
+                           tick_size=None, lot_size=None, horizons=None):
+    # A single horizon of `window` messages by default, exactly like FeatureExtractor.
+    horizons = sorted(set(horizons)) if horizons else [window]
+    columns = reference_columns(horizons) + ["weighted_mid_price", "spread", "ofi", "voi"] + label_columns(horizons)
+    best_bid_price, best_bid_qty = bids[:, 0, 0], bids[:, 0, 1]
+    best_ask_price, best_ask_qty = asks[:, 0, 0], asks[:, 0, 1]
+    steps = np.arange(len(bids))
+
+    # Messages where either side is empty produce nothing, as in the streaming path.
+    non_empty = ~np.isnan(best_bid_price) & ~np.isnan(best_ask_price)
+    non_empty_steps = np.flatnonzero(non_empty)
+    if len(non_empty_steps) == 0:
+        return {name: np.empty(0) for name in columns}
+    # The first non-empty message only sets the reference state for OFI and VOI.
+    first_step = non_empty_steps[0]
+
+    mid_price = (best_bid_price + best_ask_price) / 2
+    spread = best_ask_price - best_bid_price
+    # A valid spread is required for the dynamic threshold.
+    valid_steps = np.flatnonzero(non_empty & (steps > first_step) & (spread != 0))
+    # Each valid message measures flow against the previous valid message (or the first one).
+    reference_steps = np.concatenate(([first_step], valid_steps[:-1]))
+
+    # --- Weighted mid-price ---
+    bp, bq = best_bid_price[valid_steps], best_bid_qty[valid_steps]
+    ap, aq = best_ask_price[valid_steps], best_ask_qty[valid_steps]
+    total_qty = bq + aq
+    with np.errstate(divide="ignore", invalid="ignore"):
+        wmp = np.where(total_qty == 0, (bp + ap) / 2, (bp * aq + ap * bq) / total_qty)
+    if tick_size is not None:
+        # Products this large were rounded in float64; the streaming path's ints were not.
+        for i in np.flatnonzero((total_qty != 0) & (np.abs(bp * aq) + np.abs(ap * bq) >= 2.0 ** 52)):
+            wmp[i] = (int(bp[i]) * int(aq[i]) + int(ap[i]) * int(bq[i])) / int(total_qty[i])
+
+    # --- Order Flow Imbalance from the best levels ---
+    prev_bp, prev_bq = best_bid_price[reference_steps], best_bid_qty[reference_steps]
+    prev_ap, prev_aq = best_ask_price[reference_steps], best_ask_qty[reference_steps]
+    bid_flow = np.where(bp > prev_bp, bq, np.where(bp == prev_bp, bq - prev_bq, -prev_bq))
+    ask_flow = np.where(ap < prev_ap, aq, np.where(ap == prev_ap, aq - prev_aq, -prev_aq))
+    ofi = bid_flow - ask_flow
+
+    # --- Volume Order Imbalance ---
+    # Volume changes accumulate from just after the reference message up to and including the
+    # current one. The sums are built one offset at a time, so each segment is added in message
+    # order exactly like the streaming accumulator. Segments are almost always one message long.
+    segment_start = reference_steps + 1
+    segment_length = valid_steps - reference_steps
+    pending_bid = np.zeros(len(valid_steps))
+    pending_ask = np.zeros(len(valid_steps))
+    for offset in range(segment_length.max() if len(valid_steps) else 0):
+        active = segment_length > offset
+        pending_bid[active] += bid_volume_change[segment_start[active] + offset]
+        pending_ask[active] += ask_volume_change[segment_start[active] + offset]
+    voi = pending_bid - pending_ask
+
+    # --- Dynamic Labelling Logic ---
+    # A row is emitted once the longest horizon has a full window of valid mid-prices. As in the
+    # streaming path, the row carries the mid-price each horizon is measured from and the other
+    # features from the current message.
+    max_horizon = horizons[-1]
+    mids = mid_price[valid_steps]
+    valid_spread = spread[valid_steps]
+    rows = len(mids) - max_horizon
+    if rows <= 0:
+        return {name: np.empty(0) for name in columns}
+    dynamic_threshold = valid_spread[max_horizon:] * 0.5
+
+    references = {}
+    labels = {}
+    for reference, column, horizon in zip(reference_columns(horizons), label_columns(horizons), horizons):
+        # The streaming labeller slides a running sum by adding each new price and, once the window
+        # is full, the difference between the new price and the one leaving the window.
+        # np.cumsum adds strictly left to right, so it reproduces those sums exactly.
+        steps_in = mids.copy()
+        steps_in[horizon:] = mids[horizon:] - mids[:-horizon]
+        window_sums = np.cumsum(steps_in)[max_horizon:]
+        average_future_price = window_sums / horizon
+        price_at_event = mids[max_horizon - horizon:len(mids) - horizon]
+        up = average_future_price > price_at_event + dynamic_threshold
+        down = ~up & (average_future_price < price_at_event - dynamic_threshold)
+        # Default to STABLE (0), then mark UP (2) and DOWN (1).
+        label = np.zeros(rows, dtype=np.int64)
+        label[up] = 2
+        label[down] = 1
+        references[reference] = price_at_event
+        labels[column] = label
+
+    # Convert from fixed-point units back to floats if the book ran in tick mode.
+    price_scale = 1 if tick_size is None else tick_size
+    qty_scale = 1 if lot_size is None else lot_size
+    return {
+        **{reference: price * price_scale for reference, price in references.items()},
+        "weighted_mid_price": wmp[max_horizon:] * price_scale,
+        "spread": valid_spread[max_horizon:] * price_scale,
+        "ofi": ofi[max_horizon:] * qty_scale,
+        "voi": voi[max_horizon:] * qty_scale,
+        **labels,
+    }
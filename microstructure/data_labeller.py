@@ -1,47 +1,79 @@
 # This is the core of the data pipeline.
 # It takes live order book data, calculates all features, and creates a label.
 # The labelling is dynamic, based on whether the future price moves more than a fraction
-# of the current bid-ask spread, making it adaptive to market volatility.
+# of the current bid-ask spread, making it adaptive to market volatility (see rolling_labeller.py).
 
 import csv
-from collections import deque
 import os
-import numpy as np
 
 from microstructure.feature_engineering import (
     calculate_mid_price,
     calculate_spread,
-    calculate_ofi,
-    calculate_weighted_mid_price,
-    calculate_voi
+    calculate_weighted_mid_price
 )
+from microstructure.order_flow import OrderFlowEngine
+from microstructure.rolling_labeller import RollingLabeller
+from microstructure.feature_sinks import ListSink
 
 
 class FeatureExtractor:
-    def __init__(self, depth=20, window=30):
+    def __init__(self, depth=20, window=30, tick_size=None, lot_size=None, horizons=None, sink=None):
         self.depth = depth
-        # The forward-looking window (in number of messages) for creating labels.
-        self.window = window
-        # Store the previous state of the book for calculating OFI and VOI.
-        self.prev_bids = {}
-        self.prev_asks = {}
-        # A deque to store the recent history of mid-prices for labelling.
-        self.mid_prices = deque(maxlen=window + 1)
-        # A list to accumulate rows of features and labels before saving.
-        self.feature_rows = []
-
-    def update(self, current_bids, current_asks):
+        # When the order book runs in fixed-point mode, prices arrive as integer ticks and
+        # quantities as integer lots. Features are calculated in those units and only
+        # converted back to floats when a row is emitted.
+        self.price_scale = 1 if tick_size is None else tick_size
+        self.qty_scale = 1 if lot_size is None else lot_size
+        # The forward-looking windows (in number of messages) for creating labels. By default a
+        # single horizon of `window` messages produces the "label" column; several horizons
+        # produce one "label_<h>" column each.
+        self.horizons = sorted(set(horizons)) if horizons else [window]
+        self.window = self.horizons[-1]
+        # Tracks the best levels and volume changes between messages for OFI and VOI.
+        self.order_flow = OrderFlowEngine()
+        # Keeps the recent history of mid-prices and running sums for labelling.
+        self.labeller = RollingLabeller(self.horizons)
+        # Where emitted rows go (see feature_sinks.py). By default every row is kept in memory
+        # until saved; live processes pass a NullSink or RingSink so memory stays bounded.
+        self.sink = sink if sink is not None else ListSink()
+
+    def reset(self, keep_history=False):
+        # Forgets the flow reference and the mid-price history, e.g. after the book was resynced
+        # from a snapshot: neither the jump to the snapshot nor prices from before a sequence
+        # gap should leak into features or labels. Rows already emitted are kept.
+        # keep_history keeps the mid-prices, for a gap of only a few seconds such as a restart
+        # restored from a checkpoint (see data_stream/checkpoint.py).
+        self.order_flow = OrderFlowEngine()
+        if not keep_history:
+            self.labeller = RollingLabeller(self.horizons)
+
+    def state(self):
+        # Everything needed to carry on from the current message, e.g. after a restart.
+        return {"order_flow": self.order_flow.state(), "labeller": self.labeller.state()}
+
+    def load_state(self, state):
+        # The labeller checks the horizons first, so a mismatched state changes nothing.
+        self.labeller.load_state(state["labeller"])
+        self.order_flow.load_state(state["order_flow"])
+
+    @property
+    def feature_rows(self):
+        # The rows the sink has retained (all of them for the default ListSink).
+        return self.sink.rows
+
+    def update(self, current_bids, current_asks, changes):
+        # Fold this message's level changes (as returned by OrderBook.update) into the flow totals.
+        self.order_flow.apply(changes)
         # Do nothing if the order book is empty.
         if not current_bids or not current_asks: return None
-        # On the first run, just store the state and wait for the next update.
-        if not self.prev_bids:
-            self.prev_bids = current_bids
-            self.prev_asks = current_asks
+        # On the first run, just store the best levels and wait for the next update.
+        if not self.order_flow.has_reference:
+            self.order_flow.set_reference(current_bids.best(), current_asks.best())
             return None
 
-        # Sort bids and asks for accurate feature calculation.
-        sorted_bids = sorted(current_bids.items(), key=lambda x: -x[0])
-        sorted_asks = sorted(current_asks.items(), key=lambda x: x[0])
+        # The book sides keep their prices sorted, so only the touch is read here.
+        sorted_bids = current_bids.top(1)
+        sorted_asks = current_asks.top(1)
 
         # Calculate all features for the current state.
         mid_price = calculate_mid_price(sorted_bids, sorted_asks)
@@ -52,49 +84,31 @@ class FeatureExtractor:
             return None
 
         wmp = calculate_weighted_mid_price(sorted_bids, sorted_asks)
-        ofi = calculate_ofi(current_bids, current_asks, self.prev_bids, self.prev_asks)
-        voi = calculate_voi(current_bids, current_asks, self.prev_bids, self.prev_asks)
-
-        # Update previous state for the next iteration.
-        self.prev_bids = current_bids
-        self.prev_asks = current_asks
+        # OFI and VOI since the previous update; this also moves the reference state forward.
+        ofi, voi = self.order_flow.flow(sorted_bids[0], sorted_asks[0])
 
         if any(v is None for v in [wmp]): return None
 
-        # Add the current mid-price to our historical deque.
-        self.mid_prices.append(mid_price)
-
-        # We need a full window of mid-prices to create a label.
-        if len(self.mid_prices) < self.window + 1: return None
-
         # --- Dynamic Labelling Logic ---
-        # The price corresponding to our calculated features.
-        price_at_event = self.mid_prices[0]
-        # The prices that occurred *after* our event.
-        future_prices = list(self.mid_prices)[1:]
-        average_future_price = np.mean(future_prices)
-
-        # The threshold is a fraction of the spread, making it adaptive to volatility.
-        dynamic_threshold = spread * 0.5
-
-        # Default to STABLE (0).
-        label = 0
-        if average_future_price > price_at_event + dynamic_threshold:
-            label = 2  # UP
-        elif average_future_price < price_at_event - dynamic_threshold:
-            label = 1  # DOWN
-
-        # Assemble the final row with features and the calculated label.
+        # The labeller returns nothing until it has a full window of mid-prices.
+        labelled = self.labeller.push(mid_price, spread)
+        if labelled is None: return None
+        references, labels = labelled
+
+        # Assemble the final row with features and the calculated labels, in float units.
+        # The mid-price each horizon is measured from is "mid_price" for a single horizon and
+        # "mid_price_<h>" for each of several.
+        price_scale, qty_scale = self.price_scale, self.qty_scale
         row = {
-            "mid_price": price_at_event,
-            "weighted_mid_price": wmp,
-            "spread": spread,
-            "ofi": ofi,
-            "voi": voi,
-            "label": label
+            **{column: price * price_scale for column, price in references.items()},
+            "weighted_mid_price": wmp * price_scale,
+            "spread": spread * price_scale,
+            "ofi": ofi * qty_scale,
+            "voi": voi * qty_scale,
+            **labels
         }
 
-        self.feature_rows.append(row)
+        self.sink.append(row)
         return row
 
     def save_to_csv(self, filename="orderbook_features.csv"):
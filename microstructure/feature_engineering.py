@@ -85,3 +85,44 @@ def calculate_voi(current_bids, current_asks, prev_bids, prev_asks):
 
     # VOI is the net change in bid volume minus the net change in ask volume.
     return bid_volume_change - ask_volume_change
+
+
+# Calculates OFI from the best (price, qty) level of each side alone.
+# It follows the same rules as calculate_ofi, but needs no scan over the whole book.
+def calculate_ofi_from_best(current_best_bid, current_best_ask, prev_best_bid, prev_best_ask):
+    prev_bid_price, prev_bid_qty = prev_best_bid if prev_best_bid else (0, 0)
+    prev_ask_price, prev_ask_qty = prev_best_ask if prev_best_ask else (float('inf'), 0)
+
+    current_bid_price, current_bid_qty = current_best_bid if current_best_bid else (0, 0)
+    current_ask_price, current_ask_qty = current_best_ask if current_best_ask else (float('inf'), 0)
+
+    # Calculate flow on the bid side based on price changes.
+    if current_bid_price > prev_bid_price:
+        bid_flow = current_bid_qty
+    elif current_bid_price == prev_bid_price:
+        bid_flow = current_bid_qty - prev_bid_qty
+    else:
+        bid_flow = -prev_bid_qty
+
+    # Calculate flow on the ask side.
+    if current_ask_price < prev_ask_price:
+        ask_flow = current_ask_qty
+    elif current_ask_price == prev_ask_price:
+        ask_flow = current_ask_qty - prev_ask_qty
+    else:
+        ask_flow = -prev_ask_qty
+
+    return bid_flow - ask_flow
+
+
+# Sums the change in resting volume on each side from the level changes returned by OrderBook.update.
+# Only levels touched by the message are visited, so the cost is O(changed levels).
+def calculate_volume_changes(changes):
+    bid_volume_change = 0
+    ask_volume_change = 0
+    for side, price, prev_qty, qty in changes:
+        if side == 'b':
+            bid_volume_change += qty - prev_qty
+        else:
+            ask_volume_change += qty - prev_qty
+    return bid_volume_change, ask_volume_change
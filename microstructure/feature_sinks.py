@@ -0,0 +1,219 @@
+# This file contains the sinks FeatureExtractor hands its rows to.
+# Which sink to use depends on the process:
+#   ListSink          keeps every row in memory (dataset generation; the original behaviour).
+#   NullSink          keeps nothing, for live inference where rows are used once and dropped.
+#   RingSink          keeps only the most recent rows, for the dashboard.
+#   ColumnarFileSink  streams rows to disk in fixed-size chunks of typed columns.
+#
+# Columnar file layout (.lobf):
+#   header: MAGIC, uint32 schema length, JSON schema (column names and NumPy dtypes)
+#   chunks: CHUNK_HEADER (marker, row count) followed by each column's raw values in schema order
+# Reading a chunk is one np.frombuffer call per column, with no text parsing at all.
+
+import json
+import os
+import struct
+from collections import deque
+
+import numpy as np
+
+MAGIC = b"LOBFEAT\x01"
+FORMAT_VERSION = 1
+FILE_SUFFIX = ".lobf"
+CHUNK_HEADER = struct.Struct("<4sI")
+CHUNK_MARKER = b"COLS"
+
+
+# Label columns are stored as integers and every feature as a float64.
+def column_dtype(name):
+    return "<i8" if name.startswith("label") else "<f8"
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+
+    def append(self, row):
+        self.rows.append(row)
+
+    def close(self):
+        pass
+
+
+class NullSink:
+    def __init__(self):
+        self.rows = ()
+        # Rows are still counted so progress can be reported.
+        self.count = 0
+
+    def append(self, row):
+        self.count += 1
+
+    def close(self):
+        pass
+
+
+class RingSink:
+    def __init__(self, maxlen=1000):
+        self.rows = deque(maxlen=maxlen)
+
+    def append(self, row):
+        self.rows.append(row)
+
+    def close(self):
+        pass
+
+
+# Writes the header and chunks of a columnar feature file.
+class ColumnarFileWriter:
+    def __init__(self, path, columns):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.columns = list(columns)
+        self.dtypes = [np.dtype(column_dtype(name)) for name in self.columns]
+        self.rows_written = 0
+        schema = json.dumps({
+            "version": FORMAT_VERSION,
+            "columns": [{"name": name, "dtype": dtype.str} for name, dtype in zip(self.columns, self.dtypes)]
+        }).encode()
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + struct.pack("<I", len(schema)) + schema)
+
+    def write_chunk(self, values_by_column):
+        # Takes one sequence (list or array) of values per column, all of the same length.
+        n_rows = len(values_by_column[0])
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MARKER, n_rows))
+        for values, dtype in zip(values_by_column, self.dtypes):
+            self._file.write(np.asarray(values, dtype=dtype).tobytes())
+        self._file.flush()
+        self.rows_written += n_rows
+
+    def close(self):
+        self._file.close()
+
+
+class ColumnarFileSink:
+    def __init__(self, path, chunk_rows=10_000):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.rows = ()
+        self.count = 0
+        # The schema is taken from the first row, so the file is created lazily.
+        self._writer = None
+        self._buffers = None
+
+    def append(self, row):
+        if self._writer is None:
+            self._writer = ColumnarFileWriter(self.path, row.keys())
+            self._buffers = [[] for _ in self._writer.columns]
+        for buffer, name in zip(self._buffers, self._writer.columns):
+            buffer.append(row[name])
+        self.count += 1
+        if len(self._buffers[0]) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self._buffers and self._buffers[0]:
+            self._writer.write_chunk(self._buffers)
+            self._buffers = [[] for _ in self._writer.columns]
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+
+
+# Writes a whole set of columns (name -> array) at once, e.g. from the batch feature path.
+def write_feature_file(path, columns, chunk_rows=100_000):
+    names = list(columns)
+    writer = ColumnarFileWriter(path, names)
+    n_rows = len(columns[names[0]]) if names else 0
+    for start in range(0, n_rows, chunk_rows):
+        writer.write_chunk([columns[name][start:start + chunk_rows] for name in names])
+    writer.close()
+
+
+def _read_schema(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a columnar feature file (bad magic bytes).")
+    (schema_len,) = struct.unpack("<I", f.read(4))
+    schema = json.loads(f.read(schema_len))
+    names = [column["name"] for column in schema["columns"]]
+    dtypes = [np.dtype(column["dtype"]) for column in schema["columns"]]
+    return names, dtypes
+
+
+# Views the raw bytes of one chunk as a {column: array} dict without copying.
+def _split_columns(data, names, dtypes, n_rows):
+    chunk, offset = {}, 0
+    for name, dtype in zip(names, dtypes):
+        chunk[name] = np.frombuffer(data, dtype=dtype, count=n_rows, offset=offset)
+        offset += n_rows * dtype.itemsize
+    return chunk
+
+
+# Yields one {column: array} dict per chunk. Only one chunk is held in memory at a time, so
+# files larger than memory can be streamed.
+def iter_feature_chunks(path):
+    with open(path, "rb") as f:
+        names, dtypes = _read_schema(f)
+        row_size = sum(dtype.itemsize for dtype in dtypes)
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+            marker, n_rows = CHUNK_HEADER.unpack(header)
+            if marker != CHUNK_MARKER:
+                raise ValueError(f"Corrupt feature file: bad chunk marker at offset {f.tell() - len(header)}.")
+            data = f.read(n_rows * row_size)
+            # A chunk cut short by a crash at the end of the file is ignored.
+            if len(data) < n_rows * row_size:
+                return
+            yield _split_columns(data, names, dtypes, n_rows)
+
+
+# Returns (offset, row count) for every complete chunk in a file by walking the chunk headers,
+# so individual chunks can later be read in any order with read_feature_chunk.
+def index_feature_chunks(path):
+    chunks = []
+    with open(path, "rb") as f:
+        names, dtypes = _read_schema(f)
+        row_size = sum(dtype.itemsize for dtype in dtypes)
+        size = os.fstat(f.fileno()).st_size
+        offset = f.tell()
+        while offset + CHUNK_HEADER.size <= size:
+            f.seek(offset)
+            marker, n_rows = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+            if marker != CHUNK_MARKER:
+                raise ValueError(f"Corrupt feature file: bad chunk marker at offset {offset}.")
+            end = offset + CHUNK_HEADER.size + n_rows * row_size
+            if end > size:
+                break
+            chunks.append((offset, n_rows))
+            offset = end
+    return chunks
+
+
+# Reads the single chunk starting at the given offset (as returned by index_feature_chunks).
+def read_feature_chunk(path, offset):
+    with open(path, "rb") as f:
+        names, dtypes = _read_schema(f)
+        f.seek(offset)
+        _, n_rows = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+        data = f.read(n_rows * sum(dtype.itemsize for dtype in dtypes))
+    return _split_columns(data, names, dtypes, n_rows)
+
+
+# Returns the column names stored in a columnar feature file without reading any rows.
+def read_feature_columns(path):
+    with open(path, "rb") as f:
+        return _read_schema(f)[0]
+
+
+# Reads a whole columnar feature file into one {column: array} dict.
+def read_feature_file(path):
+    chunks = list(iter_feature_chunks(path))
+    if not chunks:
+        return {}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
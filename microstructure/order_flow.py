@@ -0,0 +1,66 @@
+# This file contains the streaming order flow engine.
+# Instead of comparing the whole current book with a copy of the previous one, it consumes the
+# level changes each message applies and keeps running totals, so OFI and VOI cost
+# O(changed levels) per message with no full-book copy or scan.
+
+from microstructure.feature_engineering import calculate_ofi_from_best, calculate_volume_changes
+
+
+class OrderFlowEngine:
+    def __init__(self):
+        # Running totals of resting volume on each side of the book.
+        self.bid_volume = 0
+        self.ask_volume = 0
+        # Volume changes accumulated since the last reference point. Messages that do not
+        # produce features (e.g. an empty side) are carried over into the next VOI value.
+        self.pending_bid_change = 0
+        self.pending_ask_change = 0
+        # The best (price, qty) levels at the last reference point, used for OFI.
+        self.prev_best_bid = None
+        self.prev_best_ask = None
+
+    @property
+    def has_reference(self):
+        return self.prev_best_bid is not None and self.prev_best_ask is not None
+
+    def apply(self, changes):
+        # Fold the volume changes of one message into the running totals.
+        bid_change, ask_change = calculate_volume_changes(changes)
+        self.bid_volume += bid_change
+        self.ask_volume += ask_change
+        self.pending_bid_change += bid_change
+        self.pending_ask_change += ask_change
+
+    def set_reference(self, best_bid, best_ask):
+        # Start measuring flow from the given best levels, discarding anything pending.
+        self.prev_best_bid = best_bid
+        self.prev_best_ask = best_ask
+        self.pending_bid_change = 0
+        self.pending_ask_change = 0
+
+    def flow(self, best_bid, best_ask):
+        # Calculate OFI and VOI since the last reference point, then move the reference forward.
+        ofi = calculate_ofi_from_best(best_bid, best_ask, self.prev_best_bid, self.prev_best_ask)
+        voi = self.pending_bid_change - self.pending_ask_change
+        self.set_reference(best_bid, best_ask)
+        return ofi, voi
+
+    def state(self):
+        # The running totals and reference levels, e.g. for a checkpoint.
+        return {
+            "bid_volume": self.bid_volume,
+            "ask_volume": self.ask_volume,
+            "pending_bid_change": self.pending_bid_change,
+            "pending_ask_change": self.pending_ask_change,
+            "prev_best_bid": self.prev_best_bid,
+            "prev_best_ask": self.prev_best_ask,
+        }
+
+    def load_state(self, state):
+        self.bid_volume = state["bid_volume"]
+        self.ask_volume = state["ask_volume"]
+        self.pending_bid_change = state["pending_bid_change"]
+        self.pending_ask_change = state["pending_ask_change"]
+        # Saved levels may come back as lists (e.g. from JSON).
+        self.prev_best_bid = tuple(state["prev_best_bid"]) if state["prev_best_bid"] is not None else None
+        self.prev_best_ask = tuple(state["prev_best_ask"]) if state["prev_best_ask"] is not None else None
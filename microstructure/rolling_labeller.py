@@ -0,0 +1,112 @@
+# This file contains the rolling labeller used by FeatureExtractor.
+# It keeps the recent mid-prices in a fixed-size ring buffer and a running sum per horizon, so
+# labelling costs O(1) per message per horizon, and labels for several horizons (e.g. 10, 30,
+# 100 and 300 messages) come out of a single pass over the stream.
+#
+# For each horizon h the label compares the average of the last h mid-prices with the mid-price
+# h messages ago. If the average moved by more than half the current spread the label is UP (2)
+# or DOWN (1); otherwise it is STABLE (0). Rows also carry that mid-price h messages ago, which a
+# live extractor labelling a single horizon h emits as "mid_price".
+
+import re
+
+
+# Returns the output column names for a set of horizons. A single horizon keeps the original
+# "label" column; several horizons get one "label_<h>" column each.
+def label_columns(horizons):
+    horizons = sorted(set(horizons))
+    if len(horizons) == 1:
+        return ["label"]
+    return [f"label_{h}" for h in horizons]
+
+
+# Returns the column names for the mid-price each horizon is measured from: "mid_price" for a
+# single horizon, "mid_price_<h>" for each of several.
+def reference_columns(horizons):
+    horizons = sorted(set(horizons))
+    if len(horizons) == 1:
+        return ["mid_price"]
+    return [f"mid_price_{h}" for h in horizons]
+
+
+# Picks the dataset columns to train label_column on, as (columns to read, names in the model).
+# Every label column is left out. In a multi-horizon dataset the target's "mid_price_<h>" is
+# renamed "mid_price" and the other horizons' are left out, so the features match the rows a
+# live extractor labelling that horizon emits.
+def training_columns(columns, label_column):
+    match = re.fullmatch(r"label_(\d+)", label_column)
+    reference = f"mid_price_{match.group(1)}" if match else "mid_price"
+    sources, names = [], []
+    for column in columns:
+        if column.startswith("label") or (column.startswith("mid_price_") and column != reference):
+            continue
+        sources.append(column)
+        names.append("mid_price" if column == reference else column)
+    return sources, names
+
+
+class RollingLabeller:
+    def __init__(self, horizons=(30,)):
+        self.horizons = sorted(set(horizons))
+        if not self.horizons or self.horizons[0] < 1:
+            raise ValueError(f"Horizons must be positive message counts, got {horizons}")
+        self.max_horizon = self.horizons[-1]
+        self.columns = label_columns(self.horizons)
+        self.reference_columns = reference_columns(self.horizons)
+        # The ring holds the last max_horizon + 1 mid-prices: the oldest event and its whole window.
+        self._ring = [0.0] * (self.max_horizon + 1)
+        self._count = 0
+        # The running sum of the last h mid-prices, one per horizon.
+        self._sums = [0] * len(self.horizons)
+
+    def push(self, mid_price, spread):
+        # Adds the latest mid-price. Once a full window is available for the longest horizon,
+        # returns a {column: mid-price} dict of the price each horizon is measured from and a
+        # {column: label} dict.
+        ring = self._ring
+        size = len(ring)
+        position = self._count % size
+        ring[position] = mid_price
+        self._count += 1
+
+        # Slide each running sum forward: add the new price and drop the one leaving the window.
+        sums = self._sums
+        for i, horizon in enumerate(self.horizons):
+            if self._count > horizon:
+                sums[i] += mid_price - ring[(position - horizon) % size]
+            else:
+                sums[i] += mid_price
+
+        # We need a full window of mid-prices for the longest horizon to create a row.
+        if self._count < size:
+            return None
+
+        # The threshold is a fraction of the spread, making it adaptive to volatility.
+        dynamic_threshold = spread * 0.5
+        references = {}
+        labels = {}
+        for i, horizon in enumerate(self.horizons):
+            # The price the window starts from, and the average of the prices that came after it.
+            price_at_event = ring[(position - horizon) % size]
+            average_future_price = sums[i] / horizon
+            # Default to STABLE (0).
+            label = 0
+            if average_future_price > price_at_event + dynamic_threshold:
+                label = 2  # UP
+            elif average_future_price < price_at_event - dynamic_threshold:
+                label = 1  # DOWN
+            references[self.reference_columns[i]] = price_at_event
+            labels[self.columns[i]] = label
+
+        return references, labels
+
+    def state(self):
+        # A copy of the mid-price history and running sums, e.g. for a checkpoint.
+        return {"horizons": self.horizons, "ring": list(self._ring), "count": self._count, "sums": list(self._sums)}
+
+    def load_state(self, state):
+        if state["horizons"] != self.horizons:
+            raise ValueError(f"Saved horizons {state['horizons']} do not match {self.horizons}")
+        self._ring = list(state["ring"])
+        self._count = state["count"]
+        self._sums = list(state["sums"])
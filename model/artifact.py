@@ -0,0 +1,77 @@
+# This file contains the self-describing model artifact written by train_model.py and loaded by
+# the live scripts. It holds everything a live process needs in one file, so startup does not
+# depend on the training data (the feature order used to come from reading the whole CSV):
+#   header: MAGIC, uint32 metadata length, JSON metadata
+#   body:   the booster in XGBoost's native binary (UBJSON) format
+# The metadata records the feature order, the label map and the order book depth and window the
+# features were built with. Loading needs only json and xgboost; pandas is never imported.
+
+import json
+import os
+import struct
+import time
+
+import xgboost as xgb
+
+MAGIC = b"LOBMODL\x01"
+ARTIFACT_VERSION = 1
+FILE_SUFFIX = ".lobm"
+# Class names by label, as produced by the labellers.
+LABEL_NAMES = {0: "STABLE", 1: "DOWN", 2: "UP"}
+
+
+class ModelArtifact:
+    def __init__(self, booster, feature_order, label_map, depth, window, metadata=None):
+        self.booster = booster
+        self.feature_order = list(feature_order)
+        self.label_map = dict(label_map)
+        self.depth = depth
+        self.window = window
+        # Anything else worth keeping with the model, e.g. the label column and parameters.
+        self.metadata = metadata or {}
+
+
+def save_artifact(path, artifact):
+    metadata = json.dumps({
+        "version": ARTIFACT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "xgboost_version": xgb.__version__,
+        "feature_order": artifact.feature_order,
+        # JSON keys are strings, so labels are stored as [label, name] pairs.
+        "label_map": [[int(label), name] for label, name in sorted(artifact.label_map.items())],
+        "depth": artifact.depth,
+        "window": artifact.window,
+        "metadata": artifact.metadata,
+    }).encode()
+    model = artifact.booster.save_raw("ubj")
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write to a temporary file and rename it, so a live process never sees a half-written model.
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(metadata)) + metadata + model)
+    os.replace(temporary_path, path)
+
+
+def load_artifact(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a model artifact (bad magic bytes).")
+        (metadata_len,) = struct.unpack("<I", f.read(4))
+        metadata = json.loads(f.read(metadata_len))
+        model = f.read()
+    if metadata["version"] != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported model artifact version {metadata['version']} in {path}.")
+
+    booster = xgb.Booster()
+    booster.load_model(bytearray(model))
+    return ModelArtifact(
+        booster,
+        metadata["feature_order"],
+        {label: name for label, name in metadata["label_map"]},
+        metadata["depth"],
+        metadata["window"],
+        metadata["metadata"],
+    )
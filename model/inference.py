@@ -0,0 +1,163 @@
+# This file contains the low-latency inference path used by the live scripts.
+# The old path built a new array from a dict comprehension for every row and then ran the whole
+# ensemble twice through the sklearn wrapper (predict, then predict_proba). A Predictor instead:
+#   - copies the row into one feature buffer that is allocated once and reused;
+#   - runs the model once and derives both the class and its probability from that single call;
+#   - can optionally evaluate the trees itself with NumPy (CompiledTrees), which skips the
+#     per-call overhead of XGBoost and is faster for small models.
+
+import json
+from operator import itemgetter
+
+import numpy as np
+
+
+# The objectives the live scripts can serve, and how their raw margins become probabilities.
+SOFTMAX_OBJECTIVES = ("multi:softprob", "multi:softmax")
+SIGMOID_OBJECTIVES = ("binary:logistic",)
+
+
+def _softmax(margins):
+    exp = np.exp(margins - margins.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _binary_proba(positive):
+    # A binary model has one output, the probability of class 1; expand it to both classes.
+    return np.stack([1 - positive, positive], axis=-1)
+
+
+def _sigmoid(margins):
+    return _binary_proba(1 / (1 + np.exp(-margins[..., 0])))
+
+
+# A pure-NumPy evaluator for a trained XGBoost booster.
+# Every tree is flattened into shared node arrays. Leaves point back at themselves, so each row
+# can walk all trees at once for a fixed number of steps (the deepest tree's depth) with no
+# branching: after the last step every walk has landed on its leaf.
+class CompiledTrees:
+    def __init__(self, booster):
+        model = json.loads(booster.save_raw("json"))
+        learner = model["learner"]
+        self.objective = learner["objective"]["name"]
+        if self.objective not in SOFTMAX_OBJECTIVES + SIGMOID_OBJECTIVES:
+            raise ValueError(f"Cannot compile a model with objective '{self.objective}'.")
+        gradient_booster = learner["gradient_booster"]
+        if "model" not in gradient_booster:
+            raise ValueError(f"Only tree boosters can be compiled, found '{gradient_booster['name']}'.")
+        trees = gradient_booster["model"]["trees"]
+        tree_classes = gradient_booster["model"]["tree_info"]
+        self.n_outputs = max(int(learner["learner_model_param"]["num_class"]), 1)
+
+        left, right, feature, threshold, default_left, roots = [], [], [], [], [], []
+        depth, offset = 0, 0
+        for tree in trees:
+            roots.append(offset)
+            tree_left = np.asarray(tree["left_children"], dtype=np.int64)
+            tree_right = np.asarray(tree["right_children"], dtype=np.int64)
+            is_leaf = tree_left == -1
+            own_index = np.arange(len(tree_left)) + offset
+            # Leaves loop back to themselves; inner nodes point at their children.
+            left.append(np.where(is_leaf, own_index, tree_left + offset))
+            right.append(np.where(is_leaf, own_index, tree_right + offset))
+            feature.append(np.where(is_leaf, 0, tree["split_indices"]))
+            # For leaves XGBoost stores the leaf value in split_conditions.
+            threshold.append(tree["split_conditions"])
+            default_left.append(tree["default_left"])
+            depth = max(depth, self._tree_depth(tree_left, tree_right))
+            offset += len(tree_left)
+
+        self.n_trees = len(trees)
+        self.depth = depth
+        self._roots = np.asarray(roots, dtype=np.int64)
+        self._left = np.concatenate(left)
+        self._right = np.concatenate(right)
+        self._feature = np.concatenate(feature).astype(np.int64)
+        # XGBoost compares float32 feature values with float32 thresholds, so we do the same.
+        self._threshold = np.concatenate(threshold).astype(np.float32)
+        self._default_left = np.concatenate(default_left).astype(bool)
+        # A (trees, outputs) matrix that adds each tree's leaf value to the output it belongs to.
+        self._tree_outputs = np.zeros((self.n_trees, self.n_outputs))
+        self._tree_outputs[np.arange(self.n_trees), tree_classes] = 1
+
+        # The starting margin (base score) is not stored in one consistent form across XGBoost
+        # versions, so it is measured instead: the booster's margin for a probe row, minus what
+        # the trees alone give for that row.
+        probe = np.zeros((1, booster.num_features()), dtype=np.float32)
+        booster_margin = np.asarray(booster.inplace_predict(probe, predict_type="margin"), dtype=np.float64)
+        self._bias = booster_margin.reshape(self.n_outputs) - self._tree_margins(probe)[0]
+
+    @staticmethod
+    def _tree_depth(left, right):
+        depth, level = 0, [0]
+        while level:
+            level = [child for node in level for child in (left[node], right[node]) if child != -1]
+            depth += bool(level)
+        return depth
+
+    def _tree_margins(self, features):
+        # Walks every (row, tree) pair down to its leaf and sums the leaf values per output.
+        rows = np.arange(len(features))[:, None]
+        nodes = np.broadcast_to(self._roots, (len(features), self.n_trees))
+        for _ in range(self.depth):
+            values = features[rows, self._feature[nodes]]
+            go_left = np.where(np.isnan(values), self._default_left[nodes], values < self._threshold[nodes])
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+        return self._threshold[nodes].astype(np.float64) @ self._tree_outputs
+
+    def predict_margin(self, features):
+        return self._tree_margins(np.asarray(features, dtype=np.float32)) + self._bias
+
+    def predict_proba(self, features):
+        margins = self.predict_margin(features)
+        return _sigmoid(margins) if self.objective in SIGMOID_OBJECTIVES else _softmax(margins)
+
+
+class Predictor:
+    def __init__(self, booster, feature_order, compiled=False):
+        self.booster = booster
+        self.feature_order = list(feature_order)
+        self._get_features = itemgetter(*self.feature_order)
+        # The single reusable input row. XGBoost works in float32 internally, so no copy is
+        # needed to convert it on each call.
+        self._buffer = np.empty((1, len(self.feature_order)), dtype=np.float32)
+        self._batch_buffer = np.empty((0, len(self.feature_order)), dtype=np.float32)
+        self.compiled = CompiledTrees(booster) if compiled else None
+        # multi:softmax models predict class ids rather than probabilities, so their margins
+        # are fetched and turned into probabilities here, as the compiled path does.
+        objective = json.loads(booster.save_config())["learner"]["objective"]["name"]
+        self._softmax_margins = objective == "multi:softmax"
+        # Predictions made so far, for progress reporting.
+        self.count = 0
+
+    def _proba(self, features):
+        if self.compiled is not None:
+            return self.compiled.predict_proba(features)
+        if self._softmax_margins:
+            return _softmax(self.booster.inplace_predict(features, predict_type="margin"))
+        proba = self.booster.inplace_predict(features)
+        return _binary_proba(proba) if proba.ndim == 1 else proba
+
+    def predict(self, row):
+        # Returns (class, probability of that class, all class probabilities) for one feature row.
+        self._buffer[0] = self._get_features(row)
+        proba = self._proba(self._buffer)[0]
+        label = int(proba.argmax())
+        self.count += 1
+        return label, float(proba[label]), proba
+
+    def predict_rows(self, rows):
+        # Scores several feature rows (e.g. one per book) with a single model call. The batch
+        # buffer only grows, so steady-state batches reuse it.
+        if len(self._batch_buffer) < len(rows):
+            self._batch_buffer = np.empty((len(rows), len(self.feature_order)), dtype=np.float32)
+        features = self._batch_buffer[:len(rows)]
+        for i, row in enumerate(rows):
+            features[i] = self._get_features(row)
+        return self.predict_batch(features)
+
+    def predict_batch(self, features):
+        # Scores a (rows, features) matrix in one call; returns (classes, class probabilities).
+        proba = self._proba(np.asarray(features, dtype=np.float32))
+        self.count += len(proba)
+        return proba.argmax(axis=1), proba
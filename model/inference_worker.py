@@ -0,0 +1,98 @@
+# This file contains the inference worker used by the live scripts.
+# Prediction runs on its own thread, so the receive loop and book maintenance never wait on the
+# model. Each key (one per book, e.g. a symbol) has a latest-wins slot: submitting a new feature
+# row replaces any row for that key the worker has not got to yet, and the replaced row is
+# counted as skipped. Whenever the worker wakes up it takes every pending slot at once and
+# scores them with a single booster call, so several books share one batch.
+#
+# XGBoost and NumPy release the GIL while they compute, so the receive thread keeps running
+# during a prediction.
+
+import threading
+import time
+
+
+class InferenceWorker:
+    def __init__(self, predictor, on_result=None, metrics=None):
+        self.predictor = predictor
+        # A PipelineMetrics (utils/metrics.py) that times every booster call.
+        self.metrics = metrics
+        # Called on the worker thread as on_result(key, row, label, confidence, proba).
+        self.on_result = on_result
+        # The latest prediction per key: (row, label, confidence, proba).
+        self.latest = {}
+        self.submitted = 0
+        self.predicted = 0
+        self.skipped = 0
+        self.batches = 0
+        # Rows whose prediction or on_result call raised. They are printed and counted (exported
+        # as lob_inference_errors), and the worker carries on with the next rows.
+        self.errors = 0
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="inference-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, row):
+        # Never blocks on the model: only the slot swap happens under the lock.
+        with self._condition:
+            if key in self._pending:
+                self.skipped += 1
+            self._pending[key] = row
+            self.submitted += 1
+            self._condition.notify()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "predicted": self.predicted,
+            "skipped": self.skipped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "pending": self.pending,
+        }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                # Take every pending slot; new submissions start filling fresh slots meanwhile.
+                batch, self._pending = self._pending, {}
+
+            keys, rows = list(batch), list(batch.values())
+            start = time.perf_counter_ns()
+            try:
+                labels, proba = self.predictor.predict_rows(rows)
+            except Exception as e:
+                self.errors += len(rows)
+                print(f"Prediction error: {e}")
+                continue
+            if self.metrics is not None:
+                self.metrics.inference.record(time.perf_counter_ns() - start)
+            self.batches += 1
+            self.predicted += len(rows)
+            for key, row, label, class_proba in zip(keys, rows, labels, proba):
+                label = int(label)
+                confidence = float(class_proba[label])
+                self.latest[key] = (row, label, confidence, class_proba)
+                if self.on_result is not None:
+                    try:
+                        self.on_result(key, row, label, confidence, class_proba)
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"Prediction callback error: {e}")
+
+    def close(self):
+        # Scores whatever is still pending, then stops the thread.
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
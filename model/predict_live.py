@@ -2,12 +2,11 @@
 # It provides a simple, lightweight way to test the model's output without
 # launching the full visual dashboard.
 
+import argparse
 import asyncio
-import json
-import joblib
+import time
 import websockets
-import numpy as np
-import pandas as pd
+from websockets.exceptions import ConnectionClosed
 import os
 
 # Add the project root to the system path to allow importing our own modules.
@@ -17,81 +16,233 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 from utils.order_book_cache import OrderBook
 from microstructure.data_labeller import FeatureExtractor
+from microstructure.feature_sinks import NullSink
+from data_stream.replay import connect_replay, ReplayFinished
+from data_stream.ingest import DepthIngest
+from data_stream.book_sync import BookSyncManager, snapshot_provider
+from data_stream.checkpoint import Checkpointer, DEFAULT_INTERVAL as CHECKPOINT_INTERVAL, FILE_SUFFIX as CHECKPOINT_SUFFIX
+from data_stream.shared_book import attach_reader, DEFAULT_NAME as SHARED_FEED_NAME
+from data_stream.multi_symbol import BINANCE_URI, raw_stream_uri
+from model.inference import Predictor
+from model.inference_worker import InferenceWorker
+from model.artifact import load_artifact, FILE_SUFFIX
+from utils.metrics import PipelineMetrics, serve_metrics
 
 # --- 1. Setup and Initialization ---
 # Build robust file paths to ensure the script can find its files.
 script_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(script_dir, 'xgboost_model.pkl')
-csv_path = os.path.join(project_root, 'data_stream', 'lob_features.csv')
+model_path = os.path.join(script_dir, 'xgboost_model' + FILE_SUFFIX)
+checkpoint_path = os.path.join(script_dir, 'predict_live' + CHECKPOINT_SUFFIX)
+# When the process started, to report how long the first prediction took.
+start_time = time.monotonic()
 
-# Load the trained model and the feature order from the CSV.
+# Load the model artifact. It carries the feature order the model was trained on, so the
+# training data is not needed here.
 try:
-    xgb_model = joblib.load(model_path)
-    df = pd.read_csv(csv_path)
-    # It is critical to get the feature order to match the model's training.
-    FEATURE_ORDER = df.drop('label', axis=1).columns.tolist()
+    artifact = load_artifact(model_path)
+    FEATURE_ORDER = artifact.feature_order
     print("Model and feature order loaded successfully.")
 except FileNotFoundError:
     print("ERROR: Load failed. Run data generation and training scripts first.")
     exit(1)
 
-# Initialise the objects that will manage the data stream.
-order_book = OrderBook(depth=20)
-extractor = FeatureExtractor(window=30)
+# Initialise the objects that will manage the data stream, as they were set up for training.
+# The book is bounded so far-from-touch levels are evicted during long sessions.
+order_book = OrderBook(depth=artifact.depth, max_levels=1000)
+# Rows are only used for the prediction, so the extractor keeps none of them.
+extractor = FeatureExtractor(depth=artifact.depth, window=artifact.window, sink=NullSink())
 
 # Map numeric labels to display text for the console output.
-LABEL_MAP = {
-    0: "STABLE",
-    1: "DOWN",
-    2: "UP"
-}
+LABEL_MAP = artifact.label_map
 
 
-# --- 2. Live Prediction Coroutine ---
-async def predict_live():
-    uri = "wss://stream.binance.com:9443/ws/btcusdt@depth@100ms"
-    async with websockets.connect(uri) as ws:
-        print("\nStreaming live data for prediction...")
-        while True:
-            # Wait for a new message from the WebSocket.
-            msg = await ws.recv()
-            data = json.loads(msg)
+SYMBOL = "btcusdt"
+# How often new rows are looked for when reading from a shared-memory feed.
+SHARED_POLL_INTERVAL = 0.005
+# Seconds from start to the first prediction, set once it is made.
+first_prediction_at = None
 
-            # Update the local order book and extract features.
-            order_book.update(data)
-            row = extractor.update(order_book.bids, order_book.asks)
-
-            # A row is only returned after the initial data buffer is full.
-            if row:
-                try:
-                    # Create the feature array in the exact order the model was trained on.
-                    features = np.array([[row[feature] for feature in FEATURE_ORDER]])
 
-                    # Make a prediction and get the probability.
-                    prediction = xgb_model.predict(features)[0]
-                    proba = xgb_model.predict_proba(features)[0]
+# Called on the inference thread with each prediction.
+def show_prediction(symbol, row, prediction, confidence, proba):
+    global first_prediction_at
+    if first_prediction_at is None:
+        first_prediction_at = time.monotonic() - start_time
+        print(f"\nFirst prediction {first_prediction_at:.2f}s after start.")
+    label_text = LABEL_MAP.get(prediction, "N/A")
+    price = row['mid_price']
+    wmp = row['weighted_mid_price']
+    voi = row['voi']
 
-                    confidence = proba[prediction]
-                    label_text = LABEL_MAP.get(prediction, "N/A")
+    # Print the output on a single, updating line.
+    print(
+        f"\rPrediction: {label_text} (Conf: {confidence:.2%}) | Mid: {price:.2f} | WMP: {wmp:.2f} | VOI: {voi:.2f}  ",
+        end="")
 
-                    price = row['mid_price']
-                    wmp = row['weighted_mid_price']
-                    voi = row['voi']
 
-                    # Print the output on a single, updating line.
-                    print(
-                        f"\rPrediction: {label_text} (Conf: {confidence:.2%}) | Mid: {price:.2f} | WMP: {wmp:.2f} | VOI: {voi:.2f}  ",
-                        end="")
+# --- 2. Live Prediction Coroutine ---
+async def predict_live(replay_paths=None, speed=None, compiled=False, snapshots=None, shared=None, metrics=None,
+                       uri=BINANCE_URI, checkpoint=None, checkpoint_every=CHECKPOINT_INTERVAL):
+    # Stage latencies are always recorded; they cost well under a microsecond per message.
+    if metrics is None:
+        metrics = PipelineMetrics(event_lag=not replay_paths)
+    # One booster call per row gives both the class and its probability.
+    predictor = Predictor(artifact.booster, FEATURE_ORDER, compiled=compiled)
+    # The model runs on its own thread, so the receive loop never waits on it. If rows arrive
+    # faster than it can score them, only the latest row is scored and the rest are skipped.
+    worker = InferenceWorker(predictor, on_result=show_prediction, metrics=metrics)
+    metrics.add_source("inference", worker.stats)
+    try:
+        if shared:
+            await stream_shared(worker, shared)
+        else:
+            await stream_rows(worker, replay_paths, speed, snapshots, metrics, uri, checkpoint, checkpoint_every)
+    finally:
+        worker.close()
+        stats = worker.stats()
+        print(f"\nPredictions: {stats['predicted']} in {stats['batches']} batches, "
+              f"{stats['skipped']} skipped as stale.")
+        print(metrics.format_summary())
+
+
+async def stream_rows(worker, replay_paths, speed, snapshots, metrics, uri=BINANCE_URI, checkpoint=None,
+                      checkpoint_every=CHECKPOINT_INTERVAL):
+    # The book starts from a snapshot and is checked against the update IDs; after a gap it is
+    # resynced and the extractor starts over. Replays without a snapshot skip this.
+    sync = None
+    # With a checkpoint, the book and extractor start from where the last run stopped and are
+    # saved every few seconds. Resuming needs the update IDs, so only a synchronised book can.
+    checkpointer = None
+    if checkpoint and snapshots is None:
+        print("Checkpoints need a synchronised book; pass --snapshot to use them with --replay.")
+    elif checkpoint:
+        checkpointer = Checkpointer(checkpoint, SYMBOL, order_book, extractor, interval=checkpoint_every)
+        metrics.add_source("checkpoint", checkpointer.stats)
+    checkpoint_task = None
+    if snapshots is not None:
+        on_resync = checkpointer.on_resync if checkpointer else lambda symbol: extractor.reset()
+        sync = BookSyncManager(snapshots, on_resync=on_resync)
+        symbol_sync = sync.add(SYMBOL, order_book)
+        if checkpointer:
+            checkpointer.restore(symbol_sync)
+            checkpoint_task = asyncio.create_task(checkpointer.run(symbol_sync))
+    try:
+        if replay_paths:
+            # A recording can stand in for the live stream to evaluate the model offline.
+            # An unpaced replay has no socket to keep drained, so every message is processed on its own.
+            async with connect_replay(replay_paths, speed=speed, raw=False) as ws:
+                await process_stream(ws, sync, worker, metrics, max_batch=1 if not speed else 1_000)
+        else:
+            # Iterating over connect() reconnects, with backoff, whenever the connection drops. The
+            # first diff on a new connection follows a gap, so the book is resynced from a snapshot.
+            async for ws in websockets.connect(raw_stream_uri(SYMBOL, uri)):
+                try:
+                    await process_stream(ws, sync, worker, metrics)
+                except ConnectionClosed as e:
+                    print(f"\nConnection closed ({e}); reconnecting...")
+    except ReplayFinished:
+        print("\nEnd of recording reached.")
+    finally:
+        if checkpoint_task:
+            # A last checkpoint of the final state, so a restart loses nothing.
+            checkpoint_task.cancel()
+            checkpointer.save_now(symbol_sync)
+            print(f"\nCheckpoint: {checkpointer.saves} saved to {checkpointer.path}.")
+        if sync:
+            sync.close()
+            sync_stats = sync.stats()[SYMBOL.upper()]
+            print(f"\nSync: {sync_stats['resyncs']} snapshot(s) applied, {sync_stats['gaps']} gap(s).")
+
+
+async def process_stream(ws, sync, worker, metrics, max_batch=1_000):
+    print("\nStreaming live data for prediction...")
+    # A separate task keeps reading the socket into a queue. Diffs that queue up while we
+    # process are merged into one book update, so a stall here never stops the socket draining.
+    ingest = DepthIngest(ws, max_batch=max_batch, metrics=metrics)
+    metrics.add_source("ingest", ingest.stats)
+    try:
+        async for data in ingest:
+            # Update the local order book and extract features, timing each.
+            start = time.perf_counter_ns()
+            changes = sync.handle(data) if sync else order_book.update(data)
+            # Nothing to do while the book waits for a snapshot.
+            if changes is None:
+                continue
+            book_done = time.perf_counter_ns()
+            row = extractor.update(order_book.bids, order_book.asks, changes)
+            metrics.book_update.record(book_done - start)
+            metrics.features.record(time.perf_counter_ns() - book_done)
 
-                except Exception as e:
-                    print(f"Prediction Error: {e}")
+            # A row is only returned after the initial data buffer is full.
+            if row:
+                # Hand the row to the inference thread; this never waits on the model.
+                worker.submit(SYMBOL, row)
+    finally:
+        await ingest.close()
+        stats = ingest.stats()
+        print(f"\nIngest: {stats['received']} messages, {stats['book_updates']} book updates "
+              f"({stats['conflated']} merged), max queue depth {stats['max_queue_depth']}.")
+
+
+async def stream_shared(worker, name):
+    # Reads the rows a feed handler (data_stream/feed_handler.py) publishes to shared memory, so
+    # this process opens no connection and keeps no book of its own.
+    reader = attach_reader(name)
+    window = reader.symbol_config(SYMBOL)["window"]
+    if window != artifact.window:
+        print(f"WARNING: the feed labels with a window of {window}, the model was trained with {artifact.window}.")
+    print(f"\nReading {SYMBOL} from shared memory {name!r}...")
+    # Start from the rows published from now on.
+    cursor = reader.rows_written_for(SYMBOL)
+    try:
+        while True:
+            rows, cursor, _ = reader.rows_since(SYMBOL, cursor)
+            # The worker only scores the latest row anyway.
+            if rows:
+                worker.submit(SYMBOL, rows[-1])
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+    finally:
+        reader.close()
 
 
 # --- 3. Run the Application ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run live mid-price predictions in the console.")
+    parser.add_argument("--replay", nargs="+", metavar="RECORDING",
+                        help="Read depth diffs from recording files instead of the live WebSocket.")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Replay at this multiple of the recorded pace (default: as fast as possible).")
+    parser.add_argument("--compiled", action="store_true",
+                        help="Evaluate the trees with NumPy instead of XGBoost (faster for small models).")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Take depth snapshots from a JSON file instead of the REST API, e.g. "
+                             "snapshots/{symbol}.json. Replays are only synchronised when this is given.")
+    parser.add_argument("--uri", default=BINANCE_URI,
+                        help="Base URI of the depth stream, e.g. ws://127.0.0.1:8765 for the stand-in server.")
+    parser.add_argument("--snapshot-url", default=None,
+                        help="REST depth endpoint to take snapshots from (default: Binance).")
+    parser.add_argument("--shared", nargs="?", const=SHARED_FEED_NAME, metavar="NAME",
+                        help="Read rows from a running feed handler's shared memory instead of a connection "
+                             f"(default name: {SHARED_FEED_NAME}).")
+    parser.add_argument("--checkpoint", nargs="?", const=checkpoint_path, metavar="PATH",
+                        help="Restore the book and features from this checkpoint on startup and save them to it "
+                             f"periodically (default path: {checkpoint_path}).")
+    parser.add_argument("--checkpoint-every", type=float, default=CHECKPOINT_INTERVAL, metavar="SECONDS",
+                        help="Seconds between checkpoints.")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve stage latencies in the Prometheus text format at http://127.0.0.1:PORT/metrics.")
+    args = parser.parse_args()
+    metrics = PipelineMetrics(event_lag=not args.replay)
+    if args.metrics_port is not None:
+        serve_metrics(metrics, args.metrics_port)
+    # Live books always start from a snapshot; a replay only if one is supplied.
+    snapshots = None
+    if not args.shared and (args.snapshot or not args.replay):
+        snapshots = snapshot_provider(args.snapshot, args.snapshot_url)
     try:
         # Start the asynchronous event loop.
-        asyncio.run(predict_live())
+        asyncio.run(predict_live(args.replay, args.speed, args.compiled, snapshots, args.shared, metrics,
+                                 args.uri, args.checkpoint, args.checkpoint_every))
     except KeyboardInterrupt:
         # Allow the user to stop the script cleanly with Ctrl+C.
         print("\nPrediction stopped by user.")
@@ -1,76 +1,202 @@
 # This script loads the dataset created by generate_dataset.py.
 # It trains an XGBoost classifier and automatically configures it for binary or
 # multi-class classification based on the labels found in the data.
-# The trained model is saved to a .pkl file for later use.
+# The trained model is saved as a self-describing artifact (see artifact.py) holding the booster
+# and the feature order, label map, depth and window the live scripts need.
+# Datasets labelled for several horizons have one "label_<h>" column each; pick the target
+# with --label (the default is the single-horizon "label" column). Such datasets also have one
+# "mid_price_<h>" column each, and the target's is trained on as "mid_price", like the live rows.
+# With --walk-forward it instead runs the out-of-core pipeline in walk_forward.py over chunked
+# columnar (.lobf) files: walk-forward time-series folds and a hyperparameter sweep run
+# across a process pool, reporting per-fold metrics and timings. The best parameters are then
+# refitted on all the data and saved as the artifact.
 
+import argparse
+import json
 import pandas as pd
 from sklearn.metrics import classification_report, confusion_matrix
 from sklearn.model_selection import train_test_split
 from xgboost import XGBClassifier
-import joblib
 import os
+import sys
+import re
 import numpy as np
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
 csv_path = os.path.join(project_root, 'data_stream', 'lob_features.csv')
-model_path = os.path.join(script_dir, 'xgboost_model.pkl')
-
-try:
-    df = pd.read_csv(csv_path)
-    print(f"Dataset loaded successfully from {csv_path}")
-except FileNotFoundError:
-    print(f"ERROR: {csv_path} not found. Please run `data_stream/generate_dataset.py` first.")
-    exit(1)
-
-X = df.drop("label", axis=1)
-y = df["label"]
-
-label_counts = y.value_counts()
-print("\nClass distribution:\n", label_counts)
-if len(label_counts) < 2:
-    print("ERROR: Dataset contains only one class — cannot train model.")
-    exit(1)
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-print("\n--- Training XGBoost Model ---")
-
-num_classes = y.nunique()
-print(f"Found {num_classes} unique classes for the model.")
-
-if num_classes == 2:
-    print("Configuring model for BINARY classification.")
-    xgb_model = XGBClassifier(
-        objective='binary:logistic',
-        use_label_encoder=False,
-        eval_metric="logloss",
-        random_state=42
-    )
-else:
-    print("Configuring model for MULTI-CLASS classification.")
-    xgb_model = XGBClassifier(
-        objective='multi:softprob',
-        num_class=num_classes,
-        use_label_encoder=False,
-        eval_metric="mlogloss",
-        random_state=42
+report_path = os.path.join(script_dir, 'walk_forward_report.json')
+
+sys.path.insert(0, project_root)
+from microstructure.feature_sinks import read_feature_file, FILE_SUFFIX
+from microstructure.rolling_labeller import training_columns
+from model.artifact import ModelArtifact, save_artifact, LABEL_NAMES, FILE_SUFFIX as ARTIFACT_SUFFIX
+
+model_path = os.path.join(script_dir, 'xgboost_model' + ARTIFACT_SUFFIX)
+# The book depth and labelling window generate_dataset.py builds features with.
+DEFAULT_DEPTH = 20
+DEFAULT_WINDOW = 30
+
+
+# The live extractor must run with the window the target was labelled over: the horizon in a
+# "label_<h>" column name, unless one is given explicitly.
+def model_window(args):
+    if args.window is not None:
+        return args.window
+    match = re.fullmatch(r"label_(\d+)", args.label)
+    return int(match.group(1)) if match else DEFAULT_WINDOW
+
+
+def save_model(args, booster, feature_order, num_classes, extra):
+    artifact = ModelArtifact(
+        booster,
+        feature_order,
+        {label: LABEL_NAMES[label] for label in range(num_classes)},
+        args.depth,
+        model_window(args),
+        {"label_column": args.label, "data": args.data, **extra},
     )
+    save_artifact(model_path, artifact)
+    print(f"\nModel artifact saved to {model_path}")
+
+
+def train_in_memory(args):
+    try:
+        # Columnar files are read straight into typed arrays, which is much faster than parsing CSV.
+        if args.data[0].endswith(FILE_SUFFIX):
+            df = pd.concat([pd.DataFrame(read_feature_file(path)) for path in args.data], ignore_index=True)
+        else:
+            df = pd.concat([pd.read_csv(path) for path in args.data], ignore_index=True)
+        print(f"Dataset loaded successfully from {', '.join(args.data)}")
+    except FileNotFoundError as e:
+        print(f"ERROR: {e.filename} not found. Please run `data_stream/generate_dataset.py` first.")
+        exit(1)
+
+    label_columns = [c for c in df.columns if c.startswith("label")]
+    if args.label not in label_columns:
+        print(f"ERROR: Label column '{args.label}' not found. Available: {label_columns}")
+        exit(1)
+
+    # Every label column is dropped from the features, not just the target, and only the
+    # target horizon's mid-price is kept.
+    sources, names = training_columns(df.columns, args.label)
+    X = df[sources].set_axis(names, axis=1)
+    y = df[args.label]
+
+    label_counts = y.value_counts()
+    print("\nClass distribution:\n", label_counts)
+    if len(label_counts) < 2:
+        print("ERROR: Dataset contains only one class — cannot train model.")
+        exit(1)
+
+    # Rows are in time order, so the last 20% is held out. A shuffled split would test on rows
+    # from between the training rows, whose labels overlap their future windows.
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, shuffle=False)
+
+    print("\n--- Training XGBoost Model ---")
+
+    num_classes = y.nunique()
+    print(f"Found {num_classes} unique classes for the model.")
+    if y_train.nunique() < num_classes:
+        print("ERROR: The training rows do not contain every class — collect more data.")
+        exit(1)
+
+    if num_classes == 2:
+        print("Configuring model for BINARY classification.")
+        xgb_model = XGBClassifier(
+            objective='binary:logistic',
+            use_label_encoder=False,
+            eval_metric="logloss",
+            random_state=42
+        )
+    else:
+        print("Configuring model for MULTI-CLASS classification.")
+        xgb_model = XGBClassifier(
+            objective='multi:softprob',
+            num_class=num_classes,
+            use_label_encoder=False,
+            eval_metric="mlogloss",
+            random_state=42
+        )
+
+    xgb_model.fit(X_train, y_train)
+    xgb_preds = xgb_model.predict(X_test)
+
+    print("\nXGBoost Results:")
+
+    full_label_map = { 0: 'STABLE (0)', 1: 'DOWN (1)', 2: 'UP (2)' }
+    unique_labels_in_data = np.sort(y.unique())
+    target_names = [full_label_map[label] for label in unique_labels_in_data]
+    print(f"\nReport will be generated for these classes: {target_names}")
+
+    # The held-out rows may lack a class, so the labels are listed explicitly.
+    print(classification_report(y_test, xgb_preds, labels=unique_labels_in_data,
+                                target_names=target_names, zero_division=0))
+    print("\nConfusion Matrix:\n", confusion_matrix(y_test, xgb_preds, labels=unique_labels_in_data))
+
+    save_model(args, xgb_model.get_booster(), list(X.columns), num_classes, {"mode": "in_memory"})
+
+
+def train_walk_forward(args):
+    from model.walk_forward import walk_forward_sweep, train_final, DEFAULT_PARAM_GRID, NUM_CLASSES
+
+    if not all(path.endswith(FILE_SUFFIX) for path in args.data):
+        print(f"ERROR: --walk-forward streams chunked {FILE_SUFFIX} files. "
+              "Generate them with `data_stream/generate_dataset.py --columnar`.")
+        exit(1)
+    param_grid = json.loads(args.grid) if args.grid else DEFAULT_PARAM_GRID
+
+    print(f"\n--- Walk-forward sweep: {args.folds} folds over {', '.join(args.data)} ---")
+    print(f"Parameter grid: {param_grid}")
+    try:
+        results, summaries = walk_forward_sweep(args.data, args.label, args.folds, param_grid, args.workers)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"ERROR: {e}")
+        exit(1)
+
+    print("\nPer-fold results:")
+    print(f"{'params':<55} {'fold':>4} {'train rows':>11} {'valid rows':>11} {'acc':>6} {'F1':>6} "
+          f"{'logloss':>8} {'build s':>8} {'train s':>8} {'eval s':>7}")
+    for r in results:
+        print(f"{json.dumps(r['params']):<55} {r['fold']:>4} {r['train_rows']:>11} {r['rows']:>11} "
+              f"{r['accuracy']:>6.3f} {r['macro_f1']:>6.3f} {r['mlogloss']:>8.4f} "
+              f"{r['build_seconds']:>8.2f} {r['train_seconds']:>8.2f} {r['eval_seconds']:>7.2f}")
+
+    print("\nMean across folds (best first):")
+    for s in summaries:
+        print(f"{json.dumps(s['params']):<55} logloss {s['mean_mlogloss']:.4f} | acc {s['mean_accuracy']:.3f} "
+              f"| F1 {s['mean_macro_f1']:.3f} | {s['total_seconds']:.1f}s")
 
-xgb_model.fit(X_train, y_train)
-xgb_preds = xgb_model.predict(X_test)
+    with open(report_path, "w") as f:
+        json.dump({"label": args.label, "folds": args.folds, "results": results, "summary": summaries}, f, indent=2)
+    print(f"\nBest parameters: {summaries[0]['params']}")
+    print(f"Full report saved to {report_path}")
 
-print("\nXGBoost Results:")
+    # Refit the best parameters on all the data and save that model.
+    print("\n--- Training final model on all chunks ---")
+    booster, feature_order = train_final(args.data, args.label, summaries[0]["params"])
+    save_model(args, booster, feature_order, NUM_CLASSES, {"mode": "walk_forward", "params": summaries[0]["params"]})
 
-full_label_map = { 0: 'STABLE (0)', 1: 'DOWN (1)', 2: 'UP (2)' }
-unique_labels_in_data = np.sort(y.unique())
-target_names = [full_label_map[label] for label in unique_labels_in_data]
-print(f"\nReport will be generated for these classes: {target_names}")
 
-print(classification_report(y_test, xgb_preds, target_names=target_names))
-print("\nConfusion Matrix:\n", confusion_matrix(y_test, xgb_preds))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the XGBoost mid-price direction model.")
+    parser.add_argument("--label", default="label", help="The label column to train on, e.g. label_30.")
+    parser.add_argument("--data", nargs="+", default=[csv_path],
+                        help=f"The dataset(s) to train on: CSV files or columnar {FILE_SUFFIX} files, in time order.")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH,
+                        help="Order book depth the features were built with, recorded in the model artifact.")
+    parser.add_argument("--window", type=int, default=None,
+                        help="Labelling window the live extractor should use (default: from the label column).")
+    parser.add_argument("--walk-forward", action="store_true",
+                        help="Run the out-of-core walk-forward hyperparameter sweep instead of a single fit.")
+    parser.add_argument("--folds", type=int, default=4, help="Number of walk-forward folds.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for the sweep (default: one per core, up to the task count).")
+    parser.add_argument("--grid", default=None,
+                        help='Parameter grid as JSON, e.g. \'{"max_depth": [4, 6], "num_boost_round": [100]}\'.')
+    args = parser.parse_args()
 
-joblib.dump(xgb_model, model_path)
-print(f"\nXGBoost model saved to {model_path}")
\ No newline at end of file
+    if args.walk_forward:
+        train_walk_forward(args)
+    else:
+        train_in_memory(args)
@@ -0,0 +1,194 @@
+# This file contains the out-of-core training pipeline used by `train_model.py --walk-forward`.
+# It trains on chunked columnar feature files (.lobf, see microstructure/feature_sinks.py)
+# without ever loading a whole dataset into memory:
+#   - chunks are streamed into XGBoost through a DataIter, backed by an external-memory cache;
+#   - folds are walk-forward splits in time order, so a model is never validated on data that
+#     came before the data it was trained on;
+#   - every (hyperparameters, fold) pair is an independent task run on a process pool.
+
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import xgboost as xgb
+
+from microstructure.feature_sinks import index_feature_chunks, read_feature_chunk, read_feature_columns
+from microstructure.rolling_labeller import training_columns
+
+# The default sweep. Each combination is trained and evaluated on every fold.
+DEFAULT_PARAM_GRID = {
+    "max_depth": [4, 6, 8],
+    "learning_rate": [0.05, 0.2],
+    "num_boost_round": [200],
+}
+# Labels are STABLE (0), DOWN (1) and UP (2).
+NUM_CLASSES = 3
+
+
+# Lists every chunk of the given files, in file order, as (path, offset, row count).
+def list_chunks(paths):
+    return [(path, offset, n_rows) for path in paths for offset, n_rows in index_feature_chunks(path)]
+
+
+# Splits the chunk sequence into n_folds + 1 contiguous blocks. Fold k trains on blocks 0..k
+# (an expanding window) and validates on block k + 1, which always comes later in time.
+def walk_forward_folds(n_chunks, n_folds):
+    if n_chunks < n_folds + 1:
+        raise ValueError(f"Need at least {n_folds + 1} chunks for {n_folds} folds, found {n_chunks}.")
+    bounds = np.linspace(0, n_chunks, n_folds + 2).astype(int)
+    return [(range(0, bounds[k + 1]), range(bounds[k + 1], bounds[k + 2])) for k in range(n_folds)]
+
+
+def _chunk_arrays(chunk_ref, feature_columns, label_column):
+    path, offset, _ = chunk_ref
+    chunk = read_feature_chunk(path, offset)
+    features = np.column_stack([chunk[name] for name in feature_columns])
+    return features, chunk[label_column]
+
+
+# Feeds chunks to XGBoost one at a time. With a cache prefix, XGBoost builds an external-memory
+# DMatrix from the batches, so only one chunk of raw rows is in memory at once.
+class FeatureChunkIter(xgb.DataIter):
+    def __init__(self, chunk_refs, feature_columns, label_column, cache_prefix):
+        self.chunk_refs = chunk_refs
+        self.feature_columns = feature_columns
+        self.label_column = label_column
+        self._position = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._position == len(self.chunk_refs):
+            return False
+        features, labels = _chunk_arrays(self.chunk_refs[self._position], self.feature_columns, self.label_column)
+        input_data(data=features, label=labels)
+        self._position += 1
+        return True
+
+    def reset(self):
+        self._position = 0
+
+
+def _evaluate(booster, chunk_refs, feature_columns, label_column):
+    # Streams the validation chunks through the model, accumulating a confusion matrix and log loss.
+    confusion = np.zeros((NUM_CLASSES, NUM_CLASSES), dtype=np.int64)
+    log_loss_sum, rows = 0.0, 0
+    for chunk_ref in chunk_refs:
+        features, labels = _chunk_arrays(chunk_ref, feature_columns, label_column)
+        proba = booster.inplace_predict(features)
+        predictions = proba.argmax(axis=1)
+        confusion += np.bincount(labels * NUM_CLASSES + predictions,
+                                 minlength=NUM_CLASSES * NUM_CLASSES).reshape(NUM_CLASSES, NUM_CLASSES)
+        log_loss_sum -= np.log(np.clip(proba[np.arange(len(labels)), labels], 1e-15, 1)).sum()
+        rows += len(labels)
+
+    def safe_divide(numerator, denominator):
+        return np.divide(numerator, denominator, out=np.zeros(NUM_CLASSES), where=denominator > 0)
+
+    true_positive = np.diag(confusion)
+    precision = safe_divide(true_positive, confusion.sum(axis=0))
+    recall = safe_divide(true_positive, confusion.sum(axis=1))
+    f1 = safe_divide(2 * precision * recall, precision + recall)
+    return {
+        "rows": rows,
+        "accuracy": float(true_positive.sum() / rows) if rows else 0.0,
+        "macro_f1": float(f1.mean()),
+        "mlogloss": float(log_loss_sum / rows) if rows else 0.0,
+        "confusion": confusion.tolist(),
+    }
+
+
+def train_booster(chunk_refs, feature_columns, label_column, params, nthread, cache_dir):
+    # Builds an external-memory DMatrix over the chunks and trains one booster on it.
+    params = dict(params)
+    num_boost_round = params.pop("num_boost_round", 100)
+    iterator = FeatureChunkIter(chunk_refs, feature_columns, label_column,
+                                cache_prefix=os.path.join(cache_dir, "cache"))
+    started = time.perf_counter()
+    dtrain = xgb.ExtMemQuantileDMatrix(iterator, nthread=nthread)
+    built = time.perf_counter()
+    booster = xgb.train({
+        "objective": "multi:softprob",
+        "num_class": NUM_CLASSES,
+        "eval_metric": "mlogloss",
+        "tree_method": "hist",
+        "nthread": nthread,
+        "seed": 42,
+        **params,
+    }, dtrain, num_boost_round=num_boost_round)
+    trained = time.perf_counter()
+    return booster, built - started, trained - built
+
+
+# One (hyperparameters, fold) task. Runs in a worker process.
+def run_fold(task):
+    params, fold, train_refs, valid_refs, feature_columns, label_column, nthread = task
+    with tempfile.TemporaryDirectory(prefix="lob_xgb_") as cache_dir:
+        booster, build_seconds, train_seconds = train_booster(
+            train_refs, feature_columns, label_column, params, nthread, cache_dir)
+        started = time.perf_counter()
+        metrics = _evaluate(booster, valid_refs, feature_columns, label_column)
+        eval_seconds = time.perf_counter() - started
+    return {
+        "params": params,
+        "fold": fold,
+        "train_rows": int(sum(ref[2] for ref in train_refs)),
+        "build_seconds": build_seconds,
+        "train_seconds": train_seconds,
+        "eval_seconds": eval_seconds,
+        **metrics,
+    }
+
+
+# Trains the model to deploy: the chosen parameters fitted on every chunk of every file.
+# Returns the booster and its feature names, as the live extractor names them.
+def train_final(paths, label_column, params):
+    feature_columns, feature_names = training_columns(read_feature_columns(paths[0]), label_column)
+    with tempfile.TemporaryDirectory(prefix="lob_xgb_") as cache_dir:
+        booster, _, _ = train_booster(list_chunks(paths), feature_columns, label_column, params,
+                                      os.cpu_count() or 1, cache_dir)
+    return booster, feature_names
+
+
+def expand_grid(param_grid):
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+
+
+# Runs the whole sweep and returns (per-fold results, per-parameter summaries sorted best first).
+def walk_forward_sweep(paths, label_column="label", n_folds=4, param_grid=None, workers=None):
+    columns = read_feature_columns(paths[0])
+    if label_column not in columns:
+        raise ValueError(f"Label column '{label_column}' not found. Available: {columns}")
+    feature_columns, _ = training_columns(columns, label_column)
+
+    chunk_refs = list_chunks(paths)
+    folds = walk_forward_folds(len(chunk_refs), n_folds)
+    grid = expand_grid(param_grid or DEFAULT_PARAM_GRID)
+
+    # Split the cores between the workers so the pool does not oversubscribe the machine.
+    workers = workers or min(os.cpu_count() or 1, len(grid) * len(folds))
+    nthread = max(1, (os.cpu_count() or 1) // workers)
+    tasks = [(params, k, [chunk_refs[i] for i in train], [chunk_refs[i] for i in valid],
+              feature_columns, label_column, nthread)
+             for params in grid for k, (train, valid) in enumerate(folds)]
+
+    # Workers are spawned rather than forked so XGBoost's thread pools start cleanly in each one.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        results = list(pool.map(run_fold, tasks))
+
+    summaries = []
+    for params in grid:
+        fold_results = [r for r in results if r["params"] == params]
+        summaries.append({
+            "params": params,
+            "mean_mlogloss": float(np.mean([r["mlogloss"] for r in fold_results])),
+            "mean_accuracy": float(np.mean([r["accuracy"] for r in fold_results])),
+            "mean_macro_f1": float(np.mean([r["macro_f1"] for r in fold_results])),
+            "total_seconds": sum(r["build_seconds"] + r["train_seconds"] + r["eval_seconds"] for r in fold_results),
+        })
+    summaries.sort(key=lambda s: s["mean_mlogloss"])
+    return results, summaries
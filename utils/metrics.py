@@ -0,0 +1,208 @@
+# This file contains the latency instrumentation shared by the live paths (the dashboard,
+# predict_live.py and the multi-symbol runner behind feed_handler.py and sharding.py).
+# Each stage between a frame arriving and a prediction has its own histogram:
+#   receive      from the frame being read off the socket to the processor taking it off the
+#                ingest queue (the time it waited behind other work)
+#   decode       DepthDecoder.decode
+#   book_update  OrderBook.update, or the book synchroniser in front of it
+#   features     FeatureExtractor.update
+#   inference    one booster call of the inference worker (a batch of latest rows)
+#   event_lag    local receive time minus the exchange event time ("E"), i.e. network delay
+#                plus any clock offset between the exchange and this machine
+#
+# Recording has to be cheap enough to leave on, so a histogram is a fixed list of counters with
+# log-linear buckets (8 per power of two, so any value is placed within 12.5%) indexed with
+# integer arithmetic: one record is a few additions and no allocation. Quantiles are read from
+# the buckets when a report or a scrape asks for them. Each histogram has a single writer (the
+# thread that runs its stage), and readers only ever read the counters, so nothing is locked.
+#
+# The histograms are exposed in the Prometheus text format, both as histograms (so Prometheus can
+# compute quantiles over any window) and as p50/p99/max gauges since the process started.
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sub-buckets per power of two: 2 ** SUB_BITS.
+SUB_BITS = 3
+SUB_BUCKETS = 1 << SUB_BITS
+# Enough buckets for any 64-bit nanosecond value.
+BUCKET_COUNT = (64 - SUB_BITS + 1) * SUB_BUCKETS
+STAGES = ("receive", "decode", "book_update", "features", "inference")
+QUANTILES = (0.5, 0.99)
+# Upper bounds of the exported Prometheus buckets, in nanoseconds: powers of two from ~1us to ~17s.
+EXPORT_BOUNDS = tuple(1 << bits for bits in range(10, 35))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def bucket_index(value):
+    # Values below 2 * SUB_BUCKETS get a bucket each; above that every power of two is split
+    # into SUB_BUCKETS equal buckets, keyed by the leading bits of the value.
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift << SUB_BITS) + (value >> shift)
+
+
+def bucket_bounds(index):
+    # The [low, high) range of values a bucket holds.
+    if index < 2 * SUB_BUCKETS:
+        return index, index + 1
+    shift = (index >> SUB_BITS) - 1
+    low = (index - (shift << SUB_BITS)) << shift
+    return low, low + (1 << shift)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        # value is a duration in nanoseconds. Negative values (a clock stepping back, or an
+        # exchange clock ahead of ours) are counted as zero.
+        if value < 0:
+            value = 0
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # The midpoint of the bucket holding the q-th value, never more than the largest value seen.
+        count = self.count
+        if not count:
+            return 0
+        target = q * count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if bucket_count and seen >= target:
+                low, high = bucket_bounds(index)
+                return min((low + high - 1) // 2, self.max)
+        return self.max
+
+    def count_below(self, bound):
+        # How many values were below bound, which must be a bucket boundary (e.g. a power of two).
+        return sum(self.counts[:bucket_index(bound)])
+
+    def summary(self):
+        # Microseconds, for reports.
+        return {
+            "count": self.count,
+            "p50_us": self.quantile(0.5) / 1e3,
+            "p99_us": self.quantile(0.99) / 1e3,
+            "max_us": self.max / 1e3,
+            "mean_us": self.total / self.count / 1e3 if self.count else 0.0,
+        }
+
+    def reset(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = self.total = self.max = 0
+
+
+class PipelineMetrics:
+    def __init__(self, namespace="lob", event_lag=True):
+        self.namespace = namespace
+        # Replayed messages carry the event times of the recording, so their lag means nothing.
+        self.track_event_lag = event_lag
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        # Attributes for the hot paths, so recording is one attribute lookup and a call.
+        self.receive = self.stages["receive"]
+        self.decode = self.stages["decode"]
+        self.book_update = self.stages["book_update"]
+        self.features = self.stages["features"]
+        self.inference = self.stages["inference"]
+        self.event_lag = LatencyHistogram()
+        # Other counters to export, as name -> function returning a dict of numbers, e.g. the
+        # ingest queue's or the inference worker's stats().
+        self.sources = {}
+
+    def record_event_lag(self, event_time_ms, received_ns=None):
+        # event_time_ms is the message's "E" field; received_ns the local time.time_ns() it arrived.
+        if event_time_ms and self.track_event_lag:
+            received_ns = time.time_ns() if received_ns is None else received_ns
+            self.event_lag.record(received_ns - event_time_ms * 1_000_000)
+
+    def add_source(self, name, stats):
+        self.sources[name] = stats
+
+    def summary(self):
+        summary = {stage: histogram.summary() for stage, histogram in self.stages.items() if histogram.count}
+        if self.event_lag.count:
+            summary["event_lag"] = self.event_lag.summary()
+        return summary
+
+    def format_summary(self):
+        lines = [f"{'stage':>12} {'count':>9} {'p50 us':>10} {'p99 us':>10} {'max us':>10}"]
+        for stage, stats in self.summary().items():
+            lines.append(f"{stage:>12} {stats['count']:>9} {stats['p50_us']:>10.1f} {stats['p99_us']:>10.1f} "
+                         f"{stats['max_us']:>10.1f}")
+        return "\n".join(lines)
+
+    def prometheus_text(self):
+        lines = []
+        stage_metric = f"{self.namespace}_stage_latency_seconds"
+        self._family_lines(lines, stage_metric, "Time spent in each stage of the live pipeline.",
+                           [(f'stage="{stage}"', histogram) for stage, histogram in self.stages.items()])
+        lag_metric = f"{self.namespace}_event_lag_seconds"
+        self._family_lines(lines, lag_metric, "Local receive time minus the exchange event time.",
+                           [("", self.event_lag)])
+        for source, stats in self.sources.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = f"{self.namespace}_{source}_{key}"
+                    lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _family_lines(lines, metric, description, series):
+        # One histogram family, plus gauges of its quantiles and maximum since start for a quick
+        # look without a Prometheus server. series is a list of (labels, histogram).
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+        for labels, histogram in series:
+            prefix, braced = (f"{labels},", f"{{{labels}}}") if labels else ("", "")
+            for bound in EXPORT_BOUNDS:
+                lines.append(f'{metric}_bucket{{{prefix}le="{bound / 1e9:g}"}} {histogram.count_below(bound)}')
+            lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum{braced} {histogram.total / 1e9:.9f}")
+            lines.append(f"{metric}_count{braced} {histogram.count}")
+        base = metric[:-len("_seconds")]
+        lines.append(f"# TYPE {base}_quantile_seconds gauge")
+        for labels, histogram in series:
+            prefix = f"{labels}," if labels else ""
+            for q in QUANTILES:
+                lines.append(f'{base}_quantile_seconds{{{prefix}quantile="{q}"}} {histogram.quantile(q) / 1e9:.9f}')
+        lines.append(f"# TYPE {base}_max_seconds gauge")
+        for labels, histogram in series:
+            braced = f"{{{labels}}}" if labels else ""
+            lines.append(f"{base}_max_seconds{braced} {histogram.max / 1e9:.9f}")
+
+
+# Serves metrics.prometheus_text() at /metrics from a daemon thread. Returns the server; its
+# shutdown() stops it.
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes are not worth a line on the console each.
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Serving metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
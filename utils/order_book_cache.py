@@ -1,34 +1,264 @@
-from typing import Dict, List, Tuple
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# This class holds one side of the order book.
+# It behaves like the plain price -> quantity dictionary the book used to expose, but it also
+# keeps the prices in a sorted array so the best level and the top N levels never need a full sort.
+class BookSide:
+    def __init__(self, descending: bool):
+        # Key: price (float), Value: quantity (float)
+        self._levels: Dict[float, float] = {}
+        # All prices on this side, always kept in ascending order with bisect.
+        self._prices: List[float] = []
+        # Bids are ranked highest price first, asks lowest price first.
+        self.descending: bool = descending
+
+    def __getitem__(self, price: float) -> float:
+        return self._levels[price]
+
+    def __setitem__(self, price: float, qty: float):
+        # Only a brand new price level needs to be placed into the sorted array.
+        if price not in self._levels:
+            insort(self._prices, price)
+        self._levels[price] = qty
+
+    def __delitem__(self, price: float):
+        del self._levels[price]
+        del self._prices[bisect_left(self._prices, price)]
+
+    def __contains__(self, price) -> bool:
+        return price in self._levels
+
+    def __len__(self) -> int:
+        return len(self._levels)
+
+    def __iter__(self) -> Iterator[float]:
+        # Iterate prices from the touch outwards, like a sorted book.
+        return iter(self.prices())
+
+    def __bool__(self) -> bool:
+        return bool(self._levels)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, BookSide):
+            return self._levels == other._levels
+        return self._levels == other
+
+    def __repr__(self) -> str:
+        return f"BookSide({dict(self.items())!r})"
+
+    def get(self, price: float, default=None):
+        return self._levels.get(price, default)
+
+    def pop(self, price: float, *default):
+        if price not in self._levels:
+            if default:
+                return default[0]
+            raise KeyError(price)
+        qty = self._levels.pop(price)
+        del self._prices[bisect_left(self._prices, price)]
+        return qty
+
+    def clear(self):
+        self._levels.clear()
+        self._prices.clear()
+
+    def trim(self, max_levels: int) -> int:
+        # Keep only the max_levels levels closest to the touch and return how many were removed.
+        excess = len(self._prices) - max_levels
+        if excess <= 0:
+            return 0
+        # The worst levels sit at the start of the array for bids and at the end for asks.
+        if self.descending:
+            evicted, self._prices = self._prices[:excess], self._prices[excess:]
+        else:
+            evicted, self._prices = self._prices[max_levels:], self._prices[:max_levels]
+        for price in evicted:
+            del self._levels[price]
+        return excess
+
+    def drop_beyond(self, limit_price: float) -> int:
+        # Remove every level further from the touch than limit_price and return how many were removed.
+        if self.descending:
+            cut = bisect_left(self._prices, limit_price)
+            if cut == 0:
+                return 0
+            evicted, self._prices = self._prices[:cut], self._prices[cut:]
+        else:
+            cut = bisect_right(self._prices, limit_price)
+            if cut == len(self._prices):
+                return 0
+            evicted, self._prices = self._prices[cut:], self._prices[:cut]
+        for price in evicted:
+            del self._levels[price]
+        return len(evicted)
+
+    def keys(self) -> List[float]:
+        return self.prices()
+
+    def values(self) -> List[float]:
+        return [self._levels[price] for price in self.prices()]
+
+    def items(self) -> List[Tuple[float, float]]:
+        return self.top(len(self._prices))
+
+    def prices(self) -> List[float]:
+        # Prices ordered from the best level outwards.
+        return self._prices[::-1] if self.descending else self._prices[:]
+
+    def best_price(self) -> Optional[float]:
+        # The best price is simply one end of the sorted array.
+        if not self._prices:
+            return None
+        return self._prices[-1] if self.descending else self._prices[0]
+
+    def best(self) -> Optional[Tuple[float, float]]:
+        price = self.best_price()
+        if price is None:
+            return None
+        return price, self._levels[price]
+
+    def top(self, n: int) -> List[Tuple[float, float]]:
+        # Slice only the first n prices from the touch instead of sorting the whole side.
+        if self.descending:
+            prices = self._prices[:-n - 1:-1] if n > 0 else []
+        else:
+            prices = self._prices[:n]
+        levels = self._levels
+        return [(price, levels[price]) for price in prices]
+
 
 # This class manages a local, in-memory copy of the order book.
 # It processes updates from the WebSocket stream to keep the book state current.
 class OrderBook:
-    def __init__(self, depth: int = 20):
-        # Bids and asks are stored as dictionaries for efficient O(1) lookups and updates.
-        # Key: price (float), Value: quantity (float)
-        self.bids: Dict[float, float] = {}
-        self.asks: Dict[float, float] = {}
+    def __init__(self, depth: int = 20, max_levels: Optional[int] = None, price_band: Optional[float] = None,
+                 tick_size: Optional[float] = None, lot_size: Optional[float] = None):
+        # Bids and asks support dictionary-style O(1) lookups and updates, while a sorted
+        # price index gives O(1) best levels and O(log n) inserts and deletes.
+        self.bids: BookSide = BookSide(descending=True)
+        self.asks: BookSide = BookSide(descending=False)
         # The number of levels to return when requested.
         self.depth: int = depth
 
-    def update(self, data: Dict):
+        # Optional bounded mode for long-running processes. The diff stream never removes levels
+        # that drift far from the touch, so without a bound they accumulate forever.
+        # max_levels caps the number of levels kept per side; price_band drops levels more than
+        # that fraction of the best price away from the touch (e.g. 0.01 keeps a 1% band).
+        if max_levels is not None and max_levels < depth:
+            raise ValueError(f"max_levels ({max_levels}) must be at least depth ({depth})")
+        if price_band is not None and price_band <= 0:
+            raise ValueError(f"price_band must be positive, got {price_band}")
+        self.max_levels: Optional[int] = max_levels
+        self.price_band: Optional[float] = price_band
+
+        # Optional fixed-point mode. With the symbol's tick and lot size, prices are stored as
+        # integer ticks and quantities as integer lots, which hash and compare exactly.
+        # Callers convert back to floats with to_price/to_qty only when values are emitted.
+        if (tick_size is None) != (lot_size is None):
+            raise ValueError("tick_size and lot_size must be given together")
+        self.tick_size: Optional[float] = tick_size
+        self.lot_size: Optional[float] = lot_size
+        # Counters of levels evicted by the bounded mode on each side.
+        self.pruned_bids: int = 0
+        self.pruned_asks: int = 0
+
+    @property
+    def pruned_levels(self) -> int:
+        return self.pruned_bids + self.pruned_asks
+
+    def update(self, data: Dict) -> List[Tuple[str, float, float, float]]:
+        # Every level change applied is returned as (side, price, previous qty, new qty),
+        # so downstream features can work from the deltas instead of diffing whole books.
+        changes = []
+        # Messages from data_stream/decoder.py already hold numbers in the book's units.
+        decoded = data.get('decoded', False)
         # Process both bids ('b') and asks ('a') from the incoming message.
         for side, book in [('b', self.bids), ('a', self.asks)]:
+            levels = data.get(side, [])
+            if not decoded:
+                levels = self.parse_levels(levels)
             # Iterate through each price level update in the message.
-            for price_str, qty_str in data.get(side, []):
-                price, qty = float(price_str), float(qty_str)
+            for price, qty in levels:
                 # If quantity is zero, the level has been removed from the book.
                 if qty == 0:
                     # Use .pop with a default to avoid errors if the price level doesn't exist.
-                    book.pop(price, None)
+                    prev_qty = book.pop(price, 0)
                 # Otherwise, add the new level or update the existing one.
                 else:
+                    prev_qty = book.get(price, 0)
                     book[price] = qty
+                changes.append((side, price, prev_qty, qty))
+        if self.max_levels is not None or self.price_band is not None:
+            self.prune()
+        return changes
+
+    def parse_levels(self, levels) -> List[Tuple[float, float]]:
+        # Converts [[price_str, qty_str], ...] from the exchange into the book's units.
+        tick_size, lot_size = self.tick_size, self.lot_size
+        if tick_size is None:
+            return [(float(price_str), float(qty_str)) for price_str, qty_str in levels]
+        return [(round(float(price_str) / tick_size), round(float(qty_str) / lot_size))
+                for price_str, qty_str in levels]
+
+    def clear(self):
+        self.bids.clear()
+        self.asks.clear()
+
+    def load_snapshot(self, bids, asks):
+        # Replaces the whole book with a full depth snapshot (e.g. Binance's REST "bids" and
+        # "asks"). Loading is not order flow, so no level changes are returned.
+        self.clear()
+        for book, levels in [(self.bids, bids), (self.asks, asks)]:
+            for price, qty in self.parse_levels(levels):
+                if qty != 0:
+                    book[price] = qty
+        if self.max_levels is not None or self.price_band is not None:
+            self.prune()
+
+    def load_levels(self, bids, asks):
+        # Replaces the whole book with (price, qty) levels already in the book's units, e.g.
+        # bids.items() and asks.items() saved in a checkpoint.
+        self.clear()
+        for book, levels in [(self.bids, bids), (self.asks, asks)]:
+            for price, qty in levels:
+                book[price] = qty
+
+    def prune(self):
+        # Evict out-of-band levels. Evictions are book maintenance rather than order flow, so
+        # they are not reported as level changes. Each check is O(1) when nothing needs evicting.
+        if self.price_band is not None:
+            best_bid, best_ask = self.bids.best_price(), self.asks.best_price()
+            if best_bid is not None:
+                self.pruned_bids += self.bids.drop_beyond(best_bid * (1 - self.price_band))
+            if best_ask is not None:
+                self.pruned_asks += self.asks.drop_beyond(best_ask * (1 + self.price_band))
+        if self.max_levels is not None:
+            self.pruned_bids += self.bids.trim(self.max_levels)
+            self.pruned_asks += self.asks.trim(self.max_levels)
+
+    def to_price(self, ticks) -> float:
+        # Converts a price from the book's internal representation back to a float.
+        return ticks if self.tick_size is None else ticks * self.tick_size
+
+    def to_qty(self, lots) -> float:
+        # Converts a quantity from the book's internal representation back to a float.
+        return lots if self.lot_size is None else lots * self.lot_size
+
+    def best_bid(self) -> Optional[Tuple[float, float]]:
+        return self.bids.best()
 
-    def get_top_levels(self) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
-        # Sort bids by price in descending order (highest price first).
-        top_bids = sorted(self.bids.items(), key=lambda x: x[0], reverse=True)[:self.depth]
-        # Sort asks by price in ascending order (lowest price first).
-        top_asks = sorted(self.asks.items(), key=lambda x: x[0])[:self.depth]
-        return top_bids, top_asks
+    def best_ask(self) -> Optional[Tuple[float, float]]:
+        return self.asks.best()
 
+    def get_top_levels(self, depth: Optional[int] = None) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+        # Bids come back highest price first and asks lowest price first, straight from the index.
+        # By default the book's own depth is returned.
+        depth = self.depth if depth is None else depth
+        top_bids, top_asks = self.bids.top(depth), self.asks.top(depth)
+        if self.tick_size is None:
+            return top_bids, top_asks
+        # In fixed-point mode the levels are converted back to floats for display.
+        tick_size, lot_size = self.tick_size, self.lot_size
+        return ([(price * tick_size, qty * lot_size) for price, qty in top_bids],
+                [(price * tick_size, qty * lot_size) for price, qty in top_asks])
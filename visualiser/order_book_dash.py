@@ -1,20 +1,26 @@
 # The main application file.
 # It runs a multi-threaded Dash web server to display a live dashboard.
-# One thread handles the live WebSocket data and model predictions, while the main
-# thread runs the web server, updating the UI every second with the latest data.
+# One thread handles the live WebSocket data, a second runs the model predictions, while the main
+# thread runs the web server. Browsers poll it every second and are sent only what changed since
+# their last poll: the depth traces are patched in place and new price points are appended, so the
+# figures are built once and never resent.
+# The threads share no locks with the web server: the data threads publish an immutable snapshot
+# of everything on screen, and the callback only ever reads the latest one.
+# Stage latencies are shown in a panel and served to Prometheus at /metrics (utils/metrics.py).
 
 import asyncio
-import json
 import threading
+import time
 import websockets
+from websockets.exceptions import ConnectionClosed
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash import dcc, html, no_update
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
-from collections import deque
-import joblib
-import numpy as np
-import pandas as pd
+from collections import deque, namedtuple
+from datetime import datetime
+from itertools import accumulate
 import os
 import dash_bootstrap_components as dbc
 
@@ -22,46 +28,128 @@ import dash_bootstrap_components as dbc
 # Build robust file paths.
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(script_dir)
-model_path = os.path.join(project_root, 'model', 'xgboost_model.pkl')
-csv_path = os.path.join(project_root, 'data_stream', 'lob_features.csv')
 
-# Load the trained model and the feature order from the CSV.
+# Add the project root to the system path to allow importing our own modules.
+import sys
+
+sys.path.insert(0, project_root)
+from utils.order_book_cache import OrderBook
+from microstructure.data_labeller import FeatureExtractor
+from microstructure.feature_sinks import RingSink
+from model.inference import Predictor
+from model.inference_worker import InferenceWorker
+from data_stream.ingest import DepthIngest
+from data_stream.book_sync import BookSyncManager, snapshot_provider
+from data_stream.checkpoint import Checkpointer
+from data_stream.multi_symbol import BINANCE_URI, raw_stream_uri
+from data_stream.shared_book import attach_reader
+from model.artifact import load_artifact, FILE_SUFFIX
+from utils.metrics import PipelineMetrics, CONTENT_TYPE
+
+model_path = os.path.join(project_root, 'model', 'xgboost_model' + FILE_SUFFIX)
+
+SYMBOL = "btcusdt"
+# The exchange to stream from and take snapshots from, e.g. the stand-in server
+# (data_stream/stand_in_server.py) with LOB_STREAM_URI=ws://127.0.0.1:8765 and
+# LOB_SNAPSHOT_URL=http://127.0.0.1:8765/api/v3/depth.
+STREAM_URI = os.environ.get("LOB_STREAM_URI", BINANCE_URI)
+SNAPSHOT_URL = os.environ.get("LOB_SNAPSHOT_URL")
+# With LOB_SHARED_FEED set to the name of a running feed handler's shared memory
+# (data_stream/feed_handler.py), the dashboard reads the book and rows from there and opens no
+# connection of its own.
+SHARED_FEED = os.environ.get("LOB_SHARED_FEED")
+# With LOB_CHECKPOINT set to a file path (e.g. visualiser/dashboard.lobc), the book and features are
+# restored from it on startup and saved to it every few seconds (data_stream/checkpoint.py).
+CHECKPOINT_PATH = os.environ.get("LOB_CHECKPOINT")
+SHARED_POLL_INTERVAL = 0.05
+
+# Load the model artifact, which carries the feature order and settings it was trained with.
 try:
-    xgb_model = joblib.load(model_path)
-    df = pd.read_csv(csv_path)
-    FEATURE_ORDER = df.drop('label', axis=1).columns.tolist()
+    artifact = load_artifact(model_path)
+    FEATURE_ORDER = artifact.feature_order
     print("Model and feature order loaded successfully.")
 except FileNotFoundError as e:
     print(f"ERROR: Could not load necessary files. {e}")
     print("Please run `generate_dataset.py` and `train_model.py` first.")
     exit(1)
 
-# Add the project root to the system path to allow importing our own modules.
-import sys
-
-sys.path.insert(0, project_root)
-from utils.order_book_cache import OrderBook
-from microstructure.data_labeller import FeatureExtractor
+# Reuses one feature buffer and gets the class and its probability from a single booster call.
+predictor = Predictor(artifact.booster, FEATURE_ORDER)
 
 # Map numeric labels to display text and colours.
-LABEL_MAP = {
-    0: ("STABLE", "secondary"),
-    1: ("DOWN", "danger"),
-    2: ("UP", "success")
-}
+LABEL_COLOURS = {"STABLE": "secondary", "DOWN": "danger", "UP": "success"}
+LABEL_MAP = {label: (name, LABEL_COLOURS.get(name, "secondary")) for label, name in artifact.label_map.items()}
+
 
+# Called on the inference thread with each prediction.
+def store_prediction(symbol, row, pred, confidence, proba):
+    label_text, color = LABEL_MAP.get(pred, ("N/A", "secondary"))
+    app_state.publish(prediction={
+        "label_text": label_text,
+        "color": color,
+        "confidence": f"{confidence:.2%}"
+    })
 
-# This class holds the shared state between the WebSocket thread and the Dash app.
+
+# Stage latencies of the collector and inference threads, shown in the latency panel and served
+# in the Prometheus text format at /metrics.
+pipeline_metrics = PipelineMetrics()
+
+# The model runs on its own thread, so neither the WebSocket loop nor the
+# Dash callback ever waits on a prediction. Only the latest row is scored.
+inference_worker = InferenceWorker(predictor, on_result=store_prediction, metrics=pipeline_metrics)
+pipeline_metrics.add_source("inference", inference_worker.stats)
+
+
+# Everything the dashboard shows, ready to plot: the top levels with their cumulative depth, the
+# price history, the latest metrics and the prediction. It is never modified; each update
+# publishes a new one in a single reference assignment, so the callback always sees a
+# consistent state without locking, copying or sorting anything.
+DashboardSnapshot = namedtuple("DashboardSnapshot", [
+    "bid_prices", "bid_depth", "ask_prices", "ask_depth",
+    "timestamps", "mid_prices", "wmp_prices",
+    "metrics", "prediction",
+    # Counters that tell browsers what changed: the book, the rows seen so far, and the
+    # prediction or metrics.
+    "book_version", "row_count", "info_version",
+])
+EMPTY_SNAPSHOT = DashboardSnapshot((), (), (), (), (), (), (), {},
+                                   {"label_text": "N/A", "color": "secondary", "confidence": "0%"}, 0, 0, 0)
+
+
+# This class holds the state of the data threads and the snapshot the Dash app reads.
 class AppState:
     def __init__(self):
-        self.lock = threading.Lock()  # A lock to prevent race conditions.
-        self.order_book = OrderBook(depth=50)
-        self.feature_extractor = FeatureExtractor()
+        # The book, extractor and history below belong to the collector thread alone.
+        # Bounded so stale levels far from the touch do not pile up while the dashboard runs.
+        # The book shows 50 levels; features use the depth and window the model was trained with.
+        self.order_book = OrderBook(depth=max(50, artifact.depth), max_levels=1000)
+        # Only the most recent rows are retained, so memory stays flat while the dashboard runs.
+        self.feature_extractor = FeatureExtractor(depth=artifact.depth, window=artifact.window,
+                                                  sink=RingSink(maxlen=100))
         self.timestamps = deque(maxlen=100)
         self.mid_prices = deque(maxlen=100)
         self.wmp_prices = deque(maxlen=100)
-        self.latest_metrics = {}
-        self.latest_prediction = {"label_text": "N/A", "color": "secondary", "confidence": "0%"}
+        self.rows_seen = 0
+        # The metric cards' values from the latest row; the empty snapshot's until the first one.
+        self.latest_metrics = EMPTY_SNAPSHOT.metrics
+        # The latest snapshot. Its two writers, the collector and inference threads, take turns
+        # with publish_lock so neither overwrites the other's fields; the callback never takes it.
+        self.snapshot = EMPTY_SNAPSHOT
+        self.publish_lock = threading.Lock()
+        self.ingest = None
+        self.sync = None
+        # The shared-memory feed, when one is used instead of the WebSocket.
+        self.shared = None
+
+    def publish(self, **fields):
+        with self.publish_lock:
+            snapshot = self.snapshot
+            if "bid_prices" in fields:
+                fields["book_version"] = snapshot.book_version + 1
+            if "prediction" in fields or "metrics" in fields:
+                fields["info_version"] = snapshot.info_version + 1
+            self.snapshot = snapshot._replace(**fields)
 
 
 app_state = AppState()
@@ -71,74 +159,187 @@ app_state = AppState()
 # This function runs in a separate thread to avoid blocking the web server.
 def websocket_runner():
     async def data_collector():
-        uri = "wss://stream.binance.com:9443/ws/btcusdt@depth@100ms"
-        async with websockets.connect(uri) as ws:
+        # The book starts from a REST snapshot, or from a checkpoint, and is resynced after any
+        # sequence gap.
+        checkpointer = None
+        if CHECKPOINT_PATH:
+            checkpointer = Checkpointer(CHECKPOINT_PATH, SYMBOL, app_state.order_book, app_state.feature_extractor)
+            pipeline_metrics.add_source("checkpoint", checkpointer.stats)
+        on_resync = checkpointer.on_resync if checkpointer else lambda symbol: app_state.feature_extractor.reset()
+        app_state.sync = BookSyncManager(snapshot_provider(snapshot_url=SNAPSHOT_URL), on_resync=on_resync)
+        symbol_sync = app_state.sync.add(SYMBOL, app_state.order_book)
+        if checkpointer:
+            # A restored book is shown straight away, before the first diff arrives.
+            if checkpointer.restore(symbol_sync) is not None:
+                app_state.publish(**level_fields(*app_state.order_book.get_top_levels()))
+            # Held for as long as the collector runs, so the task is not garbage collected.
+            checkpoint_task = asyncio.create_task(checkpointer.run(symbol_sync))
+        # Iterating over connect() reconnects, with backoff, whenever the connection drops. The
+        # first diff on a new connection follows a gap, so the book is resynced from a snapshot.
+        async for ws in websockets.connect(raw_stream_uri(SYMBOL, STREAM_URI)):
             print("WebSocket connected. Streaming data...")
-            while True:
-                msg = await ws.recv()
-                data = json.loads(msg)
-                # Use a lock to safely update the shared state.
-                with app_state.lock:
-                    app_state.order_book.update(data)
-                    bids, asks = app_state.order_book.bids, app_state.order_book.asks
-                    row = app_state.feature_extractor.update(bids, asks)
-                    # If the extractor produced a valid row of features...
-                    if row:
-                        # Store the latest data for the dashboard to display.
-                        app_state.latest_metrics = {
-                            "Spread": f"{row.get('spread', 0):.4f}",
-                            "OFI": f"{row.get('ofi', 0):.2f}",
-                            "VOI": f"{row.get('voi', 0):.2f}"
-                        }
-                        app_state.timestamps.append(pd.Timestamp.now())
-                        app_state.mid_prices.append(row.get('mid_price'))
-                        app_state.wmp_prices.append(row.get('weighted_mid_price'))
-                        # Make a prediction with the trained model.
-                        try:
-                            features = np.array([[row[feature] for feature in FEATURE_ORDER]])
-                            pred = xgb_model.predict(features)[0]
-                            proba = xgb_model.predict_proba(features)[0]
-
-                            label_text, color = LABEL_MAP.get(pred, ("N/A", "secondary"))
-                            app_state.latest_prediction = {
-                                "label_text": label_text,
-                                "color": color,
-                                "confidence": f"{proba[pred]:.2%}"
-                            }
-                        except Exception as e:
-                            print(f"Prediction error: {e}")
+            try:
+                await process_stream(ws)
+            except ConnectionClosed as e:
+                print(f"Connection closed ({e}); reconnecting...")
+
+    async def process_stream(ws):
+        # A separate task keeps draining the socket; diffs that queue up while the book is
+        # updated are merged into one update. Its counters are kept for monitoring.
+        app_state.ingest = DepthIngest(ws, metrics=pipeline_metrics)
+        pipeline_metrics.add_source("ingest", app_state.ingest.stats)
+        try:
+            async for data in app_state.ingest:
+                start = time.perf_counter_ns()
+                changes = app_state.sync.handle(data)
+                # Nothing to show while the book waits for a snapshot.
+                if changes is None:
+                    continue
+                book_done = time.perf_counter_ns()
+                bids, asks = app_state.order_book.bids, app_state.order_book.asks
+                row = app_state.feature_extractor.update(bids, asks, changes)
+                pipeline_metrics.book_update.record(book_done - start)
+                pipeline_metrics.features.record(time.perf_counter_ns() - book_done)
+                # If the extractor produced a valid row of features, it joins the price history.
+                if row:
+                    store_row(row)
+                    # Hand the row to the inference thread; this never waits on the model.
+                    inference_worker.submit(SYMBOL, row)
+                # Publish the new state for the dashboard.
+                app_state.publish(**level_fields(*app_state.order_book.get_top_levels()),
+                                  **(history_fields() if row else {}))
+        finally:
+            await app_state.ingest.close()
 
     asyncio.run(data_collector())
 
 
+# Adds a feature row to the price history. Only called on the collector thread.
+def store_row(row):
+    app_state.latest_metrics = {
+        "Spread": f"{row.get('spread', 0):.4f}",
+        "OFI": f"{row.get('ofi', 0):.2f}",
+        "VOI": f"{row.get('voi', 0):.2f}"
+    }
+    app_state.timestamps.append(datetime.now())
+    app_state.mid_prices.append(row.get('mid_price'))
+    app_state.wmp_prices.append(row.get('weighted_mid_price'))
+    app_state.rows_seen += 1
+
+
+# Snapshot fields for the top levels, which arrive sorted from the touch outwards.
+def level_fields(bids, asks):
+    return {
+        "bid_prices": tuple(price for price, _ in bids),
+        "bid_depth": tuple(accumulate(qty for _, qty in bids)),
+        "ask_prices": tuple(price for price, _ in asks),
+        "ask_depth": tuple(accumulate(qty for _, qty in asks)),
+    }
+
+
+# Snapshot fields for the price history and metrics, copied so later rows cannot change them.
+def history_fields():
+    return {
+        "timestamps": tuple(app_state.timestamps),
+        "mid_prices": tuple(app_state.mid_prices),
+        "wmp_prices": tuple(app_state.wmp_prices),
+        "metrics": app_state.latest_metrics,
+        "row_count": app_state.rows_seen,
+    }
+
+
+# Used instead of websocket_runner when a feed handler publishes to shared memory: new rows are
+# picked up from the feed's ring and the book is read from its slot, then published as usual.
+def shared_feed_runner():
+    app_state.shared = attach_reader(SHARED_FEED)
+    print(f"Reading {SYMBOL} from shared memory {SHARED_FEED!r}...")
+    cursor = app_state.shared.rows_written_for(SYMBOL)
+    depth = app_state.order_book.depth
+    last_update_id = None
+    while True:
+        rows, cursor, _ = app_state.shared.rows_since(SYMBOL, cursor)
+        for row in rows:
+            store_row(row)
+        if rows:
+            inference_worker.submit(SYMBOL, rows[-1])
+        book = app_state.shared.book(SYMBOL)
+        # The feed's lag from the exchange event to publishing the book; this process does no
+        # receiving, decoding or book maintenance of its own to time.
+        if book is not None and book["update_id"] != last_update_id:
+            last_update_id = book["update_id"]
+            pipeline_metrics.record_event_lag(book["event_time"], book["published_ns"])
+        if book is not None:
+            app_state.publish(**level_fields(book["bids"][:depth], book["asks"][:depth]),
+                              **(history_fields() if rows else {}))
+        time.sleep(SHARED_POLL_INTERVAL)
+
+
 # Start the background thread.
-ws_thread = threading.Thread(target=websocket_runner, daemon=True)
+ws_thread = threading.Thread(target=shared_feed_runner if SHARED_FEED else websocket_runner, daemon=True)
 ws_thread.start()
 
 # --- 3. Dash Application Layout ---
 # Use a Bootstrap theme for a professional look.
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.DARKLY])
 
+# How often browsers poll for changes. Polls that find nothing new are answered with no data, so a
+# faster refresh costs little more bandwidth or server CPU than a slow one.
+REFRESH_MS = int(os.environ.get("DASHBOARD_REFRESH_MS", "1000"))
+# Points kept on the price chart, matching the history the collector keeps.
+PRICE_POINTS = 100
+# The port the web server listens on.
+DASHBOARD_PORT = int(os.environ.get("DASHBOARD_PORT", "8050"))
+# How often the latency panel is refreshed.
+LATENCY_REFRESH_MS = 2000
+
+
+# Prometheus scrapes the dashboard's own web server.
+@app.server.route("/metrics")
+def metrics_endpoint():
+    return pipeline_metrics.prometheus_text(), 200, {"Content-Type": CONTENT_TYPE}
+
+
+# Helper function to create the starting figures: styled, with empty traces and a waiting message.
+# After this only the trace data changes, so updates never resend the layout.
+def create_base_figure(title, traces, message, uirevision):
+    fig = go.Figure(data=traces)
+    fig.add_annotation(text=message, showarrow=False, font_size=16, xref="paper", yref="paper", x=0.5, y=0.5)
+    fig.update_layout(title_text=title, template='plotly_dark', uirevision=uirevision,
+                      margin=dict(l=40, r=20, t=40, b=30))
+    return fig
+
+
+order_book_figure = create_base_figure("Live Order Book Depth", [
+    go.Scatter(x=[], y=[], name='Bids', fill='tozeroy', mode='lines', line={'color': 'green'}),
+    go.Scatter(x=[], y=[], name='Asks', fill='tozeroy', mode='lines', line={'color': 'red'}),
+], "Waiting for order book data...", 'constant_ob')
+price_chart_figure = create_base_figure("Live Price Feed", [
+    go.Scatter(x=[], y=[], mode='lines', name='Mid-Price', line={'color': '#00BFFF'}),
+    go.Scatter(x=[], y=[], mode='lines', name='WMP', line={'color': '#FFD700'}),
+], "Waiting for price data...", 'constant_price')
+
 # Define the layout using Bootstrap components for structure.
 app.layout = dbc.Container(fluid=True, className="dbc", children=[
     dbc.Row(dbc.Col(html.H1("Real-Time Mid-Price Prediction Dashboard", className="text-center text-primary p-4"))),
     dbc.Row([
         # Left column for charts.
         dbc.Col(md=8, children=[
-            dbc.Card(className="mb-4",
-                     children=[dbc.CardBody(dcc.Graph(id='order-book-graph', style={'height': '40vh'}))]),
-            dbc.Card(children=[dbc.CardBody(dcc.Graph(id='price-chart-graph', style={'height': '40vh'}))]),
+            dbc.Card(className="mb-4", children=[dbc.CardBody(
+                dcc.Graph(id='order-book-graph', figure=order_book_figure, style={'height': '40vh'}))]),
+            dbc.Card(children=[dbc.CardBody(
+                dcc.Graph(id='price-chart-graph', figure=price_chart_figure, style={'height': '40vh'}))]),
         ]),
         # Right column for prediction and metrics.
         dbc.Col(md=4, children=[
             dbc.Card(className="mb-4", children=[dbc.CardHeader("Live Prediction"),
                                                  dbc.CardBody(id='prediction-display', className="text-center")]),
-            dbc.Card(children=[
+            dbc.Card(className="mb-4", children=[
                 dbc.CardHeader("Live Metrics"),
                 dbc.CardBody(dbc.Row([
                     dbc.Col(id='spread-display'), dbc.Col(id='ofi-display'), dbc.Col(id='voi-display'),
                 ]))
             ]),
+            dbc.Card(children=[dbc.CardHeader("Pipeline Latency"), dbc.CardBody(id='latency-display')]),
         ]),
     ]),
     # Tooltips for the metrics cards.
@@ -146,87 +347,134 @@ app.layout = dbc.Container(fluid=True, className="dbc", children=[
     dbc.Tooltip("Order Flow Imbalance (OFI): Aggressive buying/selling at the best bid/ask.", target="ofi-card"),
     dbc.Tooltip("Volume Order Imbalance (VOI): Total change in buy vs. sell volume across the book.",
                 target="voi-card"),
-    # This interval component triggers the update callback every second.
-    dcc.Interval(id='interval-component', interval=1000)
+    # What this browser tab has already been sent, as snapshot counters.
+    dcc.Store(id='client-state', data={"book": 0, "rows": 0, "info": 0}),
+    # This interval component triggers the update callback.
+    dcc.Interval(id='interval-component', interval=REFRESH_MS),
+    dcc.Interval(id='latency-interval', interval=LATENCY_REFRESH_MS)
 ])
 
 
-# Helper function to create empty figures with a message.
-def create_empty_figure(message):
-    fig = go.Figure()
-    fig.add_annotation(text=message, showarrow=False, font_size=16)
-    fig.update_layout(template='plotly_dark', margin=dict(l=20, r=20, t=40, b=20))
-    fig.update_xaxes(showgrid=False, zeroline=False, visible=False)
-    fig.update_yaxes(showgrid=False, zeroline=False, visible=False)
-    return fig
+# Helper function for the metric card components.
+def create_metric_card(title, value, card_id):
+    return dbc.Card(id=card_id,
+                    children=[dbc.CardHeader(title), dbc.CardBody(html.H4(value, className="text-center"))],
+                    className="text-center")
+
+
+# Removes the waiting message the first time a tab gets data for a chart.
+def clear_message():
+    patch = dash.Patch()
+    patch['layout']['annotations'] = []
+    return patch
+
+
+# The parts of an update that are the same for every browser tab, rendered once per snapshot.
+# The cache holds the last (snapshot, parts) pair and is replaced in one assignment, so callbacks
+# running on several server threads can share it without a lock.
+_render_cache = (None, None)
+
+
+def render_snapshot(snapshot):
+    global _render_cache
+    cached_snapshot, parts = _render_cache
+    if cached_snapshot is snapshot:
+        return parts
+
+    # The depth chart is updated in place: only the four trace arrays are sent, not the figure.
+    book_patch, first_book_patch = dash.Patch(), clear_message()
+    for patch in (book_patch, first_book_patch):
+        patch['data'][0]['x'] = snapshot.bid_prices
+        patch['data'][0]['y'] = snapshot.bid_depth
+        patch['data'][1]['x'] = snapshot.ask_prices
+        patch['data'][1]['y'] = snapshot.ask_depth
+
+    prediction, metrics = snapshot.prediction, snapshot.metrics
+    prediction_div = dbc.Alert(
+        [html.H3(prediction['label_text'], className="alert-heading"),
+         html.P(f"Confidence: {prediction['confidence']}", className="mb-0")],
+        color=prediction['color'], duration=4000, is_open=True,
+    )
+    parts = {
+        "book_patch": book_patch,
+        "first_book_patch": first_book_patch,
+        "prediction": prediction_div,
+        "spread": create_metric_card("Spread", metrics.get("Spread", "N/A"), "spread-card"),
+        "ofi": create_metric_card("OFI", metrics.get("OFI", "N/A"), "ofi-card"),
+        "voi": create_metric_card("VOI", metrics.get("VOI", "N/A"), "voi-card"),
+    }
+    _render_cache = (snapshot, parts)
+    return parts
 
 
 # --- 4. Dash Callback for Live Updates ---
-# This function is the engine of the dashboard. It's called every second.
+# This function is the engine of the dashboard. Each browser tab calls it on every interval with
+# the counters of what it already has, and gets back only what changed since: new price points
+# appended with extendData, the depth traces patched in place, and the prediction and metrics
+# only when they changed. Everything else is left as it is with no_update.
 @app.callback(
     Output('order-book-graph', 'figure'),
     Output('price-chart-graph', 'figure'),
+    Output('price-chart-graph', 'extendData'),
     Output('prediction-display', 'children'),
     Output('spread-display', 'children'),
     Output('ofi-display', 'children'),
     Output('voi-display', 'children'),
-    Input('interval-component', 'n_intervals')
+    Output('client-state', 'data'),
+    Input('interval-component', 'n_intervals'),
+    State('client-state', 'data')
 )
-def update_dashboard(n):
-    # Safely get the latest data from the shared state.
-    with app_state.lock:
-        bids, asks = app_state.order_book.get_top_levels()
-        timestamps, mid_prices, wmp_prices = list(app_state.timestamps), list(app_state.mid_prices), list(
-            app_state.wmp_prices)
-        prediction, metrics = app_state.latest_prediction, app_state.latest_metrics
-
-    # Create the order book depth chart.
-    order_book_fig = create_empty_figure("Waiting for order book data...")
-    if bids and asks:
-        bid_prices, bid_qtys = [b[0] for b in bids], [b[1] for b in bids]
-        ask_prices, ask_qtys = [a[0] for a in asks], [a[1] for a in asks]
-        order_book_fig = go.Figure(data=[
-            go.Scatter(x=bid_prices, y=np.cumsum(bid_qtys), name='Bids', fill='tozeroy', mode='lines',
-                       line={'color': 'green'}),
-            go.Scatter(x=ask_prices, y=np.cumsum(ask_qtys), name='Asks', fill='tozeroy', mode='lines',
-                       line={'color': 'red'})
-        ])
-    order_book_fig.update_layout(title_text="Live Order Book Depth", template='plotly_dark', uirevision='constant_ob',
-                                 margin=dict(l=40, r=20, t=40, b=30))
-
-    # Create the live price feed chart.
-    price_chart_fig = create_empty_figure("Waiting for price data...")
-    if timestamps and mid_prices:
-        price_chart_fig = go.Figure(data=[
-            go.Scatter(x=timestamps, y=mid_prices, mode='lines', name='Mid-Price', line={'color': '#00BFFF'}),
-            go.Scatter(x=timestamps, y=wmp_prices, mode='lines', name='WMP', line={'color': '#FFD700'})
-        ])
-    price_chart_fig.update_layout(title_text="Live Price Feed", template='plotly_dark', uirevision='constant_price',
-                                  margin=dict(l=40, r=20, t=40, b=30))
-
-    # Create the prediction display component.
-    prediction_div = dbc.Alert(
-        [html.H3(prediction['label_text'], className="alert-heading"),
-         html.P(f"Confidence: {prediction['confidence']}", className="mb-0")],
-        color=prediction['color'], duration=4000, is_open=True,
-    )
+def update_dashboard(n, client):
+    # Take the latest snapshot once; everything below reads from it, with no lock held.
+    snapshot = app_state.snapshot
+    client = client or {"book": 0, "rows": 0, "info": 0}
+    if (snapshot.book_version == client["book"] and snapshot.row_count == client["rows"]
+            and snapshot.info_version == client["info"]):
+        raise PreventUpdate
+    parts = render_snapshot(snapshot)
+
+    order_book_update = no_update
+    if snapshot.book_version != client["book"] and snapshot.bid_prices and snapshot.ask_prices:
+        # A tab's first book also removes the waiting message.
+        order_book_update = parts["first_book_patch" if client["book"] == 0 else "book_patch"]
+
+    # Only the rows this tab has not seen are sent; the chart keeps the last PRICE_POINTS.
+    price_chart_update, price_points = no_update, no_update
+    new_rows = min(snapshot.row_count - client["rows"], len(snapshot.timestamps))
+    if new_rows > 0:
+        timestamps = snapshot.timestamps[-new_rows:]
+        price_points = (
+            {"x": [timestamps, timestamps],
+             "y": [snapshot.mid_prices[-new_rows:], snapshot.wmp_prices[-new_rows:]]},
+            [0, 1],
+            PRICE_POINTS,
+        )
+        if client["rows"] == 0:
+            price_chart_update = clear_message()
+
+    info_updates = [no_update] * 4
+    if snapshot.info_version != client["info"]:
+        info_updates = [parts["prediction"], parts["spread"], parts["ofi"], parts["voi"]]
 
-    # Create the metric card components.
-    def create_metric_card(title, value, card_id):
-        return dbc.Card(id=card_id,
-                        children=[dbc.CardHeader(title), dbc.CardBody(html.H4(value, className="text-center"))],
-                        className="text-center")
+    client = {"book": snapshot.book_version, "rows": snapshot.row_count, "info": snapshot.info_version}
+    return (order_book_update, price_chart_update, price_points, *info_updates, client)
 
-    spread_card = create_metric_card("Spread", metrics.get("Spread", "N/A"), "spread-card")
-    ofi_card = create_metric_card("OFI", metrics.get("OFI", "N/A"), "ofi-card")
-    voi_card = create_metric_card("VOI", metrics.get("VOI", "N/A"), "voi-card")
 
-    # Return all the updated components to the layout.
-    return order_book_fig, price_chart_fig, prediction_div, spread_card, ofi_card, voi_card
+# The latency panel: p50, p99 and max per stage since start, in microseconds.
+@app.callback(Output('latency-display', 'children'), Input('latency-interval', 'n_intervals'))
+def update_latency_panel(n):
+    summary = pipeline_metrics.summary()
+    if not summary:
+        return html.P("Waiting for data...", className="text-muted mb-0")
+    header = html.Thead(html.Tr([html.Th(title) for title in ("Stage", "p50 us", "p99 us", "Max us")]))
+    rows = [html.Tr([html.Td(stage.replace("_", " "))] +
+                    [html.Td(f"{stats[key]:,.1f}") for key in ("p50_us", "p99_us", "max_us")])
+            for stage, stats in summary.items()]
+    return dbc.Table([header, html.Tbody(rows)], size="sm", className="mb-0")
 
 
 # --- 5. Start the Server ---
 if __name__ == "__main__":
     print("Starting Dash server...")
-    print("View your dashboard at http://127.0.0.1:8050/")
-    app.run(debug=False)
+    print(f"View your dashboard at http://127.0.0.1:{DASHBOARD_PORT}/")
+    app.run(debug=False, port=DASHBOARD_PORT)